@@ -140,6 +140,7 @@ class AtomicCmd:
         temporary directory before the command is executed. Input paths are
         automatically turned into absolute paths in this case."""
         self._proc = None
+        self._rusage = None
         self._temp = None
         self._running = False
         self._command = list(map(str, safe_coerce_to_tuple(command)))
@@ -166,6 +167,7 @@ class AtomicCmd:
             raise CmdError("Calling 'run' on already running command.")
         self._temp = temp
         self._running = True
+        self._rusage = None
 
         # kwords for pipes are always built relative to the current directory,
         # since these are opened before (possibly) CD'ing to the temp
@@ -221,11 +223,21 @@ class AtomicCmd:
             return [None]
 
         self._running = False
-        return_code = self._proc.wait()
+        return_code = self._wait()
         if return_code < 0:
             return_code = signal.Signals(-return_code).name
         return [return_code]
 
+    @property
+    def max_rss(self):
+        """Returns the peak resident set size (in bytes) of the command and its
+        (reaped) child processes, or None if the command has not been joined or
+        if the value could not be determined."""
+        if self._rusage is None:
+            return None
+
+        return procs.max_rss_from_rusage(self._rusage)
+
     def wait(self):
         """Equivalent to Subproces.wait. This function should only
         be used in contexts where a AtomicCmd needs to be combined
@@ -242,6 +254,24 @@ class AtomicCmd:
             except OSError:
                 pass  # Already dead / finished process
 
+    def _wait(self):
+        """Waits for the process to terminate using wait4, in order to record the
+        resources used by the process; falls back to Popen.wait if the process has
+        already been reaped (e.g. by a call to 'ready')."""
+        proc = self._proc
+        if proc.returncode is None:
+            try:
+                _, status, self._rusage = os.wait4(proc.pid, 0)
+            except ChildProcessError:
+                pass
+            else:
+                if os.WIFSIGNALED(status):
+                    proc.returncode = -os.WTERMSIG(status)
+                else:
+                    proc.returncode = os.WEXITSTATUS(status)
+
+        return proc.wait()
+
     # Properties, returning filenames from self._file_sets
     def _property_file_sets(key):
         def _get_property_files(self):
@@ -257,6 +287,13 @@ class AtomicCmd:
     expected_temp_files = _property_file_sets("output_fname")
     optional_temp_files = _property_file_sets("temporary_fname")
 
+    def to_call(self, temp):
+        """Returns the call generated by this command, with paths to output and
+        temporary files placed in the folder 'temp'. The resulting list may
+        be used to compare commands, e.g. when 'temp' is a fixed placeholder,
+        and is identical to the call executed by 'run'."""
+        return self._generate_call(temp)
+
     def commit(self, temp):
         if not self.ready():
             raise CmdError("Attempting to commit before command has completed")
@@ -20,7 +20,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
-import time
 import collections
 
 import paleomix.atomiccmd.pprint as atomicpp
@@ -28,6 +27,7 @@ import paleomix.atomiccmd.pprint as atomicpp
 from paleomix.atomiccmd.command import AtomicCmd, CmdError
 from paleomix.common.utilities import safe_coerce_to_tuple
 from paleomix.common.fileutils import try_remove
+from paleomix.common.procs import iter_completed
 
 
 class _CommandSet:
@@ -50,6 +50,11 @@ class _CommandSet:
                 try_remove(fpath)
             raise
 
+    def to_call(self, temp):
+        """Returns a list containing the calls of each sub-command; see
+        AtomicCmd.to_call."""
+        return [command.to_call(temp) for command in self._commands]
+
     def _collect_properties(key):
         def _collector(self):
             values = set()
@@ -134,24 +139,25 @@ class ParallelCmds(_CommandSet):
     def ready(self):
         return all(cmd.ready() for cmd in self._commands)
 
+    @property
+    def max_rss(self):
+        """Returns the sum of the peak RSS of the sub-commands, since these are run
+        concurrently; sub-commands for which the peak RSS is unknown are ignored.
+        None is returned if the peak RSS is unknown for all sub-commands."""
+        values = [cmd.max_rss for cmd in self._commands if cmd.max_rss is not None]
+
+        return sum(values) if values else None
+
     def join(self):
-        sleep_time = 0.05
-        commands = list(enumerate(self._commands))
-        return_codes = [[None]] * len(commands)
-        while commands and self._joinable:
-            for (index, command) in list(commands):
-                if command.ready():
-                    return_codes[index] = command.join()
-                    commands.remove((index, command))
-                    sleep_time = 0.05
-                elif any(any(codes) for codes in return_codes):
-                    command.terminate()
-                    return_codes[index] = command.join()
-                    commands.remove((index, command))
-                    sleep_time = 0.05
-
-            time.sleep(sleep_time)
-            sleep_time = min(1, sleep_time * 2)
+        return_codes = [[None]] * len(self._commands)
+        if self._joinable:
+            commands = iter_completed(self._commands, lambda cmd: cmd.join())
+            for (index, codes) in commands:
+                return_codes[index] = codes
+                if any(codes):
+                    # Has no effect on commands that have already finished
+                    self.terminate()
+
         return sum(return_codes, [])
 
 
@@ -191,6 +197,15 @@ class SequentialCmds(_CommandSet):
     def ready(self):
         return self._ready
 
+    @property
+    def max_rss(self):
+        """Returns the highest peak RSS of the sub-commands, since these are run one
+        after the other, or None if the peak RSS is unknown for all sub-commands."""
+        return max(
+            (cmd.max_rss for cmd in self._commands if cmd.max_rss is not None),
+            default=None,
+        )
+
     def join(self):
         return_codes = []
         for command in self._commands:
@@ -20,6 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import bisect
+import collections
 import copy
 
 from paleomix.common.fileutils import open_ro
@@ -275,3 +277,157 @@ def merge_bed_records(records):
             last_record.end = record.end
 
     return results
+
+
+class BEDIndex:
+    """Index of BED records, supporting queries for the records overlapping
+    positions or regions. Records are stored per contig as a nested containment
+    list (Alekseyenko and Lee, 2007): Each list is sorted by start and end
+    coordinates, with records fully contained in another record stored in a
+    sub-list of that record; records spanning identical intervals are stored
+    in the same list. As no record in a given list strictly contains another,
+    both start and end coordinates never decrease, allowing the first
+    overlapping record in each list to be found using binary search. Queries
+    are thereby answered in O(log n + k) time for k overlapping records, in
+    the absence of deeply nested records.
+
+    Any objects with contig, start, and end properties may be indexed, not just
+    BEDRecords. Records are returned in the order in which they are found;
+    parent records are returned before the records they contain, but records
+    are otherwise not guaranteed to be sorted.
+    """
+
+    def __init__(self, records=()):
+        records_by_contig = collections.defaultdict(list)
+        for record in records:
+            records_by_contig[record.contig].append(record)
+
+        self._contigs = {}
+        for (contig, records) in records_by_contig.items():
+            self._contigs[contig] = _build_nclist(records)
+
+    def overlapping(self, contig, start, end):
+        """Returns a list of records overlapping the half-open interval
+        [start, end) on the given contig."""
+        nclist = self._contigs.get(contig)
+        if nclist is None:
+            return []
+
+        results = []
+        index = bisect.bisect_right(nclist[0], start)
+        _query_nclist(nclist, index, start, end, results)
+
+        return results
+
+    def covering(self, contig, position):
+        """Returns a list of records covering the (0-based) position."""
+        return self.overlapping(contig, position, position + 1)
+
+    def intersect_sorted(self, regions):
+        """Takes an iterable of regions (objects with a contig, a start, and an
+        end property, e.g. BEDRecords), sorted by start coordinate for each
+        contig, and yields tuples of (region, overlapping records). Rather than
+        searching for the first overlapping record for every region, a cursor
+        is advanced through the top-level records of each contig, making this
+        more efficient than 'overlapping' for large numbers of regions. A
+        ValueError is raised if regions are not sorted.
+        """
+        last_contig = last_start = nclist = None
+        for region in regions:
+            contig = region.contig
+            start = region.start
+
+            if contig != last_contig:
+                nclist = self._contigs.get(contig)
+                last_contig = contig
+                index = 0
+            elif start < last_start:
+                raise ValueError("Regions are not sorted: %r" % (region,))
+            last_start = start
+
+            results = []
+            if nclist is not None:
+                ends = nclist[0]
+                while index < len(ends) and ends[index] <= start:
+                    index += 1
+
+                _query_nclist(nclist, index, start, region.end, results)
+
+            yield region, results
+
+    def __contains__(self, contig):
+        return contig in self._contigs
+
+    def __len__(self):
+        return sum(_count_nclist(nclist) for nclist in self._contigs.values())
+
+
+def _build_nclist(records):
+    """Builds a nested containment list, represented as a tuple of a list of
+    end coordinates, a list of records, and a list of sub-lists (or None for
+    records that do not contain other records). Records spanning the same
+    interval are stored as siblings, and the list is built without recursion,
+    as records may be nested arbitrarily deep."""
+    root = ([], [], [])
+    # Stack of (record, list containing record, index of record in that list)
+    stack = []
+    for record in sorted(records, key=lambda record: (record.start, -record.end)):
+        # Records are sorted by start, so a parent need only end after the record
+        while stack:
+            parent = stack[-1][0]
+            if parent.end > record.end or (
+                parent.end == record.end and parent.start < record.start
+            ):
+                break
+
+            stack.pop()
+
+        if stack:
+            _, parent_list, parent_index = stack[-1]
+            nclist = parent_list[2][parent_index]
+            if nclist is None:
+                nclist = parent_list[2][parent_index] = ([], [], [])
+        else:
+            nclist = root
+
+        ends, children, sublists = nclist
+        stack.append((record, nclist, len(children)))
+        ends.append(record.end)
+        children.append(record)
+        sublists.append(None)
+
+    return root
+
+
+def _query_nclist(nclist, index, start, end, results):
+    """Appends records overlapping [start, end) to 'results', starting with the
+    record at 'index', which must be the first record in the list with an end
+    coordinate greater than 'start'."""
+    # Stack of lists (and positions in those lists) to resume after sub-lists
+    stack = [(nclist, index)]
+    while stack:
+        nclist, index = stack.pop()
+        while index < len(nclist[1]):
+            record = nclist[1][index]
+            if record.start >= end:
+                break
+
+            results.append(record)
+
+            sublist = nclist[2][index]
+            index += 1
+            if sublist is not None:
+                stack.append((nclist, index))
+                nclist = sublist
+                index = bisect.bisect_right(sublist[0], start)
+
+
+def _count_nclist(nclist):
+    count = 0
+    stack = [nclist]
+    while stack:
+        _, records, sublists = stack.pop()
+        count += len(records)
+        stack.extend(sublist for sublist in sublists if sublist is not None)
+
+    return count
@@ -20,19 +20,32 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import io
 import os
 import bz2
+import collections
 import gzip
+import hashlib
 import uuid
+import zlib
 import errno
+import queue
 import shutil
+import struct
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from pathlib import Path
-from typing import Any, Callable, IO, Iterable, List, Optional, Tuple, Union
+from typing import Any, BinaryIO, Callable, IO, Iterable, List, Optional, Tuple, Union
 
 from .utilities import safe_coerce_to_tuple
 
 
+# Size of blocks read when calculating checksums
+_CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+
 def add_postfix(filename: Union[str, Path], postfix: str) -> str:
     """Ads a postfix to a filename (before any extensions that filename may have)."""
     filename, ext = os.path.splitext(filename)
@@ -130,7 +143,10 @@ def copy_file(source: Union[str, Path], destination: Union[str, Path]) -> None:
 
 def open_ro(filename: Union[str, Path], mode: str = "rt") -> IO[str]:
     """Opens a file for reading, transparently handling
-    GZip and BZip2 compressed files. Returns a file handle."""
+    GZip and BZip2 compressed files. Returns a file handle.
+
+    BGZF compressed files are decompressed using multiple threads, while other
+    GZip compressed files are decompressed in a background thread."""
     if mode not in ("rt", "rb", "r"):
         raise ValueError(mode)
     elif mode == "r":
@@ -141,7 +157,7 @@ def open_ro(filename: Union[str, Path], mode: str = "rt") -> IO[str]:
         header = handle.read(2)
 
     if header == b"\x1f\x8b":
-        return gzip.open(filename, mode)
+        return _open_gzip(filename, mode)
     elif header == b"BZ":
         return bz2.open(filename, mode)
     else:
@@ -164,6 +180,16 @@ def try_rmtree(filename: Union[str, Path]) -> bool:
     return _try_rm_wrapper(shutil.rmtree, filename)
 
 
+def calculate_checksum(filename: Union[str, Path]) -> str:
+    """Returns the SHA256 hex-digest of the contents of a file."""
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as handle:
+        for block in iter(lambda: handle.read(_CHECKSUM_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+
 def describe_files(files: Iterable[str]) -> str:
     """Return a text description of a set of files."""
     files = _validate_filenames(files)
@@ -297,3 +323,256 @@ def _try_rm_wrapper(func: Callable[[Any], Any], fpath: Union[str, Path]) -> bool
         if error.errno != errno.ENOENT:
             raise
         return False
+
+
+###############################################################################
+###############################################################################
+# Multi-threaded decompression of GZip files
+
+# Number of threads used to decompress BGZF blocks
+_BGZF_THREADS = min(4, os.cpu_count() or 1)
+# Number of BGZF blocks (at most 64 kb each) decompressed per task
+_BGZF_BLOCKS_PER_TASK = 16
+# Number of tasks/chunks to read ahead of the current position
+_READ_AHEAD = 8
+# Size of chunks decompressed by the background thread for non-BGZF files
+_GZIP_CHUNK_SIZE = 1024 * 1024
+
+# Magic bytes, method (DEFLATE), and flags (FEXTRA) of BGZF blocks
+_BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+_BGZF_HEADER = struct.Struct("<4sIBBH")
+# The BC subfield: Subfield ID, subfield length, and total block size minus 1
+_BGZF_SUBFIELD = struct.Struct("<2sHH")
+_BGZF_TRAILER = struct.Struct("<II")
+
+
+def _open_gzip(filename: Union[str, Path], mode: str) -> IO[Any]:
+    handle = open(filename, "rb")
+    try:
+        if _is_bgzf_block(handle.peek(_BGZF_HEADER.size + _BGZF_SUBFIELD.size)):
+            raw = _BGZFReader(handle)
+        else:
+            raw = _PipelinedGzipReader(handle)
+    except BaseException:
+        handle.close()
+        raise
+
+    buffered = io.BufferedReader(raw, _GZIP_CHUNK_SIZE)
+    if mode == "rb":
+        return buffered
+
+    return io.TextIOWrapper(buffered)
+
+
+def _is_bgzf_block(header: bytes) -> bool:
+    if len(header) < _BGZF_HEADER.size + _BGZF_SUBFIELD.size:
+        return False
+
+    magic, _, _, _, xlen = _BGZF_HEADER.unpack_from(header)
+    tag, slen, _ = _BGZF_SUBFIELD.unpack_from(header, _BGZF_HEADER.size)
+
+    # The BC subfield is expected to be the first (and only) subfield
+    return magic == _BGZF_MAGIC and xlen >= 6 and tag == b"BC" and slen == 2
+
+
+class _ChunkedReader(io.RawIOBase):
+    """Raw reader returning data from a sequence of decompressed chunks."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._chunk:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return 0
+
+            self._chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+
+        return size
+
+    def readall(self) -> bytes:
+        chunks = [bytes(self._chunk)]
+        self._chunk = memoryview(b"")
+
+        chunk = self._next_chunk()
+        while chunk is not None:
+            chunks.append(chunk)
+            chunk = self._next_chunk()
+
+        return b"".join(chunks)
+
+    def _next_chunk(self) -> Optional[bytes]:
+        """Returns the next chunk of decompressed data, or None at EOF."""
+        raise NotImplementedError
+
+
+class _BGZFReader(_ChunkedReader):
+    """Reader for BGZF files; blocks are read in the calling thread, but are
+    decompressed in a pool of threads (zlib releases the GIL), in batches of
+    _BGZF_BLOCKS_PER_TASK blocks. If a block that is not a BGZF block is found
+    (e.g. for BGZF and regular GZip files concatenated into one file), the rest
+    of the file is decompressed using a _PipelinedGzipReader."""
+
+    def __init__(self, handle: BinaryIO) -> None:
+        super().__init__()
+        self._handle = handle
+        self._executor = ThreadPoolExecutor(_BGZF_THREADS)
+        self._tasks = collections.deque()
+        self._fallback = None
+        self._eof = False
+
+    def _next_chunk(self) -> Optional[bytes]:
+        while not self._eof and len(self._tasks) < _READ_AHEAD:
+            blocks = self._read_blocks(_BGZF_BLOCKS_PER_TASK)
+            if blocks:
+                self._tasks.append(self._executor.submit(_inflate_bgzf, blocks))
+
+        if self._tasks:
+            return self._tasks.popleft().result()
+        elif self._fallback is not None:
+            return self._fallback._next_chunk()
+
+        return None
+
+    def _read_blocks(self, count: int) -> List[bytes]:
+        blocks = []
+        handle = self._handle
+        for _ in range(count):
+            header = handle.read(_BGZF_HEADER.size)
+            if not header:
+                self._eof = True
+                break
+
+            header += handle.read(_BGZF_SUBFIELD.size)
+            if not _is_bgzf_block(header):
+                prefixed_handle = _PrefixedReader(header, handle)
+                self._fallback = _PipelinedGzipReader(prefixed_handle)
+                self._eof = True
+                break
+
+            _, _, _, _, xlen = _BGZF_HEADER.unpack_from(header)
+            _, _, bsize = _BGZF_SUBFIELD.unpack_from(header, _BGZF_HEADER.size)
+
+            # BSIZE is the total block size minus 1
+            block = handle.read(bsize + 1 - len(header))
+            if len(block) != bsize + 1 - len(header):
+                raise EOFError("Truncated BGZF block in %r" % (handle.name,))
+
+            # Skip any remaining subfields in the extra field
+            blocks.append(block[xlen - _BGZF_SUBFIELD.size :])
+
+        return blocks
+
+    def close(self) -> None:
+        if not self.closed:
+            for task in self._tasks:
+                task.cancel()
+
+            self._executor.shutdown()
+            if self._fallback is not None:
+                self._fallback.close()
+            self._handle.close()
+
+        super().close()
+
+
+def _inflate_bgzf(blocks: List[bytes]) -> bytes:
+    """Decompresses BGZF blocks, excluding headers, and checks CRC32/ISIZE."""
+    result = []
+    for block in blocks:
+        data = zlib.decompress(block[: -_BGZF_TRAILER.size], -15)
+        crc32, isize = _BGZF_TRAILER.unpack_from(block, len(block) - 8)
+        if zlib.crc32(data) != crc32 or len(data) != isize:
+            raise OSError("CRC32/size mismatch in BGZF block")
+
+        result.append(data)
+
+    return b"".join(result)
+
+
+class _PipelinedGzipReader(_ChunkedReader):
+    """Reader for (multi-member) GZip files, which are decompressed by a
+    background thread while the data is consumed by the calling thread."""
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        super().__init__()
+        self._fileobj = fileobj
+        self._queue = queue.Queue(_READ_AHEAD)
+        self._stop = threading.Event()
+        self._eof = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            with gzip.GzipFile(fileobj=self._fileobj, mode="rb") as handle:
+                while not self._stop.is_set():
+                    chunk = handle.read(_GZIP_CHUNK_SIZE)
+                    self._queue.put(chunk)
+                    if not chunk:
+                        break
+        except BaseException as error:
+            self._queue.put(error)
+
+    def _next_chunk(self) -> Optional[bytes]:
+        if self._eof:
+            return None
+
+        chunk = self._queue.get()
+        if isinstance(chunk, BaseException):
+            self._eof = True
+            raise chunk
+        elif not chunk:
+            self._eof = True
+            return None
+
+        return chunk
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            # Unblock the background thread, if it is waiting to add a chunk
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+            self._fileobj.close()
+
+        super().close()
+
+
+class _PrefixedReader:
+    """Minimal file-like object returning the bytes in 'prefix', followed by the
+    remaining contents of 'handle'; used to resume reading after a header has
+    been consumed, without requiring that 'handle' is seekable."""
+
+    def __init__(self, prefix: bytes, handle: BinaryIO) -> None:
+        self._prefix = prefix
+        self._handle = handle
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._handle.read(size)
+        elif size < 0:
+            data = self._prefix + self._handle.read()
+            self._prefix = b""
+        else:
+            data = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+
+        return data
+
+    def close(self) -> None:
+        self._handle.close()
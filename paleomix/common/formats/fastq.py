@@ -159,6 +159,14 @@ class FASTQualities:
     def update(self, record):
         self._qualities.update(record.qualities)
 
+    def update_bytes(self, qualities):
+        """Updates the observed qualities from a bytes object containing ASCII
+        encoded quality scores, e.g. the qualities of many records joined."""
+        observed = "".join(self._qualities).encode("ascii", "ignore")
+        qualities = qualities.translate(None, observed)
+        if qualities:
+            self._qualities.update(qualities.decode("ascii"))
+
     def offsets(self):
         qualities = [False] * 256
         for quality in self._qualities:
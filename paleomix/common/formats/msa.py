@@ -21,12 +21,11 @@
 # SOFTWARE.
 #
 
-from collections import defaultdict
+import re
 
-from paleomix.common.sequences import split
 from paleomix.common.fileutils import open_ro
 from paleomix.common.formats.fasta import FASTA, FASTAError
-from paleomix.common.sequences import NT_CODES, encode_genotype
+from paleomix.common.sequences import NT_CODES
 from paleomix.common.utilities import safe_coerce_to_frozenset
 
 
@@ -69,46 +68,21 @@ class MSA(frozenset):
         return MSA(included)
 
     def reduce(self):
-        columns = []
-        uncalled = frozenset("Nn-")
-        for column in zip(*(record.sequence for record in self)):
-            if frozenset(column) - uncalled:
-                columns.append(column)
-
-        if not columns:
+        """Returns a new MSA excluding columns containing only uncalled bases
+        (N and gaps), or None if no columns remain. See MSAMatrix.reduce."""
+        matrix = MSAMatrix.from_msa(self).reduce()
+        if matrix is None:
             return None
 
-        records = []
-        for (record, sequence) in zip(self, zip(*columns)):
-            records.append(FASTA(record.name, record.meta, "".join(sequence)))
-
-        return MSA(records)
+        return matrix.to_msa()
 
     def filter_singletons(self, to_filter, filter_using):
-        included, excluded, to_filter = self._group(filter_using, to_filter)
-
-        sequence = list(to_filter.sequence)
-        sequences = [record.sequence.upper() for record in included]
-        for (index, nts) in enumerate(zip(*sequences)):
-            current_nt = sequence[index].upper()
-            if current_nt in "N-":
-                continue
-
-            allowed_nts = set()
-            for allowed_nt in nts:
-                if allowed_nt not in "N-":
-                    allowed_nts.update(NT_CODES[allowed_nt])
-            filtered_nts = frozenset(NT_CODES[current_nt]) & allowed_nts
-
-            if not filtered_nts:
-                filtered_nts = "N"
+        """Replaces bases in the sequence 'to_filter' that are not found in any of
+        the sequences in 'filter_using', with lower-case versions of the bases
+        that are. See MSAMatrix.filter_singletons."""
+        matrix = MSAMatrix.from_msa(self)
 
-            genotype = encode_genotype(filtered_nts)
-            if genotype != current_nt:
-                sequence[index] = genotype.lower()
-        new_record = FASTA(to_filter.name, to_filter.meta, "".join(sequence))
-
-        return MSA([new_record] + included + excluded)
+        return matrix.filter_singletons(to_filter, filter_using).to_msa()
 
     def split(self, split_by="123"):
         """Splits a MSA and returns a dictionary of keys to MSAs,
@@ -118,13 +92,9 @@ class MSA(frozenset):
         if not split_by:
             raise TypeError("No partitions to split by specified")
 
-        results = dict((key, set()) for key in split_by)
-        for record in self:
-            for (key, partition) in split(record.sequence, split_by).items():
-                results[key].add(FASTA(record.name, None, partition))
-
+        results = MSAMatrix.from_msa(self).split(split_by)
         for (key, value) in results.items():
-            results[key] = MSA(value)
+            results[key] = value.to_msa()
 
         return results
 
@@ -136,15 +106,7 @@ class MSA(frozenset):
         is not preserved."""
         cls.validate(*msas)
 
-        merged = defaultdict(list)
-        for msa in msas:
-            for record in msa:
-                merged[record.name].append(record.sequence)
-
-        sequences = []
-        for (name, sequence) in merged.items():
-            sequences.append(FASTA(name, None, "".join(sequence)))
-        return MSA(sequences)
+        return MSAMatrix.join(*map(MSAMatrix.from_msa, msas)).to_msa()
 
     @classmethod
     def from_lines(cls, lines):
@@ -227,3 +189,229 @@ class MSA(frozenset):
                 other = record
 
         return included, excluded, other
+
+
+class MSAMatrix:
+    """Column-oriented representation of a MSA, in which the alignment is stored
+    as a matrix of bytes (one row per sequence, sorted by name). Operations on
+    columns are carried out on all columns at once, using bytes.translate and
+    bitwise operations on integers constructed from each row, rather than by
+    iterating over individual columns. Meta information is only preserved by
+    'reduce' and 'filter_singletons', as for the corresponding MSA functions.
+    """
+
+    __slots__ = ("names", "metas", "rows")
+
+    def __init__(self, names, metas, rows):
+        self.names = tuple(names)
+        self.metas = tuple(metas)
+        self.rows = tuple(rows)
+
+        if not self.rows:
+            raise MSAError("MSA does not contain any sequences")
+        elif not (len(self.names) == len(self.metas) == len(self.rows)):
+            raise ValueError("names, metas, and rows must be of the same length")
+        elif len(set(map(len, self.rows))) != 1:
+            raise MSAError("MSA contains sequences of differing lengths")
+
+    @classmethod
+    def from_msa(cls, msa):
+        names, metas, rows = [], [], []
+        for record in sorted(msa):
+            try:
+                rows.append(record.sequence.encode("latin-1"))
+            except UnicodeEncodeError:
+                raise MSAError("Invalid characters in sequence %r" % (record.name,))
+
+            names.append(record.name)
+            metas.append(record.meta or None)
+
+        return cls(names, metas, rows)
+
+    def to_msa(self):
+        return MSA(
+            FASTA(name, meta, row.decode("latin-1"))
+            for (name, meta, row) in zip(self.names, self.metas, self.rows)
+        )
+
+    def seqlen(self):
+        """Returns the length of the sequences in the MSA."""
+        return len(self.rows[0])
+
+    def reduce(self):
+        """Returns a new MSAMatrix excluding columns containing only uncalled
+        bases (N and gaps), or None if no columns remain."""
+        called = 0
+        for row in self.rows:
+            called |= int.from_bytes(row.translate(_CALLED_MASKS), "big")
+
+        spans = _nonzero_spans(called, self.seqlen())
+        if not spans:
+            return None
+        elif spans == [(0, self.seqlen())]:
+            return self
+
+        rows = []
+        for row in self.rows:
+            rows.append(b"".join(row[start:end] for (start, end) in spans))
+
+        return MSAMatrix(self.names, self.metas, rows)
+
+    def filter_singletons(self, to_filter, filter_using):
+        """Replaces bases in the sequence 'to_filter' that are not found in any of
+        the sequences in 'filter_using' with (lower-case) IUPAC codes representing
+        the overlap with bases found in those sequences, or 'n' if there is no
+        overlap. Columns in which 'to_filter' contains N or a gap are skipped, and
+        N and gaps are likewise ignored in the sequences in 'filter_using'."""
+        filter_using = safe_coerce_to_frozenset(filter_using)
+        if to_filter in filter_using:
+            raise MSAError("Key used for multiple selections: %r" % to_filter)
+        elif not filter_using:
+            raise ValueError("No FASTA names given")
+
+        missing_keys = (filter_using | frozenset((to_filter,))) - set(self.names)
+        if missing_keys:
+            raise KeyError("Key(s) not found: %r" % (", ".join(map(str, missing_keys))))
+
+        sequence = self.rows[self.names.index(to_filter)]
+        included = []
+        for (name, row) in zip(self.names, self.rows):
+            if name in filter_using:
+                included.append(row)
+
+        called = int.from_bytes(sequence.translate(_CALLED_MASKS), "big")
+        _check_nucleotides(sequence, included, called)
+
+        allowed = 0
+        for row in included:
+            allowed |= int.from_bytes(row.translate(_NT_MASKS), "big")
+
+        observed = int.from_bytes(sequence.translate(_NT_MASKS), "big") & allowed
+        seqlen = len(sequence)
+        genotypes = observed.to_bytes(seqlen, "big").translate(_MASKS_TO_NTS)
+        changed = int.from_bytes(genotypes, "big")
+        changed ^= int.from_bytes(sequence.upper(), "big")
+
+        filtered = bytearray(sequence)
+        for (start, end) in _nonzero_spans(changed & called, seqlen):
+            filtered[start:end] = genotypes[start:end].lower()
+
+        rows = list(self.rows)
+        rows[self.names.index(to_filter)] = bytes(filtered)
+
+        return MSAMatrix(self.names, self.metas, rows)
+
+    def split(self, split_by="123"):
+        """Splits a MSA and returns a dictionary of keys to MSAMatrix objects,
+        using the keys in the 'split_by' parameter at the top level. See also
+        paleomix.common.sequences.split."""
+        if not split_by:
+            raise TypeError("No partitions to split by specified")
+
+        positions = {}
+        for (index, key) in enumerate(split_by):
+            positions.setdefault(key, []).append(index)
+
+        results = {}
+        metas = (None,) * len(self.names)
+        for (key, indices) in positions.items():
+            rows = [_interleave(row, indices, len(split_by)) for row in self.rows]
+            results[key] = MSAMatrix(self.names, metas, rows)
+
+        return results
+
+    @classmethod
+    def join(cls, *matrices):
+        """Merge multiple MSAMatrix objects into a single MSAMatrix, by
+        concatenating rows in the order of the passed objects. See MSA.join."""
+        if not matrices:
+            raise TypeError("No MSAs given as arguments")
+
+        names = matrices[0].names
+        rows = [[] for _ in names]
+        for matrix in matrices:
+            if matrix.names != names:
+                if set(matrix.names) != set(names):
+                    missing = set(names).symmetric_difference(matrix.names)
+                    raise MSAError(
+                        "Some sequences not found in all MSAs: '%s'"
+                        % ("', '".join(missing),)
+                    )
+
+                matrix_rows = dict(zip(matrix.names, matrix.rows))
+                for (row, name) in zip(rows, names):
+                    row.append(matrix_rows[name])
+            else:
+                for (row, part) in zip(rows, matrix.rows):
+                    row.append(part)
+
+        return cls(names, (None,) * len(names), (b"".join(row) for row in rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return "MSAMatrix(%r, %r, %r)" % (self.names, self.metas, self.rows)
+
+
+def _build_nt_tables():
+    """Builds tables for translating bases (IUPAC codes) to bit-masks, where A, C,
+    G and T are represented by the bits 1, 2, 4 and 8, and for translating such
+    bit-masks back to upper-case IUPAC codes. N and gaps are represented by 0."""
+    nt_masks = bytearray(256)
+    masks_to_nts = bytearray(256)
+    for (code, nts) in NT_CODES.items():
+        if code != "N":
+            mask = sum(1 << "ACGT".index(nt) for nt in nts)
+            nt_masks[ord(code)] = nt_masks[ord(code.lower())] = mask
+            masks_to_nts[mask] = ord(code)
+    masks_to_nts[0] = masks_to_nts[15] = ord("N")
+
+    called_masks = bytes(0 if chr(idx) in "Nn-" else 0xFF for idx in range(256))
+    valid_nts = "".join(NT_CODES) + "".join(NT_CODES).lower() + "-"
+
+    return bytes(nt_masks), bytes(masks_to_nts), called_masks, valid_nts.encode()
+
+
+_NT_MASKS, _MASKS_TO_NTS, _CALLED_MASKS, _VALID_NTS = _build_nt_tables()
+_UNKNOWN_NT_MASKS = bytes(0 if idx in _VALID_NTS else 0xFF for idx in range(256))
+_NONZERO_BYTES = re.compile(b"[^\x00]+")
+
+
+def _nonzero_spans(value, length):
+    """Returns (start, end) tuples for each stretch of non-zero bytes in an
+    integer constructed from a row using int.from_bytes."""
+    value = value.to_bytes(length, "big")
+
+    return [match.span() for match in _NONZERO_BYTES.finditer(value)]
+
+
+def _interleave(row, indices, step):
+    """Returns the bytes found at the given indices in each group of 'step' bytes;
+    equivalent to collecting the nucleotides for a key in sequences.split."""
+    if len(indices) == 1:
+        return row[indices[0] :: step]
+
+    result = bytearray(sum(len(range(index, len(row), step)) for index in indices))
+    for (offset, index) in enumerate(indices):
+        result[offset :: len(indices)] = row[index::step]
+
+    return bytes(result)
+
+
+def _check_nucleotides(sequence, rows, called):
+    """Raises a KeyError for the first character in 'sequence' or in the same
+    column of 'rows' that is not a valid IUPAC code, excluding columns in which
+    'sequence' contains an uncalled base, matching MSA.filter_singletons."""
+    if not any(row.translate(None, _VALID_NTS) for row in rows + [sequence]):
+        return
+
+    unknown = int.from_bytes(sequence.translate(_UNKNOWN_NT_MASKS), "big")
+    for row in rows:
+        unknown |= int.from_bytes(row.translate(_UNKNOWN_NT_MASKS), "big") & called
+
+    for (start, _) in _nonzero_spans(unknown, len(sequence)):
+        for row in rows + [sequence]:
+            nt = chr(row[start]).upper()
+            if nt not in NT_CODES and nt != "-":
+                raise KeyError(nt)
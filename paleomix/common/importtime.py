@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Measures the time spent importing modules, similar to 'python -X importtime',
+but enabled at run-time and reported as a table sorted by cost. This is used
+by 'paleomix --profile-imports <command>' and by the PALEOMIX_PROFILE_IMPORTS
+environment variable, the latter of which also applies to commands run by the
+pipelines, since child processes inherit the environment.
+
+The time reported for a module includes the time spent locating the module and
+executing it; the 'self' time excludes the time spent importing other modules
+during the import of that module.
+"""
+import importlib.abc
+import sys
+import time
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Meta path finder that records import times for modules imported while
+    installed; this finder does not itself find modules, but instead wraps the
+    loaders returned by the remaining finders in sys.meta_path."""
+
+    def __init__(self):
+        # Module name -> (self time, cumulative time) in seconds
+        self.timings = {}
+        # Module name -> time spent locating (not yet executed) modules
+        self._find_times = {}
+        # Stack of [module name, start time, time spent importing children]
+        self._stack = []
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        start = time.perf_counter()
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                continue
+
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            # Included in the time spent importing the module; see '_enter'
+            self._find_times[fullname] = time.perf_counter() - start
+            spec.loader = _ProfiledLoader(self, spec.loader)
+
+        return spec
+
+    def report(self, top=None):
+        """Returns a list of table rows describing the most expensive imports,
+        sorted by cumulative time, and ending with the total time spent."""
+        timings = sorted(self.timings.items(), key=lambda it: it[1][1], reverse=True)
+        total = sum(self_time for (self_time, _) in self.timings.values())
+        if top is not None:
+            timings = timings[:top]
+
+        rows = [("Self(ms)", "Cumulative(ms)", "Module")]
+        for name, (self_time, cumulative) in timings:
+            rows.append((_format_ms(self_time), _format_ms(cumulative), name))
+        rows.append((_format_ms(total), "-", "*"))
+
+        return rows
+
+    def _enter(self, name):
+        start = time.perf_counter() - self._find_times.pop(name, 0.0)
+        self._stack.append([name, start, 0.0])
+
+    def _exit(self):
+        name, start, children = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if self._stack:
+            self._stack[-1][-1] += elapsed
+
+        self.timings[name] = (elapsed - children, elapsed)
+
+
+class _ProfiledLoader:
+    """Wrapper around a loader that times calls to 'exec_module'; all other
+    attributes (e.g. 'get_source' or 'get_resource_reader') are forwarded."""
+
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit()
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+def _format_ms(seconds):
+    return "%.1f" % (seconds * 1e3,)
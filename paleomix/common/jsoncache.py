@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Persistent caches stored as JSON files, shared by multiple PALEOMIX processes.
+
+Caches are loaded in full when created, and new entries are written using
+JSONCache.save, which merges them with any entries written by other processes
+since the cache was loaded, before atomically replacing the file. Each file
+records the VERSION of the cache that wrote it; files written by a different
+version, as well as missing or corrupt files, are treated as empty caches and
+are replaced when new entries are saved.
+"""
+import json
+import logging
+import os
+
+
+class JSONCache:
+    # Version of the cache entries; must be incremented whenever the format or
+    # the meaning of entries changes, in order to invalidate existing caches
+    VERSION = 1
+    # Description of the cache used in log messages
+    DESCRIPTION = "cache"
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries = self._read_entries()
+        self._changes = {}
+
+    def get(self, key, default=None):
+        return self._entries.get(key, default)
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._changes[key] = value
+
+    def save(self):
+        """Writes updated entries to disk, merging them with any entries written
+        by other processes since the cache was loaded."""
+        if not self._changes:
+            return
+
+        entries = self._read_entries()
+        entries.update(self._changes)
+
+        temp_filename = "%s.%i.tmp" % (self.filename, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(temp_filename, "wt") as handle:
+                data = {"version": self.VERSION, "entries": entries}
+                json.dump(data, handle, sort_keys=True, indent=2)
+            os.replace(temp_filename, self.filename)
+        except OSError as error:
+            log = logging.getLogger(__name__)
+            log.warning(
+                "Could not update %s %r: %s", self.DESCRIPTION, self.filename, error
+            )
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+
+        self._changes = {}
+
+    def _read_entries(self):
+        """Returns the entries currently written to disk by this VERSION."""
+        try:
+            with open(self.filename, "rt") as handle:
+                data = json.load(handle)
+
+            if (
+                isinstance(data, dict)
+                and data.get("version") == self.VERSION
+                and isinstance(data.get("entries"), dict)
+            ):
+                return data["entries"]
+        except (OSError, ValueError):
+            pass  # Missing or corrupt cache files are simply replaced
+
+        return {}
+
+    def __contains__(self, key):
+        return key in self._entries
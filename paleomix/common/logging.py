@@ -24,10 +24,9 @@ import errno
 import itertools
 import logging
 import os
+import sys
 import time
 
-import coloredlogs
-
 
 _LOG_LEVELS = {
     "info": logging.INFO,
@@ -37,6 +36,7 @@ _LOG_LEVELS = {
 }
 
 _LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+_LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 _LOG_ENABLED = False
 
 
@@ -44,7 +44,22 @@ def initialize_console_logging():
     global _LOG_ENABLED
 
     if not _LOG_ENABLED:
-        coloredlogs.install(fmt=_LOG_FORMAT)
+        if sys.stderr.isatty():
+            # coloredlogs is slow to import and only used for terminal output
+            import coloredlogs
+
+            coloredlogs.install(fmt=_LOG_FORMAT)
+        else:
+            # Equivalent to the output of coloredlogs when colors are not used
+            handler = _StandardErrorHandler()
+            handler.setFormatter(logging.Formatter(_LOG_FORMAT, _LOG_DATE_FORMAT))
+            handler.setLevel(logging.INFO)
+
+            root = logging.getLogger()
+            root.addHandler(handler)
+            if root.getEffectiveLevel() > logging.INFO:
+                root.setLevel(logging.INFO)
+
         _LOG_ENABLED = True
 
 
@@ -89,6 +104,18 @@ def get_logfiles():
             yield handler.baseFilename
 
 
+class _StandardErrorHandler(logging.StreamHandler):
+    """Writes to the current value of sys.stderr, which may be replaced after
+    the handler is created (e.g. when output is captured)."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
 class LazyLogfile(logging.FileHandler):
     def __init__(self, template):
         logging.FileHandler.__init__(self, template, delay=True)
@@ -197,61 +197,249 @@ def read_makefile(filename, specification):
 def process_makefile(data, specification, path=(), apply_defaults=True):
     """Validates a makefile and applies defaults to missing keys.
 
-    Note that that default values are deep-copied before being set.
+    Note that that default values are deep-copied before being set. The
+    specification is compiled into a tree of validators the first time it is
+    used (see _compile_spec), and must therefore not be modified afterwards.
     """
-    if isinstance(specification, WithoutDefaults):
-        specification = specification.specification
-        data = process_makefile(data, specification, path, apply_defaults=False)
-    elif isinstance(specification, PreProcessMakefile):
-        data, specification = specification(path, data)
-        data = process_makefile(data, specification, path, apply_defaults)
-    elif _is_spec(specification):
-        _instantiate_spec(specification)(path, data)
-    elif isinstance(data, (dict, type(None))) and isinstance(specification, dict):
+    return _compile_spec(specification, apply_defaults)(data, path)
+
+
+def _compile_spec(specification, apply_defaults):
+    """Returns a function 'func(data, path)' that validates data against the
+    given specification, equivalent to calling 'process_makefile'. Compiled
+    specifications are cached, and sub-specifications are compiled on demand,
+    so that errors in unused parts of a specification are only raised if the
+    corresponding data is encountered.
+    """
+    key = (id(specification), apply_defaults)
+    cached = _COMPILED_SPECS.get(key)
+    if cached is None:
+        if isinstance(specification, WithoutDefaults):
+            validator = _compile_spec(specification.specification, False)
+        elif isinstance(specification, PreProcessMakefile):
+            validator = _PreProcessValidator(specification, apply_defaults)
+        elif _is_spec(specification):
+            validator = _SpecValidator(_instantiate_spec(specification))
+        elif isinstance(specification, dict):
+            validator = _DictValidator(specification, apply_defaults)
+        elif isinstance(specification, list):
+            validator = _ListValidator(specification)
+        else:
+            validator = _InvalidSpecValidator(specification)
+
+        # The specification is kept to ensure that its id is not re-used
+        cached = _COMPILED_SPECS[key] = (specification, validator)
+
+    return cached[1]
+
+
+class _PreProcessValidator:
+    def __init__(self, specification, apply_defaults):
+        self._specification = specification
+        self._apply_defaults = apply_defaults
+
+    def __call__(self, data, path):
+        data, specification = self._specification(path, data)
+
+        return _compile_spec(specification, self._apply_defaults)(data, path)
+
+
+class _SpecValidator:
+    def __init__(self, specification):
+        self._specification = specification
+        # Validation of hashable values is memoized for plain specifications, but
+        # not for specifications that have side effects (e.g. RemovedOption)
+        self._valid_values = None
+        if type(specification).__call__ is MakefileSpec.__call__:
+            self._valid_values = set()
+
+    def __call__(self, data, path):
+        valid_values = self._valid_values
+        if valid_values is not None and _is_hashable(data):
+            # The type is included, since e.g. 1 == True
+            key = (type(data), data)
+            if key not in valid_values:
+                self._specification(path, data)
+                valid_values.add(key)
+        else:
+            self._specification(path, data)
+
+        return data
+
+
+class _DictValidator:
+    def __init__(self, specification, apply_defaults):
+        self._specification = specification
+        self._apply_defaults = apply_defaults
+        # Specifications (e.g. 'IsStr') used as keys, in the order specified
+        self._key_specs = []
+        # Keys for which defaults may be set or values are required
+        self._defaults = []
+        # Keys for which the processed (non-spec) keys have been determined
+        self._matching_keys = {}
+        self._summary_spec = None
+
+        for key, value in specification.items():
+            if _is_spec(key):
+                self._key_specs.append((key, _instantiate_spec(key)))
+            elif self._defaults is not None:
+                if isinstance(value, PreProcessMakefile):
+                    # Pre-processing may replace the data; not handled here
+                    self._defaults = None
+                else:
+                    self._defaults.append((key, value))
+
+        if self._defaults is not None:
+            self._defaults = self._compile_defaults(self._defaults, apply_defaults)
+
+    def __call__(self, data, path):
         # A limitation of YAML is that empty subtrees are equal to None;
         # this check ensures that empty subtrees to be handled properly
         if data is None:
             data = {}
+        elif not isinstance(data, dict):
+            _raise_inconsistency_error(self._specification, data, path)
 
-        _process_default_values(data, specification, path, apply_defaults)
-
-        for cur_key in data:
-            ref_key = _get_matching_spec_or_value(
-                cur_key, specification, path + (cur_key,)
-            )
-            data[cur_key] = process_makefile(
-                data[cur_key], specification[ref_key], path + (cur_key,), apply_defaults
-            )
-    elif isinstance(data, (list, type(None))) and isinstance(specification, list):
-        if not all(_is_spec(spec) for spec in specification):
-            raise TypeError(
-                "Lists contains non-specification objects (%r): %r"
-                % (_path_to_str(path), specification)
+        if self._defaults is None:
+            _process_default_values(
+                data, self._specification, path, self._apply_defaults
             )
-        elif data is None:  # See comment above
+        else:
+            for key, default_value, required, deepcopy in self._defaults:
+                if key not in data:
+                    if required:
+                        raise MakefileError(
+                            "A value MUST be supplified for %r"
+                            % (_path_to_str(path + (key,)))
+                        )
+                    elif deepcopy:
+                        default_value = copy.deepcopy(default_value)
+
+                    data[key] = default_value
+
+        for key in data:
+            key_path = path + (key,)
+            spec = self._specification[self._get_matching_key(key, key_path)]
+            data[key] = _compile_spec(spec, self._apply_defaults)(data[key], key_path)
+
+        return data
+
+    def _get_matching_key(self, value, path):
+        """Returns the specification object or value that matches the observed
+        key; constant keys take precedence over specification objects. If no
+        matching specification or value is found, an MakefileError is raised.
+        """
+        if value in self._specification:
+            return value
+
+        memoize = _is_hashable(value)
+        if memoize:
+            key = (type(value), value)
+            spec = self._matching_keys.get(key)
+            if spec is not None:
+                return spec
+
+        for spec, instance in self._key_specs:
+            if instance.meets_spec(value):
+                if memoize:
+                    self._matching_keys[key] = spec
+
+                return spec
+
+        # No matching key or spec; create combined spec to raise error message
+        if self._summary_spec is None:
+            self._summary_spec = _get_summary_spec(self._specification)
+        self._summary_spec(path, value)
+        assert False  # pragma: no coverage
+
+    @classmethod
+    def _compile_defaults(cls, defaults, apply_defaults):
+        """Returns a list of (key, default value, required, deepcopy) tuples,
+        equivalent to the checks carried out by '_process_default_values'."""
+        result = []
+        for key, default_value in defaults:
+            default_value_from_spec = False
+            if _is_spec(default_value):
+                default_value = _instantiate_spec(default_value)
+                if default_value.default is DEFAULT_NOT_SET:
+                    continue
+                elif default_value.default is REQUIRED_VALUE:
+                    result.append((key, None, True, False))
+                    continue
+
+                default_value = default_value.default
+                default_value_from_spec = True
+
+            if apply_defaults and not isinstance(default_value, WithoutDefaults):
+                if isinstance(default_value, dict):
+                    # Setting of values in the dict will be accomplished
+                    # by the validator for the sub-specification
+                    default_value = {}
+                elif isinstance(default_value, list):
+                    # Lists of specs defaults to empty lists
+                    if not default_value_from_spec:
+                        default_value = []
+
+                # Prevent clobbering of values when re-using sub-specs
+                deepcopy = not isinstance(default_value, _IMMUTABLE_TYPES)
+                result.append((key, default_value, False, deepcopy))
+
+        return result
+
+
+class _ListValidator:
+    def __init__(self, specification):
+        self._specification = specification
+        self._validator = None
+
+    def __call__(self, data, path):
+        if data is None:  # See _DictValidator
             data = []
+        elif not isinstance(data, list):
+            _raise_inconsistency_error(self._specification, data, path)
+
+        if self._validator is None:
+            if not all(_is_spec(spec) for spec in self._specification):
+                raise TypeError(
+                    "Lists contains non-specification objects (%r): %r"
+                    % (_path_to_str(path), self._specification)
+                )
+
+            self._validator = IsListOf(*self._specification)
+        self._validator(path, data)
 
-        specification = IsListOf(*specification)
-        _instantiate_spec(specification)(path, data)
-    elif not isinstance(specification, (dict, list)):
+        return data
+
+
+class _InvalidSpecValidator:
+    def __init__(self, specification):
+        self._specification = specification
+
+    def __call__(self, _data, path):
         raise TypeError(
             "Unexpected type in makefile specification at %r: %r!"
-            % (_path_to_str(path), specification)
+            % (_path_to_str(path), self._specification)
         )
-    else:
-        raise MakefileError(
-            "Inconsistency between makefile specification and "
-            "current makefile at %s:\n    Expected %s, "
-            "found %s %r!"
-            % (
-                _path_to_str(path),
-                type(specification).__name__,
-                type(data).__name__,
-                data,
-            )
+
+
+def _raise_inconsistency_error(specification, data, path):
+    raise MakefileError(
+        "Inconsistency between makefile specification and "
+        "current makefile at %s:\n    Expected %s, "
+        "found %s %r!"
+        % (
+            _path_to_str(path),
+            type(specification).__name__,
+            type(data).__name__,
+            data,
         )
+    )
+
 
-    return data
+# Cache of compiled specifications; see _compile_spec
+_COMPILED_SPECS = {}
+# Default values of these types are not copied before being set
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
 
 
 ###############################################################################
@@ -828,24 +1016,6 @@ def _get_summary_spec(specs_or_keys):
     return ValueMissing()
 
 
-def _get_matching_spec_or_value(value, specs, path):
-    """Returns the specification object or value that matches the observed
-    value; specs may be a list of specification objects and/or constant values
-    allowed by the makefile. If no matching specification or value is found,
-    an MakefileError is raised.
-    """
-    if value in specs:
-        return value
-
-    for spec in specs:
-        if _is_spec(spec) and _instantiate_spec(spec).meets_spec(value):
-            return spec
-
-    # No matching key or spec; create combined spec to raise error message
-    _get_summary_spec(specs)(path, value)
-    assert False  # pragma: no coverage
-
-
 def _process_default_values(data, specification, path, apply_defaults):
     """Checks a subtree against a specification, verifies that required values
     have been set, and (optionally) sets values for keys where defaults have
@@ -24,8 +24,10 @@
 Tools used for working with subprocesses.
 """
 import os
+import queue
+import signal
 import sys
-import time
+import threading
 
 from subprocess import *
 
@@ -64,42 +66,86 @@ def open_proc(call, *args, **kwargs):
             os.close(devnull)
 
 
+def max_rss_from_rusage(rusage):
+    """Returns the peak RSS in bytes recorded in a resource.struct_rusage object,
+    for example as returned by os.wait4."""
+    # ru_maxrss is measured in bytes on OSX and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss
+
+    return rusage.ru_maxrss * 1024
+
+
+def init_pool_worker():
+    """Initializer for multiprocessing.Pool workers that restores the default
+    SIGTERM handler. Workers forked from a pipeline process may otherwise inherit
+    the handler used to clean up child processes (see atomiccmd.command), which
+    can cause Pool.terminate() to deadlock.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def iter_completed(items, join):
+    """Yields tuples of (index, result) for each item in 'items' as they
+    complete, where 'result' is the value returned by 'join(item)'. Each call
+    to 'join' is made in a separate thread, allowing the caller to react to
+    the first item completing without having to repeatedly poll each item.
+    Exceptions raised by 'join' are re-raised in the calling thread.
+    """
+    items = list(items)
+    results = queue.Queue()
+
+    def _join(index, item):
+        try:
+            results.put((index, join(item), None))
+        except BaseException as error:
+            results.put((index, None, error))
+
+    for index, item in enumerate(items):
+        thread = threading.Thread(target=_join, args=(index, item))
+        thread.daemon = True
+        thread.start()
+
+    for _ in items:
+        index, result, error = results.get()
+        if error is not None:
+            raise error
+
+        yield index, result
+
+
 def join_procs(procs, out=sys.stderr):
     """Joins a set of Popen processes. If a processes fail, the remaining
     processes are terminated. The function returns a list of return-code,
     containing the result of each call. Status messages are written to STDERR
     by default.
     """
-    sleep_time = 0.05
-    commands = list(enumerate(procs))
-    assert all(hasattr(cmd, "call") for (_, cmd) in commands)
+    procs = list(procs)
+    assert all(hasattr(cmd, "call") for cmd in procs)
 
-    return_codes = [None] * len(commands)
+    return_codes = [None] * len(procs)
+    terminated = set()
     out.write("Joinining subprocesses:\n")
-    while commands:
-        for (index, command) in list(commands):
-            if command.poll() is not None:
-                return_codes[index] = command.wait()
-                commands.remove((index, command))
-                sleep_time = 0.05
-
-                out.write(
-                    "  - Command finished: %s\n"
-                    "    - Return-code:    %s\n"
-                    % (" ".join(command.call), return_codes[index])
-                )
-                out.flush()
-            elif any(return_codes):
-                out.write("  - Terminating command: %s\n" % (" ".join(command.call),))
-                out.flush()
-
-                command.terminate()
-                return_codes[index] = command.wait()
-                commands.remove((index, command))
-                sleep_time = 0.05
-
-        time.sleep(sleep_time)
-        sleep_time = min(1, sleep_time * 2)
+    for index, return_code in iter_completed(procs, lambda proc: proc.wait()):
+        return_codes[index] = return_code
+        if index not in terminated:
+            out.write(
+                "  - Command finished: %s\n"
+                "    - Return-code:    %s\n"
+                % (" ".join(procs[index].call), return_code)
+            )
+            out.flush()
+
+        if return_code and not terminated:
+            for other_index, command in enumerate(procs):
+                if other_index != index and command.poll() is None:
+                    out.write(
+                        "  - Terminating command: %s\n" % (" ".join(command.call),)
+                    )
+                    out.flush()
+
+                    command.terminate()
+                    terminated.add(other_index)
 
     if any(return_codes):
         out.write("Errors occured during processing!\n")
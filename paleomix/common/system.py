@@ -21,10 +21,15 @@
 # SOFTWARE.
 #
 import os
+import re
 import sys
 import resource
 
 
+_MEMORY_SIZE_RE = re.compile(r"^(\d+)([kmgt]?)b?$", re.IGNORECASE)
+_MEMORY_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
 def set_procname(name=os.path.basename(sys.argv[0])):
     """Attempts to set the current process-name to the given name."""
     import setproctitle
@@ -52,3 +57,17 @@ def get_max_open_files():
         pass
 
     return soft_limit
+
+
+def parse_memory_size(value):
+    """Parses a memory size such as '4g', '512M', or '1024', following the format
+    used by the java -Xmx option, and returns the size in bytes. A ValueError is
+    raised if the value could not be parsed.
+    """
+    match = _MEMORY_SIZE_RE.match(value.strip())
+    if match is None:
+        raise ValueError("invalid memory size %r" % (value,))
+
+    size, unit = match.groups()
+
+    return int(size) * _MEMORY_SIZE_UNITS[unit.lower()]
@@ -21,12 +21,16 @@
 # SOFTWARE.
 #
 import argparse
+import array
 import collections
+import itertools
+import operator
 
 import paleomix.common.vcfwrap as vcfwrap
+from paleomix.common.bedtools import BEDIndex
 
 
-_INF = float("inf")
+_NAN = float("nan")
 # Rough number of records to keep in memory at once
 _CHUNK_SIZE = 10000
 
@@ -152,191 +156,326 @@ def describe_filters(options):
     }
 
 
-def filter_vcfs(options, vcfs):
-    vcfs = iter(vcfs)
-    chunk = collections.deque()
+def filter_vcf_lines(options, lines, reset_filter=False):
+    """Filters VCF records (lines without trailing newlines, excluding header
+    lines) and yields the resulting lines. Records are parsed once into columns
+    per chunk, and filters are evaluated column-wise. If 'reset_filter' is set,
+    any existing values in the FILTER column are discarded.
+    """
+    lines = iter(lines)
+    chunk = _VCFColumns()
+    chunk_size = _CHUNK_SIZE
 
-    while _read_chunk(vcfs, chunk):
-        chunk = _filter_chunk(options, chunk)
-        for vcf in _trim_chunk(options, chunk):
-            if vcf.filter == ".":
-                vcf.filter = "PASS"
-
-            yield vcf
-
-
-def _read_chunk(vcfs, chunk):
-    try:
-        while len(chunk) < _CHUNK_SIZE:
-            chunk.append(next(vcfs))
-    except StopIteration:
-        chunk.append(None)
+    at_end = False
+    while not at_end:
+        at_end = chunk.read(lines, chunk_size, reset_filter)
+        if not chunk:
+            break
+
+        _filter_columns_by_indels(options, chunk)
+
+        count = _trim_columns(options, chunk, at_end)
+        if count:
+            chunk_size = _CHUNK_SIZE
+        else:
+            # No records could be trimmed (e.g. a long run of records at the same
+            # position), so the chunk has to grow to make progress
+            chunk_size = 2 * len(chunk)
+
+        # Properties are only evaluated once indel filters are final, so that
+        # the output does not depend on where chunks happen to be split
+        _filter_columns_by_properties(options, chunk, count)
+
+        for fields in chunk.popleft(count):
+            if fields[6] == ".":
+                fields[6] = "PASS"
+
+            yield "\t".join(fields)
+
+
+class _VCFColumns:
+    """Columns of the VCF records in a chunk. Records are parsed once when read;
+    missing values are represented as NaN, for which all comparisons are false.
+    """
+
+    def __init__(self):
+        self.fields = []
+        self.contigs = []
+        self.positions = array.array("l")
+        self.lengths = array.array("l")
+        self.is_indel = bytearray()
+        self.quals = array.array("d")
+        self.depths = array.array("d")
+        self.mapping_quals = array.array("d")
+        self.pv4 = tuple(array.array("d") for _ in range(4))
+        # The following columns are NaN/false for non-variant positions
+        self.alt_bases = array.array("d")
+        self.is_ambiguous = bytearray()
+        self.is_heterozygous = bytearray()
+
+    def read(self, lines, size, reset_filter):
+        """Reads lines until the chunk contains 'size' records; returns true if
+        the end of 'lines' was reached."""
+        nlines = len(self.fields)
+        for line in itertools.islice(lines, max(0, size - nlines)):
+            self._append(line.split("\t"), reset_filter)
+
+        return len(self.fields) - nlines < size - nlines
+
+    def _append(self, fields, reset_filter):
+        if reset_filter:
+            fields[6] = "."
+
+        ref, alt, info = fields[3], fields[4], fields[7]
 
-    return len(chunk) > 1
+        properties = {}
+        for field in info.split(";"):
+            if "=" in field:
+                key, value = field.split("=")
+            else:
+                key, value = field, None
+            properties[key] = value
 
+        self.fields.append(fields)
+        self.contigs.append(fields[0])
+        self.positions.append(int(fields[1]) - 1)
+        # 'length' will become a too large value for heterozygous SNPs, but it is
+        # faster than having to parse every position, and has no effect on the
+        # final results.
+        self.lengths.append(max(len(ref), len(alt)))
+        self.is_indel.append("INDEL" in info)
+        self.quals.append(float(fields[5]))
+        self.depths.append(float(properties["DP"]))
+        self.mapping_quals.append(float(properties.get("MQ", _NAN)))
+
+        pv4 = properties.get("PV4")
+        pv4 = pv4.split(",") if pv4 is not None else (_NAN,) * 4
+        for column, value in zip(self.pv4, pv4):
+            column.append(float(value))
+
+        if alt != ".":
+            _, _, alt_fw, alt_rev = map(int, properties["DP4"].split(","))
+            genotype = vcfwrap.get_ml_genotype_from_pl(ref, alt, _get_sample_pl(fields))
+
+            self.alt_bases.append(alt_fw + alt_rev)
+            self.is_ambiguous.append(genotype == ("N", "N"))
+            self.is_heterozygous.append(genotype[0] != genotype[1])
+        else:
+            self.alt_bases.append(_NAN)
+            self.is_ambiguous.append(False)
+            self.is_heterozygous.append(False)
+
+    def popleft(self, count):
+        """Removes and returns the fields of the first 'count' records."""
+        fields = self.fields[:count]
+        for column in self._columns():
+            del column[:count]
+
+        return fields
+
+    def mark_as_filtered(self, rows, filter_name):
+        fields = self.fields
+        for row in rows:
+            fields[row][6] = _add_filter(fields[row][6], filter_name)
+
+    def mark_where(self, selectors, filter_name):
+        """Marks rows for which 'selectors' are true, starting with the first."""
+        rows = itertools.compress(itertools.count(), selectors)
+
+        self.mark_as_filtered(rows, filter_name)
+
+    def _columns(self):
+        return (
+            self.fields,
+            self.contigs,
+            self.positions,
+            self.lengths,
+            self.is_indel,
+            self.quals,
+            self.depths,
+            self.mapping_quals,
+            self.alt_bases,
+            self.is_ambiguous,
+            self.is_heterozygous,
+        ) + self.pv4
+
+    def __len__(self):
+        return len(self.fields)
+
+
+def _trim_columns(options, chunk, at_end):
+    """Returns the number of records at the start of the chunk that can no
+    longer be affected by records not yet read."""
+    if at_end:
+        return len(chunk)
 
-def _trim_chunk(options, chunk):
     min_distance = max(
         options.min_distance_between_indels, options.min_distance_to_indels
     )
 
-    if not chunk:
-        return
-    elif chunk[-1] is None:
-        end_chr = "!@#$%^&*()_+"
-        end_pos = _INF
-        chunk.pop()
-    else:
-        end_chr = chunk[-1].contig
-        end_pos = chunk[-1].pos
-
-    while chunk:
-        vcf = chunk[0]
-        if vcf.contig == end_chr:
-            # 'length' will become a too large value for heterozygous SNPs,
-            # but it is faster than having to parse every position, and has
-            # no effect on the final results.
-            length = max(len(vcf.ref), len(vcf.alt))
-            if (vcf.pos + length + min_distance) >= end_pos:
-                break
-
-        yield chunk.popleft()
-
-
-def _group_indels_near_position(indels, distance):
-    """Returns a dictionary of positions that are either directly covered by, or
-    adjacent to indels, given some arbitrary distance. For each position, a list
-    of adjacent/overlapping indels are provided."""
-    positions = collections.defaultdict(list)
-    if not distance:
-        return positions
-
-    for vcf in indels:
-        # The number of bases covered (excluding the prefix)
-        # For ambigious indels (e.g. in low complexity regions), this ensures
-        # that the entire region is considered. Note that we do not need to
-        # consider the alternative sequence(s)
-        length = len(vcf.ref) - 1
-
-        # Inclusive start/end positions for bases that should be blacklisted
-        # Note that vcf.pos is the base just before the insertion/deletion
-        start = vcf.pos + 1 - distance
-        end = vcf.pos + 1 + distance + length
-
-        for position in range(start, end + 1):
-            positions[position].append(vcf)
-
-    return positions
-
-
-def _select_best_indel(indels):
-    """Select the highest quality indel, based on the quality,
-    prefering low earlier positions above later positions in
-    case of ties."""
-
-    def _indel_by_quality_and_position(indel):
-        # The negative position is used to select the first
-        # of equally quality indels
-        return (float(indel.qual), -indel.pos)
-
-    return max(indels, key=_indel_by_quality_and_position)
-
-
-def _filter_by_indels(options, chunk):
+    end_chr = chunk.contigs[-1]
+    end_pos = chunk.positions[-1]
+    for row, (contig, pos, length) in enumerate(
+        zip(chunk.contigs, chunk.positions, chunk.lengths)
+    ):
+        if contig == end_chr and (pos + length + min_distance) >= end_pos:
+            return row
+
+    return len(chunk)
+
+
+def _filter_columns_by_indels(options, chunk):
     """Filters a list of SNPs and Indels, such that no SNP is closer to
     an indel than the value set in options.min_distance_to_indels, and
     such that no two indels too close. If two or more indels are within
     this distance, the indel with the highest QUAL score is retained. When
-    no unique highest QUAL score exists, an arbitrary indel is retained
+    no unique highest QUAL score exists, the earliest indel is retained
     among those indels with the highest QUAL score. SNPs are filtered
     based on prefiltered Indels."""
-    indels = [vcf for vcf in chunk if vcfwrap.is_indel(vcf)]
+    indels = list(itertools.compress(itertools.count(), chunk.is_indel))
+    if not indels:
+        return
+
+    contigs = chunk.contigs
+    positions = chunk.positions
+    quals = chunk.quals
 
     distance_between = options.min_distance_between_indels
-    indel_blacklist = _group_indels_near_position(indels, distance_between)
+    if distance_between:
+        regions = _IndelRegions(chunk, indels, distance_between)
+
+        filtered = []
+        for row in indels:
+            candidates = regions.overlapping(contigs[row], positions[row] + 1)
+            best = max(
+                candidates or (row,),
+                # Prefer the earliest of equally high quality indels
+                key=lambda idx: (quals[idx], -positions[idx], -idx),
+            )
+
+            if best != row:
+                filtered.append(row)
+
+        chunk.mark_as_filtered(filtered, "W:%i" % distance_between)
+
     distance_to = options.min_distance_to_indels
-    snp_blacklist = _group_indels_near_position(indels, distance_to)
-
-    for vcf in chunk:
-        if vcfwrap.is_indel(vcf):
-            blacklisted = indel_blacklist.get(vcf.pos + 1, [vcf])
-            if vcf is not _select_best_indel(blacklisted):
-                _mark_as_filtered(vcf, "W:%i" % distance_between)
-        elif (vcf.alt != ".") and (vcf.pos in snp_blacklist):
-            # TODO: How to handle heterozygous SNPs near
-            _mark_as_filtered(vcf, "w:%i" % distance_to)
-
-
-def _filter_by_properties(options, vcfs):
-    """Filters a list of SNPs/indels based on the various properties recorded in
-    the info column, and others. This mirrors most of the filtering carried out
-    by vcfutils.pl varFilter."""
-    for vcf in vcfs:
-        if float(vcf.qual) < options.min_quality:
-            _mark_as_filtered(vcf, "q:%i" % options.min_quality)
+    if distance_to:
+        regions = _IndelRegions(chunk, indels, distance_to)
 
-        properties = {}
-        for field in vcf.info.split(";"):
-            if "=" in field:
-                key, value = field.split("=")
-            else:
-                key, value = field, None
-            properties[key] = value
+        filtered = []
+        for row, (contig, pos, is_indel, fields) in enumerate(
+            zip(contigs, positions, chunk.is_indel, chunk.fields)
+        ):
+            if is_indel or fields[4] == ".":
+                continue
+            elif regions.overlapping(contig, pos):
+                filtered.append(row)
 
-        read_depth = float(properties["DP"])
-        if options.min_read_depth > read_depth:
-            _mark_as_filtered(vcf, "d:%i" % options.min_read_depth)
-        elif options.max_read_depth < read_depth:
-            _mark_as_filtered(vcf, "D:%i" % options.max_read_depth)
-
-        if "MQ" in properties:
-            if float(properties["MQ"]) < options.min_mapping_quality:
-                _mark_as_filtered(vcf, "Q:%i" % options.min_mapping_quality)
-
-        if "PV4" in properties:
-            pv4 = [float(value) for value in properties["PV4"].split(",")]
-            if pv4[0] < options.min_strand_bias:
-                _mark_as_filtered(vcf, "1:%e" % options.min_strand_bias)
-            if pv4[1] < options.min_baseq_bias:
-                _mark_as_filtered(vcf, "2:%e" % options.min_baseq_bias)
-            if pv4[2] < options.min_mapq_bias:
-                _mark_as_filtered(vcf, "3:%e" % options.min_mapq_bias)
-            if pv4[3] < options.min_end_distance_bias:
-                _mark_as_filtered(vcf, "4:%e" % options.min_end_distance_bias)
-
-        if vcf.alt != ".":
-            ref_fw, ref_rev, alt_fw, alt_rev = map(int, properties["DP4"].split(","))
-            if (alt_fw + alt_rev) < options.min_num_alt_bases:
-                _mark_as_filtered(vcf, "a:%i" % options.min_num_alt_bases)
-
-            ml_genotype = vcfwrap.get_ml_genotype(vcf)
-            if (ml_genotype == ("N", "N")) and not options.keep_ambigious_genotypes:
-                # No most likely genotype
-                _mark_as_filtered(vcf, "k")
-
-            if ml_genotype[0] != ml_genotype[1]:
-                if vcf.contig in options.homozygous_chromosome:
-                    _mark_as_filtered(vcf, "HET")
-
-
-def _filter_chunk(options, chunk):
-    at_end = False
-    if chunk[-1] is None:
-        at_end = True
-        chunk.pop()
+        chunk.mark_as_filtered(filtered, "w:%i" % distance_to)
 
-    _filter_by_indels(options, chunk)
-    _filter_by_properties(options, chunk)
 
-    if at_end:
-        chunk.append(None)
-    return chunk
+_IndelRegion = collections.namedtuple("_IndelRegion", ("contig", "start", "end", "row"))
+
+
+class _IndelRegions:
+    """Intervals of positions that are either directly covered by, or adjacent
+    to indels, given some arbitrary distance."""
+
+    def __init__(self, chunk, indels, distance):
+        regions = []
+        for row in indels:
+            # The number of bases covered (excluding the prefix)
+            # For ambigious indels (e.g. in low complexity regions), this ensures
+            # that the entire region is considered. Note that we do not need to
+            # consider the alternative sequence(s)
+            length = len(chunk.fields[row][3]) - 1
+
+            # Half-open interval of bases that should be blacklisted
+            # Note that pos is the base just before the insertion/deletion
+            start = chunk.positions[row] + 1 - distance
+            end = chunk.positions[row] + 2 + distance + length
 
+            regions.append(_IndelRegion(chunk.contigs[row], start, end, row))
+
+        self._index = BEDIndex(regions)
+
+    def overlapping(self, contig, position):
+        """Returns the rows of indels whose regions include 'position'."""
+        return [region.row for region in self._index.covering(contig, position)]
+
+
+def _filter_columns_by_properties(options, chunk, count):
+    """Filters the first 'count' SNPs/indels based on the various properties
+    recorded in the info column, and others. This mirrors most of the filtering
+    carried out by vcfutils.pl varFilter."""
+    if not count:
+        return
+
+    def _column(values):
+        return itertools.islice(values, count)
+
+    def _mark_below(values, threshold, filter_name):
+        selectors = map(operator.gt, itertools.repeat(threshold), _column(values))
+
+        chunk.mark_where(selectors, filter_name)
+
+    _mark_below(chunk.quals, options.min_quality, "q:%i" % options.min_quality)
+
+    min_depth = options.min_read_depth
+    max_depth = options.max_read_depth
+    depths = chunk.depths[:count]
+    _mark_below(depths, min_depth, "d:%i" % min_depth)
+    chunk.mark_where(
+        [min_depth <= depth and max_depth < depth for depth in depths],
+        "D:%i" % max_depth,
+    )
 
-def _mark_as_filtered(vcf, filter_name):
-    if vcf.filter in (".", "PASS"):
-        vcf.filter = filter_name
-        return True
-    elif filter_name not in vcf.filter.split(";"):
-        vcf.filter += ";" + filter_name
-        return True
+    min_mapq = options.min_mapping_quality
+    _mark_below(chunk.mapping_quals, min_mapq, "Q:%i" % min_mapq)
+
+    for idx, (column, min_pvalue) in enumerate(
+        zip(
+            chunk.pv4,
+            (
+                options.min_strand_bias,
+                options.min_baseq_bias,
+                options.min_mapq_bias,
+                options.min_end_distance_bias,
+            ),
+        ),
+        start=1,
+    ):
+        _mark_below(column, min_pvalue, "%i:%e" % (idx, min_pvalue))
+
+    min_alt_bases = options.min_num_alt_bases
+    _mark_below(chunk.alt_bases, min_alt_bases, "a:%i" % min_alt_bases)
+
+    if not options.keep_ambigious_genotypes:
+        # No most likely genotype
+        chunk.mark_where(_column(chunk.is_ambiguous), "k")
+
+    homozygous_chromosomes = frozenset(options.homozygous_chromosome)
+    if homozygous_chromosomes:
+        chunk.mark_where(
+            map(
+                operator.and_,
+                _column(chunk.is_heterozygous),
+                map(homozygous_chromosomes.__contains__, _column(chunk.contigs)),
+            ),
+            "HET",
+        )
+
+
+def _get_sample_pl(fields):
+    """Returns the PL value of the first sample; see 'vcfwrap.get_format'."""
+    return dict(zip(fields[8].split(":"), fields[9].split(":")))["PL"]
+
+
+def _add_filter(filters, filter_name):
+    """Returns the value of a FILTER column with 'filter_name' added."""
+    if filters in (".", "PASS"):
+        return filter_name
+    elif filter_name not in filters.split(";"):
+        return filters + ";" + filter_name
+
+    return filters
@@ -83,11 +83,17 @@ def get_ml_genotype(vcf, sample=0):
     """Returns the most likely genotype of a sample in a vcf record. If no
     single most likely genotype can be determined, the function returns 'N' for
     both bases."""
+    return get_ml_genotype_from_pl(vcf.ref, vcf.alt, get_format(vcf, sample)["PL"])
+
+
+def get_ml_genotype_from_pl(ref, alt, pl):
+    """Returns the most likely genotype given the REF and ALT columns of a VCF
+    record and the PL value of a sample (see 'get_ml_genotype')."""
     genotypes = []
-    genotypes.extend(vcf.ref.split(","))
-    genotypes.extend(vcf.alt.split(","))
+    genotypes.extend(ref.split(","))
+    genotypes.extend(alt.split(","))
 
-    PL = list(map(int, get_format(vcf, sample)["PL"].split(",")))
+    PL = list(map(int, pl.split(",")))
 
     if len(PL) == len(genotypes):
         ploidy = 1
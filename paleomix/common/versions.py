@@ -42,10 +42,20 @@ For example, to check that the Java version is v1.7 or later:
         obj()
     except VersionRequirementError:
         pass  # requirements not met, or failure to determine version
+
+The output of system calls may furthermore be cached on disk between runs using
+the 'prefetch' function (see VersionCache), which also carries out any
+remaining calls in parallel.
 """
+import json
 import operator
+import os
 import re
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
 
+from paleomix.common.jsoncache import JSONCache
 from paleomix.common.utilities import TotallyOrdered, safe_coerce_to_tuple, try_cast
 
 import paleomix.common.procs as procs
@@ -55,6 +65,10 @@ import paleomix.common.procs as procs
 _CALL_CACHE = {}
 # Cache used to store Requirement object
 _REQUIREMENT_CACHE = {}
+# Default location of the persistent cache of version calls; see VersionCache
+VERSION_CACHE = os.path.join(os.path.expanduser("~"), ".paleomix", "versions.json")
+# Max number of version calls carried out simultaneously by 'prefetch'
+_MAX_CONCURRENT_CALLS = 8
 
 
 class VersionRequirementError(Exception):
@@ -229,6 +243,83 @@ class RequirementObj:
             yield "    $ %s" % (" ".join(self._call),)
 
 
+class VersionCache(JSONCache):
+    """Persistent cache of the output of system calls used to determine versions.
+
+    Entries are keyed on the call and on the path and mtime of the executable,
+    so that different executables found via different PATHs are cached
+    separately, and are ignored if the inode, size, or mtime of the executable
+    or of any other files in the call (e.g. JAR files) have changed. Calls for
+    which the executable could not be found, and function calls, are never
+    cached. See 'prefetch' for the outputs that are cached.
+    """
+
+    DESCRIPTION = "version cache"
+
+    def get(self, call):
+        """Returns the cached output for a call, or None if the call has not been
+        cached or if any of the files involved in the call have changed."""
+        files = _cache_files(call)
+        if files is not None:
+            entry = super().get(_cache_key(call, files))
+            if entry is not None and entry["files"] == files:
+                return entry["output"]
+
+    def set(self, call, output):
+        files = _cache_files(call)
+        if files is not None:
+            if isinstance(output, bytes):
+                output = output.decode("utf-8", "replace")
+
+            entry = {"files": files, "output": output}
+            super().set(_cache_key(call, files), entry)
+
+
+def prefetch(requirements, cache_file=None):
+    """Determines the output of the calls used to check versions for the given
+    RequirementObjs, so that subsequent checks do not need to invoke any
+    external programs. Output is read from the VersionCache at 'cache_file',
+    if set, for unchanged executables, while remaining calls are carried out
+    in parallel and the results written to the cache.
+
+    Only output that matches the search string of every requirement using a
+    call is cached, and only if the call exited successfully. Calls without
+    arguments may exit with any (non-signal) return code, since many programs
+    (e.g. samtools and bwa) print their version as part of their usage, which
+    is accompanied by a non-zero return code.
+    """
+    calls = {}
+    for requirement in requirements:
+        call = requirement._call
+        if not (callable(call[0]) or call in _CALL_CACHE):
+            calls.setdefault(call, []).append(requirement)
+
+    if not calls:
+        return
+
+    cache = None if cache_file is None else VersionCache(cache_file)
+    if cache is not None:
+        for call in list(calls):
+            output = cache.get(call)
+            if output is not None:
+                _CALL_CACHE[call] = output
+                del calls[call]
+
+    pending = list(calls)
+    with ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_CALLS) as executor:
+        results = executor.map(_run_with_returncode, pending)
+        for (call, (output, returncode)) in zip(pending, results):
+            _CALL_CACHE[call] = output
+
+            if cache is not None and _is_cacheable(
+                call, calls[call], output, returncode
+            ):
+                cache.set(call, output)
+
+    if cache is not None:
+        cache.save()
+
+
 class Check(TotallyOrdered):
     """Abstract base-class for version checks.
 
@@ -400,6 +491,12 @@ def _run(call):
     resulting message is returned as a string. If the call raised an OSError,
     then the exception is returned as a value.
     """
+    return _run_with_returncode(call)[0]
+
+
+def _run_with_returncode(call):
+    """As '_run', but returns a tuple of the output and the return code of the
+    call; the return code is None if the call raised an OSError."""
     try:
         proc = procs.open_proc(
             call,
@@ -408,9 +505,9 @@ def _run(call):
             stderr=procs.STDOUT,
         )
 
-        return proc.communicate()[0]
+        return proc.communicate()[0], proc.returncode
     except OSError as error:
-        return error
+        return error, None
 
 
 def _do_call(call):
@@ -433,6 +530,53 @@ def _do_call(call):
     return result
 
 
+def _is_cacheable(call, requirements, output, returncode):
+    """Returns true if the output of a call may be stored in a VersionCache; see
+    'prefetch' for a description of the conditions for caching output."""
+    if returncode is None or returncode < 0:
+        return False
+    elif returncode and len(call) > 1:
+        return False
+
+    if isinstance(output, bytes):
+        output = output.decode("utf-8", "replace")
+
+    return all(requirement._rege.search(output) for requirement in requirements)
+
+
+def _cache_key(call, files):
+    """Returns a key for a call, given the list of files returned by
+    '_cache_files', the first of which is the executable."""
+    executable, _inode, _size, mtime = files[0]
+
+    return json.dumps([call, executable, mtime])
+
+
+def _cache_files(call):
+    """Returns a list of [path, inode, size, mtime] for the executable and for
+    any other files in a call, or None if the executable could not be found."""
+    executable = shutil.which(call[0])
+    if executable is None:
+        return None
+
+    filenames = [executable]
+    for value in call[1:]:
+        if isinstance(value, str) and os.path.isfile(value):
+            filenames.append(value)
+
+    files = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+
+        filename = os.path.realpath(filename)
+        files.append([filename, stat.st_ino, stat.st_size, stat.st_mtime_ns])
+
+    return files
+
+
 def _pprint_version(value):
     """Pretty-print version tuple; takes a tuple of field numbers / values,
     and returns it as a string joined by dots with a 'v' prepended.
@@ -19,7 +19,9 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import importlib
 import logging
+import os
 import sys
 
 import paleomix.common.system
@@ -44,12 +46,14 @@ _COMMANDS = {
     "cleanup": "paleomix.tools.cleanup",
     "coverage": "paleomix.tools.coverage",
     "depths": "paleomix.tools.depths",
+    "dupcheck": "paleomix.tools.dupcheck",
     # VCF/etc. tools
     "gtf_to_bed": "paleomix.tools.gtf_to_bed",
     "rmdup_collapsed": "paleomix.tools.rmdup_collapsed",
     "vcf_filter": "paleomix.tools.vcf_filter",
     "vcf_to_fasta": "paleomix.tools.vcf_to_fasta",
     # Misc tools
+    "run_log": "paleomix.tools.run_log",
     ":validate_fastq": "paleomix.tools.validate_fastq",
 }
 
@@ -70,6 +74,8 @@ BAM/SAM tools:
                                  or regions of interest.
     paleomix depths           -- Calculate depth histograms across reference
                                  sequences or regions of interest.
+    paleomix dupcheck         -- Identify reads included multiple times in a set
+                                 of sorted BAM files.
     paleomix rmdup_collapsed  -- Filters PCR duplicates for collapsed paired-
                                  ended reads generated by the AdapterRemoval
                                  tool.
@@ -82,14 +88,43 @@ VCF/GTF/BED/Pileup tools:
     paleomix vcf_to_fasta     -- Create most likely FASTA sequence from tabix-
                                  indexed VCF file.
 
+Misc tools:
+    paleomix run_log          -- Summarize resources used by pipeline tasks, as
+                                 recorded using the --run-log option.
+
 If you make use of PALEOMIX in your work, please cite
   Schubert et al, "Characterization of ancient and modern genomes by SNP
   detection and phylogenomic and metagenomic analysis using PALEOMIX".
   Nature Protocols. 2014 May; 9(5): 1056-82. doi: 10.1038/nprot.2014.063
+
+To measure the time spent importing modules when running a command, use
+    paleomix --profile-imports <command> [...]
+or set the PALEOMIX_PROFILE_IMPORTS environment variable to the path of a file
+to which reports are appended for every command run, including by pipelines.
 """
 
+# Number of modules listed in import-time reports
+_PROFILE_IMPORTS_TOP = 25
+
 
 def main(argv):
+    profiler = None
+    report_file = os.environ.get("PALEOMIX_PROFILE_IMPORTS")
+    if argv and argv[0] == "--profile-imports":
+        argv = argv[1:]
+        report_file = None
+        profiler = _start_import_profiler()
+    elif report_file:
+        profiler = _start_import_profiler()
+
+    try:
+        return _main(argv)
+    finally:
+        if profiler is not None:
+            _report_import_times(profiler, argv, report_file)
+
+
+def _main(argv):
     # Change process name from 'python' to 'paleomix'
     paleomix.common.system.set_procname("paleomix")
     # Setup basic logging to STDERR
@@ -102,15 +137,54 @@ def main(argv):
         print("paleomix v{}".format(paleomix.__version__))
         return 0
 
-    command = _COMMANDS.get(argv[0])
+    command = _load_command(argv[0])
     if command is None:
         log = logging.getLogger(__name__)
         log.error("Unknown command %r", argv[0])
         return 1
 
-    module = __import__(command, fromlist=["main"])
+    return command(argv[1:])
+
+
+def _load_command(name):
+    """Returns the 'main' function of a command, or None if the command is not
+    known. Modules are only imported on demand, so that running a command does
+    not incur the cost of importing the modules used by all other commands."""
+    module = _COMMANDS.get(name)
+    if module is None:
+        return None
+
+    return importlib.import_module(module).main
+
+
+def _start_import_profiler():
+    from paleomix.common.importtime import ImportProfiler
 
-    return module.main(argv[1:])
+    profiler = ImportProfiler()
+    profiler.install()
+
+    return profiler
+
+
+def _report_import_times(profiler, argv, filename=None):
+    profiler.uninstall()
+
+    from paleomix.common.text import padded_table
+
+    lines = ["Import times for 'paleomix %s' (pid %i):" % (" ".join(argv), os.getpid())]
+    lines.extend(padded_table(profiler.report(top=_PROFILE_IMPORTS_TOP)))
+    text = "\n".join(lines) + "\n"
+
+    if filename is None:
+        sys.stderr.write(text)
+        return
+
+    try:
+        with open(filename, "a") as handle:
+            handle.write(text)
+    except OSError as error:
+        log = logging.getLogger(__name__)
+        log.warning("Could not write import-time report to %r: %s", filename, error)
 
 
 def entry_point():
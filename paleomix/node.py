@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import hashlib
 import os
 import sys
 import traceback
@@ -58,6 +59,7 @@ class Node:
         auxiliary_files=(),
         requirements=(),
         dependencies=(),
+        memory=None,
     ):
 
         if not isinstance(description, _DESC_TYPES):
@@ -74,6 +76,8 @@ class Node:
         self.requirements = self._validate_requirements(requirements)
 
         self.threads = self._validate_nthreads(threads)
+        # Approximate max memory usage in bytes, if known, used during scheduling
+        self.memory = self._validate_memory(memory)
         self.dependencies = self._collect_nodes(dependencies)
 
         # If there are no input files, the node cannot be re-run based on
@@ -146,6 +150,13 @@ class Node:
     def _teardown(self, _config, _temp):
         self._check_for_missing_files(self.output_files, "output")
 
+    @property
+    def max_rss(self):
+        """Peak resident set size (in bytes) of processes run by the last call to
+        'run', or None if unknown. Memory used by the node itself is not included,
+        since the peak RSS of the (long-lived) worker process cannot be reset."""
+        return None
+
     def __str__(self):
         """Returns the description passed to the constructor, or a default
         description if no description was passed to the constructor."""
@@ -153,6 +164,27 @@ class Node:
             return self.__description
         return repr(self)
 
+    @property
+    def fingerprint(self):
+        """Returns a hex-digest summarizing the task carried out by this node,
+        but not the contents of the files involved. This is used to detect
+        changes to options, etc. between runs of a pipeline."""
+        values = repr(self._get_fingerprint_values()).encode("utf-8")
+
+        return hashlib.sha256(values).hexdigest()
+
+    def _get_fingerprint_values(self):
+        """Returns a list of values that (together with the input files) should
+        uniquely determine the output of the node. Subclasses are expected to
+        add any option that is not otherwise represented."""
+        return [
+            "%s.%s" % (self.__class__.__module__, self.__class__.__name__),
+            self.__description,
+            sorted(self.input_files),
+            sorted(self.output_files),
+            sorted(self.auxiliary_files),
+        ]
+
     def __getstate__(self):
         """Called by pickle/cPickle to determine what to pickle; this is
         overridden to avoid pickling of requirements, dependencies, which would
@@ -176,6 +208,7 @@ class Node:
             "PATH             = %r" % (os.environ.get("PATH", ""),),
             "Node             = %s" % (str(self),),
             "Threads          = %i" % (self.threads,),
+            "Memory           = %s" % (self.memory,),
             "Input files      = %s" % (_fmt(self.input_files),),
             "Output files     = %s" % (_fmt(self.output_files),),
             "Auxiliary files  = %s" % (_fmt(self.auxiliary_files),),
@@ -250,9 +283,26 @@ class Node:
             )
         return threads
 
+    @classmethod
+    def _validate_memory(cls, memory):
+        if memory is None:
+            return None
+        elif not isinstance(memory, int):
+            raise TypeError(
+                "'memory' must be None or a positive integer, not a %s"
+                % (type(memory),)
+            )
+        elif memory < 1:
+            raise ValueError(
+                "'memory' must be None or a positive integer, not %i" % (memory,)
+            )
+        return memory
+
 
 class CommandNode(Node):
-    def __init__(self, command, description=None, threads=1, dependencies=()):
+    def __init__(
+        self, command, description=None, threads=1, dependencies=(), memory=None
+    ):
         Node.__init__(
             self,
             description=description,
@@ -263,10 +313,16 @@ class CommandNode(Node):
             requirements=command.requirements,
             threads=threads,
             dependencies=dependencies,
+            memory=memory,
         )
 
         self._command = command
 
+    def _get_fingerprint_values(self):
+        values = Node._get_fingerprint_values(self)
+        values.append(self._command.to_call("${TEMP_DIR}"))
+        return values
+
     def _run(self, _config, temp):
         """Runs the command object provided in the constructor, and waits for it to
         terminate. If any errors during the running of the command, this function
@@ -280,6 +336,11 @@ class CommandNode(Node):
         if any(return_codes):
             raise CmdNodeError(str(self._command))
 
+    @property
+    def max_rss(self):
+        """Peak RSS (in bytes) of the command run by the last call to 'run'."""
+        return self._command.max_rss
+
     def _teardown(self, config, temp):
         required_files = self._command.expected_temp_files
         optional_files = self._command.optional_temp_files
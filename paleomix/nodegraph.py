@@ -22,9 +22,12 @@
 #
 import collections
 import errno
+import heapq
 import logging
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+
 import paleomix.common.versions as versions
 
 from paleomix.common.fileutils import reroot_path, missing_executables
@@ -33,14 +36,17 @@ from paleomix.common.utilities import safe_coerce_to_frozenset
 
 # Max number of error messages of each type
 _MAX_ERROR_MESSAGES = 10
+# Number of threads used to stat files in FileStatusCache.prefetch
+_PREFETCH_THREADS = 16
+# Number of files stat'ed per task in FileStatusCache.prefetch
+_PREFETCH_CHUNK_SIZE = 1024
 
 
 class FileStatusCache:
     """Cache used to avoid repeatedly checking the state (existance / mtime) of
-    files required / generated by nodes. A new cache is generated for every
-    operation (e.g. refreshing all states / manually setting the state of a
-    node) to avoid relying on the filesystem staying consistant for long
-    periods of time.
+    files required / generated by nodes. A cache is generated when all states are
+    refreshed, and is kept while the pipeline is running; files generated by nodes
+    are invalidated when those nodes are completed (see 'invalidate').
     """
 
     def __init__(self):
@@ -73,6 +79,20 @@ class FileStatusCache:
 
         return max(input_timestamps) > min(output_timestamps)
 
+    def is_node_outdated(self, node):
+        """Returns true if the output files of a node are outdated, as determined by
+        'are_files_outdated'."""
+        return self.are_files_outdated(node.input_files, node.output_files)
+
+    def record_node(self, node):
+        """Called when a node has been completed; timestamps are stored by the file
+        system, so there is nothing to record here."""
+
+    def pop_unrecorded_nodes(self):
+        """Returns (and forgets) the nodes found to be up-to-date, for which
+        'record_node' should be called; this is never needed for timestamps."""
+        return []
+
     def _get_states(self, filenames, dst):
         """Collects the mtimes for a set of filenames, returning true if all
         could be collected, and aborting early and returning false otherwise.
@@ -86,18 +106,129 @@ class FileStatusCache:
 
         return True
 
-    def _get_state(self, fpath):
-        """Returns the mtime of a path, or None if the path does not exist."""
+    def prefetch(self, fpaths):
+        """Collects the state of a set of files using multiple threads. Checking
+        files is dominated by latency on network file-systems, so doing so in
+        parallel greatly reduces the time needed to check large pipelines.
+        """
+        fpaths = [fpath for fpath in set(fpaths) if fpath not in self._stat_cache]
+        chunks = [
+            fpaths[idx : idx + _PREFETCH_CHUNK_SIZE]
+            for idx in range(0, len(fpaths), _PREFETCH_CHUNK_SIZE)
+        ]
+
+        if len(chunks) > 1:
+            with ThreadPoolExecutor(_PREFETCH_THREADS) as executor:
+                for chunk, stats in zip(chunks, executor.map(_stat_files, chunks)):
+                    self._stat_cache.update(zip(chunk, stats))
+        elif chunks:
+            self._stat_cache.update(zip(chunks[0], _stat_files(chunks[0])))
+
+    def invalidate(self, fpaths):
+        """Removes cached information about a set of files, e.g. the output files
+        of a node that has just been completed."""
+        for fpath in fpaths:
+            self._stat_cache.pop(fpath, None)
+
+    def get_stat(self, fpath):
+        """Returns the os.stat_result for a path, or None if it does not exist."""
         if fpath not in self._stat_cache:
-            try:
-                mtime = os.path.getmtime(fpath)
-            except OSError as error:
-                if error.errno != errno.ENOENT:
-                    raise
-                mtime = None
-            self._stat_cache[fpath] = mtime
+            (self._stat_cache[fpath],) = _stat_files((fpath,))
         return self._stat_cache[fpath]
 
+    def _get_state(self, fpath):
+        """Returns the mtime of a path, or None if the path does not exist."""
+        stat = self.get_stat(fpath)
+        if stat is None:
+            return None
+
+        return stat.st_mtime
+
+
+class ChecksumStatusCache(FileStatusCache):
+    """Cache used to determine if nodes are outdated based on the checksums of their
+    input and output files and on the fingerprint of the node (see Node.fingerprint),
+    instead of on timestamps. Checksums are stored in a StateDatabase when a node is
+    completed, and a node is only outdated if the contents of one or more files, or
+    the command itself, has changed since then.
+
+    The size and mtime of each file is recorded along with the checksums, and only
+    nodes with files that differ from the recorded values are checked in detail.
+
+    Nodes for which no record exists (e.g. nodes run without checksums enabled) are
+    checked using timestamps. Nodes found to be up-to-date are not recorded here, as
+    that requires calculating the checksums of all their files, but are instead
+    returned by 'pop_unrecorded_nodes', allowing these to be recorded elsewhere.
+    """
+
+    def __init__(self, database):
+        FileStatusCache.__init__(self)
+        self._database = database
+        self._checksums = {}
+        self._unrecorded_nodes = []
+
+    def is_node_outdated(self, node):
+        record = self._database.get_node(node)
+        if record is None:
+            if FileStatusCache.is_node_outdated(self, node):
+                return True
+
+            self._unrecorded_nodes.append(node)
+            return False
+
+        fingerprint, files = record
+        if fingerprint != node.fingerprint:
+            return True
+        elif files.keys() != (node.input_files | node.output_files):
+            return True
+
+        dirty_files = []
+        for filename, (size, mtime, digest) in files.items():
+            stat = self.get_stat(filename)
+            if stat is None:
+                return True
+            elif (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                dirty_files.append((filename, (size, digest)))
+
+        for filename, checksum in dirty_files:
+            if self._get_checksum(filename) != checksum:
+                return True
+
+        return False
+
+    def record_node(self, node):
+        files = {}
+        for filename in node.input_files | node.output_files:
+            stat = self.get_stat(filename)
+            if stat is None:
+                # Missing files are reported elsewhere
+                return
+
+            size, digest = self._get_checksum(filename)
+            files[filename] = (size, stat.st_mtime_ns, digest)
+
+        self._database.set_node(node, files)
+
+    def pop_unrecorded_nodes(self):
+        nodes, self._unrecorded_nodes = self._unrecorded_nodes, []
+
+        return nodes
+
+    def invalidate(self, fpaths):
+        FileStatusCache.invalidate(self, fpaths)
+        for fpath in fpaths:
+            self._checksums.pop(fpath, None)
+
+    def _get_checksum(self, filename):
+        """Returns a tuple of (size, digest), or None if the file does not exist."""
+        if filename not in self._checksums:
+            stat = self.get_stat(filename)
+            if stat is not None:
+                stat = self._database.get_checksum(filename, stat)
+
+            self._checksums[filename] = stat
+        return self._checksums[filename]
+
 
 class NodeGraphError(RuntimeError):
     pass
@@ -107,28 +238,36 @@ class NodeGraph:
     NUMBER_OF_STATES = 6
     DONE, RUNNING, RUNABLE, QUEUED, OUTDATED, ERROR = range(NUMBER_OF_STATES)
 
-    def __init__(self, nodes, cache_factory=FileStatusCache):
+    def __init__(self, nodes, cache_factory=FileStatusCache, version_cache=None):
+        """Arguments:
+          nodes -- One or more (top-level) nodes.
+          cache_factory -- Function returning a FileStatusCache (or subclass).
+          version_cache -- Optional path to a persistent cache of version checks;
+                           see paleomix.common.versions.VersionCache.
+        """
         self._cache_factory = cache_factory
+        self._cache = None
         self._states = {}
 
         nodes = safe_coerce_to_frozenset(nodes)
 
         self._logger = logging.getLogger(__name__)
-        self._reverse_dependencies = collections.defaultdict(set)
-        self._collect_reverse_dependencies(nodes, self._reverse_dependencies, set())
-        self._intersections = {}
+        self._reverse_dependencies = self._collect_reverse_dependencies(nodes)
         self._top_nodes = [
             node
             for (node, rev_deps) in self._reverse_dependencies.items()
             if not rev_deps
         ]
+        self._order = self._topological_order(self._reverse_dependencies)
+        # Number of dependencies in each state, for each node
+        self._dependency_states = {}
 
         self._logger.info("Checking file dependencies")
         self._check_file_dependencies(self._reverse_dependencies)
         self._logger.info("Checking for required executables")
         self._check_required_executables(self._reverse_dependencies)
         self._logger.info("Checking version requirements")
-        self._check_version_requirements(self._reverse_dependencies)
+        self._check_version_requirements(self._reverse_dependencies, version_cache)
         self._logger.info("Determining states")
         self.refresh_states()
         self._logger.info("Ready")
@@ -146,31 +285,31 @@ class NodeGraph:
         self._states[node] = state
         self._notify_state_observers(node, old_state, state)
 
-        intersections = self._calculate_intersections(node)
-
-        # Not all nodes may need to be updated, but we still need to
-        # traverse the "graph" (using the intersection counts) in order
-        # to ensure that all nodes that need to be updated are updated.
-        requires_update = dict.fromkeys(intersections, False)
-        for dependency in self._reverse_dependencies[node]:
-            requires_update[dependency] = True
-
-        cache = self._cache_factory()
-        while any(requires_update.values()):
-            for (node, count) in tuple(intersections.items()):
-                if not count:
-                    has_changed = False
-                    if requires_update[node]:
-                        old_state = self._states.pop(node)
-                        new_state = self._update_node_state(node, cache)
-                        has_changed |= new_state != old_state
-
-                    for dependency in self._reverse_dependencies[node]:
-                        intersections[dependency] -= 1
-                        requires_update[dependency] |= has_changed
+        if state == NodeGraph.DONE:
+            # Only files generated by the node are expected to have changed
+            self._cache.invalidate(node.output_files)
+            self._cache.record_node(node)
+
+        # Nodes are updated in topological order, so that every node is updated
+        # at most once, and only if the state of a dependency has changed
+        queue, queued = [], set()
+        self._update_dependency_states(queue, queued, node, old_state, state)
+        while queue:
+            _, node = heapq.heappop(queue)
+            queued.remove(node)
+
+            old_state = self._states[node]
+            new_state = self._evaluate_node_state(node, self._cache)
+            if new_state != old_state:
+                self._states[node] = new_state
+                self._update_dependency_states(
+                    queue, queued, node, old_state, new_state
+                )
 
-                    intersections.pop(node)
-                    requires_update.pop(node)
+    def pop_unrecorded_nodes(self):
+        """Returns (and forgets) the up-to-date nodes that have not been recorded
+        by the status cache; see ChecksumStatusCache."""
+        return self._cache.pop_unrecorded_nodes()
 
     def __iter__(self):
         """Returns a graph of nodes."""
@@ -180,14 +319,42 @@ class NodeGraph:
         return iter(self._reverse_dependencies)
 
     def refresh_states(self):
+        """Determines the state of every node using a new FileStatusCache; nodes
+        that are running or that have failed retain their state."""
         states = {}
-        cache = self._cache_factory()
         for (node, state) in self._states.items():
             if state in (self.ERROR, self.RUNNING):
                 states[node] = state
         self._states = states
+        self._cache = cache = self._cache_factory()
+
+        filenames = []
         for node in self._reverse_dependencies:
-            self._update_node_state(node, cache)
+            filenames.extend(node.input_files)
+            filenames.extend(node.output_files)
+        cache.prefetch(filenames)
+
+        self._dependency_states = {}
+        for node in self._order:
+            counts = [0] * NodeGraph.NUMBER_OF_STATES
+            for dependency in node.dependencies:
+                counts[self._states[dependency]] += 1
+            self._dependency_states[node] = counts
+
+            if node not in self._states:
+                self._states[node] = self._evaluate_node_state(node, cache)
+
+    def _update_dependency_states(self, queue, queued, node, old_state, new_state):
+        """Updates the counts of dependency states for nodes depending on 'node',
+        and schedules those nodes for re-evaluation."""
+        for dependent in self._reverse_dependencies[node]:
+            counts = self._dependency_states[dependent]
+            counts[old_state] -= 1
+            counts[new_state] += 1
+
+            if dependent not in queued:
+                queued.add(dependent)
+                heapq.heappush(queue, (self._order[dependent], dependent))
 
     def _notify_state_observers(self, node, _old_state, new_state):
         if new_state == self.RUNNING:
@@ -195,34 +362,16 @@ class NodeGraph:
         elif new_state == self.DONE:
             self._logger.info("Finished node %s", node)
 
-    def _calculate_intersections(self, for_node):
-        def count_nodes(node, counts):
-            for node in self._reverse_dependencies[node]:
-                if node in counts:
-                    counts[node] += 1
-                else:
-                    counts[node] = 1
-                    count_nodes(node, counts)
-            return counts
-
-        if for_node not in self._intersections:
-            counts = count_nodes(for_node, {})
-            for dependency in self._reverse_dependencies[for_node]:
-                counts[dependency] -= 1
-            self._intersections[for_node] = counts
-
-        return dict(self._intersections[for_node])
-
-    def _update_node_state(self, node, cache):
-        if node in self._states:
-            return self._states[node]
-
-        # Update sub-nodes before checking for fixed states
-        dependency_states = set((NodeGraph.DONE,))
-        for dependency in node.dependencies:
-            dependency_states.add(self._update_node_state(dependency, cache))
-
-        state = max(dependency_states)
+    def _evaluate_node_state(self, node, cache):
+        """Returns the state of a node, based on the states of its dependencies
+        (which must have been determined already) and on the node's files."""
+        counts = self._dependency_states[node]
+        state = NodeGraph.DONE
+        for other_state in range(NodeGraph.NUMBER_OF_STATES - 1, state, -1):
+            if counts[other_state]:
+                state = other_state
+                break
+
         if state == NodeGraph.DONE:
             if not self.is_done(node, cache):
                 state = NodeGraph.RUNABLE
@@ -247,7 +396,6 @@ class NodeGraph:
                 state = NodeGraph.OUTDATED
             else:
                 state = NodeGraph.QUEUED
-        self._states[node] = state
 
         return state
 
@@ -263,13 +411,14 @@ class NodeGraph:
     def is_outdated(cls, node, cache):
         """Returns true if the not is not done or if one or more of the input
         files appear to have been changed since the creation of the output
-        files (based on the timestamps). A node that lacks either input or
-        output files is never considered outdated.
+        files (based on the timestamps or checksums, depending on the cache).
+        A node that lacks either input or output files is never considered
+        outdated.
         """
         if not (node.input_files and node.output_files):
             return False
 
-        return cache.are_files_outdated(node.input_files, node.output_files)
+        return cache.is_node_outdated(node)
 
     @classmethod
     def _check_required_executables(cls, nodes):
@@ -291,11 +440,14 @@ class NodeGraph:
                 % ("\n\t".join(sorted(missing_exec)))
             )
 
-    def _check_version_requirements(self, nodes):
+    def _check_version_requirements(self, nodes, version_cache=None):
         exec_requirements = set()
         for node in nodes:
             exec_requirements.update(node.requirements)
 
+        # Run (uncached) version checks in parallel
+        versions.prefetch(exec_requirements, version_cache)
+
         def _key_func(reqobj):
             # Sort priority in decreasing order, name in increasing order
             return (-reqobj.priority, reqobj.name)
@@ -387,14 +539,12 @@ class NodeGraph:
 
     @classmethod
     def _check_input_dependencies(cls, input_files, output_files, nodes):
-        dependencies = cls._collect_dependencies(nodes, {})
-
         for (filename, nodes) in sorted(input_files.items(), key=lambda v: v[0]):
             if filename in output_files:
                 producers = output_files[filename]
                 bad_nodes = set()
                 for consumer in nodes:
-                    if not (producers & dependencies[consumer]):
+                    if not cls._depends_on(consumer, producers):
                         bad_nodes.add(consumer)
 
                 if bad_nodes:
@@ -418,36 +568,87 @@ class NodeGraph:
                 )
 
     @classmethod
-    def _collect_dependencies(cls, nodes, dependencies):
-        for node in nodes:
-            if node not in dependencies:
-                subnodes = node.dependencies
-                if not subnodes:
-                    dependencies[node] = frozenset()
-                    continue
+    def _depends_on(cls, node, others):
+        """Returns true if 'node' depends (directly or indirectly) on any node in
+        'others'; the graph is traversed iteratively, starting with the direct
+        dependencies, which are typically sufficient."""
+        if not others.isdisjoint(node.dependencies):
+            return True
+
+        visited = set()
+        stack = list(node.dependencies)
+        while stack:
+            node = stack.pop()
+            if node not in visited:
+                visited.add(node)
 
-                cls._collect_dependencies(subnodes, dependencies)
+                if not others.isdisjoint(node.dependencies):
+                    return True
 
-                collected = set(subnodes)
-                for subnode in subnodes:
-                    collected.update(dependencies[subnode])
-                dependencies[node] = frozenset(collected)
+                stack.extend(node.dependencies)
 
-        return dependencies
+        return False
 
     @classmethod
-    def _collect_reverse_dependencies(cls, lst, rev_dependencies, processed):
-        for node in lst:
+    def _collect_reverse_dependencies(cls, nodes):
+        """Returns a dictionary of nodes to the set of nodes depending on them."""
+        rev_dependencies = collections.defaultdict(set)
+        processed = set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
             if node not in processed:
                 processed.add(node)
 
                 # Initialize default-dict
                 rev_dependencies[node]
 
-                subnodes = node.dependencies
-                for dependency in subnodes:
+                for dependency in node.dependencies:
                     rev_dependencies[dependency].add(node)
-                cls._collect_reverse_dependencies(subnodes, rev_dependencies, processed)
+                    stack.append(dependency)
+
+        return rev_dependencies
+
+    @classmethod
+    def _topological_order(cls, rev_dependencies):
+        """Returns a dictionary of nodes to their indices in a topological order,
+        in which every node is placed after all of its dependencies."""
+        remaining = {}
+        ready = []
+        for node in rev_dependencies:
+            remaining[node] = len(node.dependencies)
+            if not node.dependencies:
+                ready.append(node)
+
+        order = {}
+        while ready:
+            node = ready.pop()
+            order[node] = len(order)
+
+            for dependent in rev_dependencies[node]:
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    ready.append(dependent)
+
+        if len(order) != len(rev_dependencies):
+            raise NodeGraphError("Cycle detected in dependency graph")
+
+        return order
+
+
+def _stat_files(fpaths):
+    """Returns a list of os.stat_result objects for each path, with None for paths
+    that do not exist."""
+    stats = []
+    for fpath in fpaths:
+        try:
+            stats.append(os.stat(fpath))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            stats.append(None)
+
+    return stats
 
 
 def _summarize_nodes(nodes):
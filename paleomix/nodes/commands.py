@@ -27,13 +27,17 @@ Each node is equivalent to a particular command:
 """
 from paleomix.node import CommandNode, Node
 from paleomix.atomiccmd.command import AtomicCmd
-from paleomix.atomiccmd.sets import ParallelCmds
+from paleomix.atomiccmd.sets import ParallelCmds, SequentialCmds
 from paleomix.atomiccmd.builder import (
     AtomicCmdBuilder,
     apply_options,
 )
 from paleomix.common.fileutils import describe_files, reroot_path, move_file
-from paleomix.nodes.samtools import merge_bam_files_command, BCFTOOLS_VERSION
+from paleomix.nodes.samtools import (
+    merge_bam_files_command,
+    BCFTOOLS_VERSION,
+    SAMTOOLS_VERSION,
+)
 
 import paleomix.tools.bam_stats.coverage as coverage
 import paleomix.tools.factory as factory
@@ -41,7 +45,13 @@ import paleomix.tools.factory as factory
 
 class CoverageNode(CommandNode):
     def __init__(
-        self, target_name, input_file, output_file, regions_file=None, dependencies=()
+        self,
+        target_name,
+        input_file,
+        output_file,
+        regions_file=None,
+        threads=1,
+        dependencies=(),
     ):
         builder = factory.new("coverage")
         builder.add_value("%(IN_BAM)s")
@@ -49,6 +59,9 @@ class CoverageNode(CommandNode):
         builder.set_option("--target-name", target_name)
         builder.set_kwargs(IN_BAM=input_file, OUT_FILE=output_file)
 
+        if threads > 1:
+            builder.set_option("--threads", threads)
+
         if regions_file:
             builder.set_option("--regions-file", "%(IN_REGIONS)s")
             builder.set_kwargs(IN_REGIONS=regions_file)
@@ -58,6 +71,7 @@ class CoverageNode(CommandNode):
             self,
             command=builder.finalize(),
             description=description,
+            threads=threads,
             dependencies=dependencies,
         )
 
@@ -92,21 +106,25 @@ class DepthHistogramNode(CommandNode):
         output_file,
         prefix,
         regions_file=None,
+        threads=1,
         dependencies=(),
     ):
-        index_format = regions_file and prefix["IndexFormat"]
-
         builder = factory.new("depths")
         builder.add_value("%(IN_BAM)s")
         builder.add_value("%(OUT_FILE)s")
         builder.set_option("--target-name", target_name)
         builder.set_kwargs(OUT_FILE=output_file, IN_BAM=input_file)
 
+        if threads > 1:
+            builder.set_option("--threads", threads)
+
         if regions_file:
             builder.set_option("--regions-file", "%(IN_REGIONS)s")
-            builder.set_kwargs(
-                IN_REGIONS=regions_file, TEMP_IN_INDEX=input_file + index_format
-            )
+            builder.set_kwargs(IN_REGIONS=regions_file)
+
+        if regions_file or threads > 1:
+            # The index is required for random access to the BAM file
+            builder.set_kwargs(TEMP_IN_INDEX=input_file + prefix["IndexFormat"])
 
         description = "<DepthHistogram: %s -> '%s'>" % (input_file, output_file,)
 
@@ -114,27 +132,60 @@ class DepthHistogramNode(CommandNode):
             self,
             command=builder.finalize(),
             description=description,
+            threads=threads,
             dependencies=dependencies,
         )
 
 
 class FilterCollapsedBAMNode(CommandNode):
     def __init__(
-        self, config, input_bams, output_bam, keep_dupes=True, dependencies=()
+        self,
+        config,
+        input_bams,
+        output_bam,
+        keep_dupes=True,
+        threads=1,
+        dependencies=(),
     ):
-        merge = merge_bam_files_command(input_bams)
-
         builder = factory.new("rmdup_collapsed")
-        builder.set_kwargs(IN_STDIN=merge, OUT_STDOUT=output_bam)
+        builder.set_kwargs(OUT_STDOUT=output_bam)
 
         if not keep_dupes:
             builder.set_option("--remove-duplicates")
 
-        description = "<FilterCollapsedBAM: %s>" % (describe_files(merge.input_files),)
+        if threads > 1:
+            # Windows of the BAM are processed in parallel, which requires that the
+            # input BAMs are merged into a single, indexed BAM file
+            merge = AtomicCmdBuilder(
+                ["samtools", "merge", "-u", "%(TEMP_OUT_BAM)s"],
+                TEMP_OUT_BAM="merged.bam",
+                CHECK_VERSION=SAMTOOLS_VERSION,
+            )
+            merge.add_multiple_values(input_bams)
+
+            index = AtomicCmd(
+                ["samtools", "index", "%(TEMP_IN_BAM)s"],
+                TEMP_IN_BAM="merged.bam",
+                TEMP_OUT_INDEX="merged.bam.bai",
+            )
+
+            builder.set_option("--threads", threads)
+            builder.add_value("%(TEMP_IN_BAM)s")
+            builder.set_kwargs(TEMP_IN_BAM="merged.bam", TEMP_IN_INDEX="merged.bam.bai")
+
+            command = SequentialCmds([merge.finalize(), index, builder.finalize()])
+        else:
+            merge = merge_bam_files_command(input_bams)
+            builder.set_kwargs(IN_STDIN=merge)
+
+            command = ParallelCmds([merge, builder.finalize()])
+
+        description = "<FilterCollapsedBAM: %s>" % (describe_files(input_bams),)
         CommandNode.__init__(
             self,
-            command=ParallelCmds([merge, builder.finalize()]),
+            command=command,
             description=description,
+            threads=threads,
             dependencies=dependencies,
         )
 
@@ -213,11 +264,22 @@ class GenotypeRegionsNode(CommandNode):
 
 
 class BuildRegionsNode(CommandNode):
-    def __init__(self, infile, bedfile, outfile, padding, options={}, dependencies=()):
+    def __init__(
+        self,
+        infile,
+        bedfile,
+        outfile,
+        padding,
+        options={},
+        threads=1,
+        dependencies=(),
+    ):
         params = factory.new("vcf_to_fasta")
         params.set_option("--padding", padding)
         params.set_option("--genotype", "%(IN_VCFFILE)s")
         params.set_option("--intervals", "%(IN_INTERVALS)s")
+        if threads > 1:
+            params.set_option("--threads", threads)
 
         params.set_kwargs(
             IN_VCFFILE=infile,
@@ -233,6 +295,7 @@ class BuildRegionsNode(CommandNode):
             self,
             description=description,
             command=params.finalize(),
+            threads=threads,
             dependencies=dependencies,
         )
 
@@ -24,7 +24,7 @@ import copy
 
 from paleomix.node import Node
 from paleomix.common.fileutils import move_file, reroot_path
-from paleomix.common.formats.msa import MSA
+from paleomix.common.formats.msa import MSA, MSAMatrix
 from paleomix.common.formats.phylip import interleaved_phy
 
 from paleomix.common.utilities import safe_coerce_to_frozenset, safe_coerce_to_tuple
@@ -94,12 +94,13 @@ class FastaToPartitionedInterleavedPhyNode(Node):
                 if self._excluded:
                     msa = msa.exclude(self._excluded)
 
-                for (key, msa_part) in msa.split(partitions).items():
+                matrix = MSAMatrix.from_msa(msa)
+                for (key, msa_part) in matrix.split(partitions).items():
                     msas[key].append(msa_part)
 
             msas.pop("X", None)
             for (key, msa_parts) in sorted(msas.items()):
-                merged_msa = MSA.join(*msa_parts)
+                merged_msa = MSAMatrix.join(*msa_parts)
                 if self._reduce:
                     merged_msa = merged_msa.reduce()
 
@@ -108,8 +109,8 @@ class FastaToPartitionedInterleavedPhyNode(Node):
 
         out_fname_phy = reroot_path(temp, self._out_prefix + ".phy")
         with open(out_fname_phy, "w") as output_phy:
-            final_msa = MSA.join(*(msa for (_, msa) in merged_msas))
-            output_phy.write(interleaved_phy(final_msa))
+            final_msa = MSAMatrix.join(*(msa for (_, msa) in merged_msas))
+            output_phy.write(interleaved_phy(final_msa.to_msa()))
 
         partition_end = 0
         out_fname_parts = reroot_path(temp, self._out_prefix + ".partitions")
@@ -40,6 +40,16 @@ class PicardNode(CommandNode):
     performance issues if these are located in the same folder.
     """
 
+    def __init__(self, command, description=None, threads=1, dependencies=()):
+        CommandNode.__init__(
+            self,
+            command=command,
+            description=description,
+            threads=threads,
+            dependencies=dependencies,
+            memory=_get_max_heap_size(command),
+        )
+
     def _teardown(self, config, temp):
         # Picard creates a folder named after the user in the temp-root
         try_rmtree(os.path.join(temp, getpass.getuser()))
@@ -196,6 +206,19 @@ def picard_command(config, command):
     return params
 
 
+def _get_max_heap_size(command):
+    """Returns the max heap size (-Xmx) in bytes for the java command, or None if
+    this was not set. Memory usage of the JVM will be somewhat greater than this.
+    """
+    heap_size = None
+    for field in command.to_call("${TEMP_DIR}"):
+        # The last -Xmx option is the one used by the JRE
+        if field.startswith("-Xmx"):
+            heap_size = paleomix.common.system.parse_memory_size(field[4:])
+
+    return heap_size
+
+
 # Fraction of per-process max open files to use
 _FRAC_MAX_OPEN_FILES = 0.95
 # Default maximum number of open temporary files used by Picard
@@ -31,7 +31,7 @@ import paleomix.common.fileutils as fileutils
 import paleomix.common.utilities as utilities
 
 from paleomix.common.formats.fasta import FASTA
-from paleomix.common.formats.msa import MSA
+from paleomix.common.formats.msa import MSA, MSAMatrix
 from paleomix.node import NodeError, Node
 
 
@@ -132,11 +132,11 @@ class FilterSingletonsNode(Node):
         )
 
     def _run(self, _config, temp):
-        alignment = MSA.from_file(self._input_file)
+        alignment = MSAMatrix.from_msa(MSA.from_file(self._input_file))
         for (to_filter, groups) in self._filter_by.items():
             alignment = alignment.filter_singletons(to_filter, groups)
 
         temp_filename = fileutils.reroot_path(temp, self._output_file)
         with open(temp_filename, "w") as handle:
-            alignment.to_file(handle)
+            alignment.to_msa().to_file(handle)
         fileutils.move_file(temp_filename, self._output_file)
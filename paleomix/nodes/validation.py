@@ -21,19 +21,29 @@
 # SOFTWARE.
 #
 import collections
+import mmap
+import multiprocessing
 import os
 import re
 
 import pysam
 
 from paleomix.node import CommandNode, Node, NodeError
-from paleomix.common.fileutils import describe_files, make_dirs
+from paleomix.common.fileutils import calculate_checksum, describe_files, make_dirs
+from paleomix.common.jsoncache import JSONCache
+from paleomix.common.procs import init_pool_worker
 from paleomix.common.utilities import chain_sorted
 from paleomix.common.sequences import reverse_complement
 from paleomix.tools import factory
 
 
-class DetectInputDuplicationNode(Node):
+# Persistent record of FASTA files that have passed validation
+FASTA_VALIDATION_CACHE = os.path.join(
+    os.path.expanduser("~"), ".paleomix", "validated_fasta.json"
+)
+
+
+class DetectInputDuplicationNode(CommandNode):
     """Attempts to detect reads included multiple times as input based on the
     presence of reads with identical names AND sequences. This is compromise
     between sensitivity, specificity, and running time.
@@ -41,63 +51,31 @@ class DetectInputDuplicationNode(Node):
     A possible refinement would be to consider reads with the same name where
     one read is the prefix of the other (due to different amounts of trimming
     or collapsing of reads).
+
+    The check is run using 'paleomix dupcheck', since contigs are checked in
+    parallel in worker processes, which cannot be created by the (daemonic)
+    processes used to run nodes.
     """
 
-    def __init__(self, input_files, output_file, dependencies=()):
-        Node.__init__(
+    def __init__(self, input_files, output_file, threads=1, dependencies=()):
+        command = factory.new("dupcheck")
+        command.set_option("--fail-on-duplicates")
+        if threads > 1:
+            command.set_option("--threads", threads)
+            # Unindexed BAMs are indexed in a sub-folder of the temporary folder
+            command.set_option("--temp-root", "%(TEMP_DIR)s")
+        command.add_multiple_values(input_files)
+        command.set_kwargs(OUT_STDOUT=output_file)
+
+        CommandNode.__init__(
             self,
             description="<Detect Input Duplication: %s>"
             % (describe_files(input_files)),
-            input_files=input_files,
-            output_files=output_file,
+            command=command.finalize(),
+            threads=threads,
             dependencies=dependencies,
         )
 
-    def run(self, _):
-        check_bam_files(self.input_files, self._throw_node_error)
-
-        # Everything is ok, touch the output files
-        for fpath in self.output_files:
-            if os.path.dirname(fpath):
-                make_dirs(os.path.dirname(fpath))
-
-            with open(fpath, "w"):
-                pass
-
-    def _throw_node_error(self, chrom, pos, records, name, seq, qual):
-        message = [
-            "The same read was found multiple times at position %i on %r!"
-            % (pos, chrom),
-            "    Name:      %r" % (name,),
-            "    Sequence:  %r" % (seq,),
-            "    Qualities: %r" % (qual,),
-            "",
-        ]
-
-        message.append("Read was found in these BAM files:")
-        for filename, records in sorted(records.items()):
-            message.append("   %s in %r" % (_summarize_reads(records), filename))
-
-        message.append("")
-        message.append(
-            "This indicates that the same data has been "
-            "included multiple times in the project. This "
-            "can be because multiple copies of the same "
-            "files were used, or because one or more files "
-            "contain multiple copies of the same reads. "
-            "The command 'paleomix dupcheck' may be used "
-            "to review the potentially duplicated data in "
-            "these BAM files.\n\n"
-            "If this error was a false positive, then you "
-            "may execute the following command(s) to mark "
-            "this test as having succeeded:"
-        )
-
-        for fpath in self.output_files:
-            message.append("$ touch '%s'" % (fpath,))
-
-        raise NodeError("\n".join(message))
-
 
 class ValidateFASTQFilesNode(CommandNode):
     def __init__(
@@ -119,7 +97,15 @@ class ValidateFASTQFilesNode(CommandNode):
 
 
 class ValidateFASTAFilesNode(Node):
-    def __init__(self, input_files, output_file, dependencies=()):
+    def __init__(
+        self,
+        input_files,
+        output_file,
+        cache_file=FASTA_VALIDATION_CACHE,
+        dependencies=(),
+    ):
+        self._cache_file = cache_file
+
         Node.__init__(
             self,
             description="<Validate FASTA Files: %s>" % (describe_files(input_files)),
@@ -131,8 +117,18 @@ class ValidateFASTAFilesNode(Node):
         assert len(self.output_files) == 1, self.output_files
 
     def _run(self, _config, _temp):
-        for filename in self.input_files:
-            check_fasta_file(filename)
+        if self._cache_file is None:
+            for filename in self.input_files:
+                check_fasta_file(filename)
+        else:
+            cache = FASTAValidationCache(self._cache_file)
+            for filename in self.input_files:
+                digest = calculate_checksum(filename)
+                if digest not in cache:
+                    check_fasta_file(filename)
+                    cache.add(digest)
+            cache.save()
+
         (output_file,) = self.output_files
         if os.path.dirname(output_file):
             make_dirs(os.path.dirname(output_file))
@@ -140,46 +136,149 @@ class ValidateFASTAFilesNode(Node):
             pass
 
 
-def check_bam_files(input_files, err_func):
+def check_bam_files(input_files, err_func, threads=1, index_files=None):
+    """Calls 'err_func(chrom, pos, records, name, seq, qual)' for every read found
+    more than once at the same position in the (sorted) input BAM files, where
+    'records' is a dictionary of {filename: [records]}.
+
+    If more than one thread is used, and all files are indexed (either alongside
+    the BAMs or in the {filename: index} dictionary 'index_files'), then contigs
+    are checked in parallel; the same duplicates are reported in the same order
+    regardless of the number of threads used.
+    """
+    index_files = dict(index_files or {})
     handles = []
     try:
-        last_pos = None
-        observed_reads = collections.defaultdict(list)
-        reads_iter = _open_samfiles(handles, input_files)
-        references = handles[0].references
-
-        for (record, filename) in reads_iter:
-            curr_pos = (record.pos, record.tid)
-            if curr_pos != last_pos:
-                _process_bam_reads(observed_reads, references, last_pos, err_func)
-                observed_reads.clear()
-                last_pos = curr_pos
-
-                # Stop once the trailing, unmapped reads are reached
-                if record.tid == -1:
-                    break
-
-            observed_reads[record.qname].append((record, filename))
-        _process_bam_reads(observed_reads, references, last_pos, err_func)
+        for filename in input_files:
+            handles.append(
+                pysam.AlignmentFile(filename, index_filename=index_files.get(filename))
+            )
+
+        if threads > 1 and _can_process_in_parallel(handles):
+            _check_bam_files_in_parallel(
+                input_files, handles, err_func, threads, index_files
+            )
+        else:
+            sequences = []
+            for filename, handle in zip(input_files, handles):
+                sequences.append(_read_samfile(handle, filename))
+
+            reads_iter = chain_sorted(*sequences, key=_key_by_tid_pos)
+            _check_bam_reads(reads_iter, handles[0].references, err_func)
     finally:
         for handle in handles:
             handle.close()
 
 
-def _open_samfiles(handles, filenames):
-    sequences = []
-    for filename in filenames:
-        handle = pysam.AlignmentFile(filename)
-        handles.append(handle)
+def _check_bam_reads(reads_iter, references, err_func):
+    last_pos = None
+    observed_reads = collections.defaultdict(list)
+    for (record, filename) in reads_iter:
+        curr_pos = (record.pos, record.tid)
+        if curr_pos != last_pos:
+            _process_bam_reads(observed_reads, references, last_pos, err_func)
+            observed_reads.clear()
+            last_pos = curr_pos
+
+        # Reads are grouped by a hash of the name, rather than by the name itself,
+        # to save memory; hash collisions are resolved in _process_bam_reads
+        observed_reads[hash(record.query_name)].append((record, filename))
+    _process_bam_reads(observed_reads, references, last_pos, err_func)
+
+
+def _can_process_in_parallel(handles):
+    references = (handles[0].references, handles[0].lengths)
+    for handle in handles:
+        if not handle.has_index():
+            return False
+        elif (handle.references, handle.lengths) != references:
+            # Records are merged by the index of contigs, not by their names
+            return False
+
+    return True
+
+
+def _check_bam_files_in_parallel(filenames, handles, err_func, threads, index_files):
+    headers = dict(zip(filenames, (handle.header for handle in handles)))
+
+    tasks = []
+    for contigs in _build_shards(handles[0], threads):
+        tasks.append((filenames, index_files, contigs))
+
+    with multiprocessing.Pool(min(threads, len(tasks)), init_pool_worker) as pool:
+        for duplicates in pool.imap(_check_bam_shard, tasks):
+            for chrom, pos, lines, name, seq, qual in duplicates:
+                records = {}
+                for filename, file_lines in lines.items():
+                    header = headers[filename]
+                    records[filename] = [
+                        pysam.AlignedSegment.fromstring(line, header)
+                        for line in file_lines
+                    ]
+
+                err_func(chrom, pos, records, name, seq, qual)
+
+
+def _build_shards(handle, threads):
+    """Splits contigs into consecutive shards of similar total size."""
+    min_size = sum(handle.lengths) / (threads * _SHARDS_PER_THREAD)
+
+    shards = []
+    shard, shard_size = [], 0
+    for name, length in zip(handle.references, handle.lengths):
+        shard.append(name)
+        shard_size += length
+
+        if shard_size >= min_size:
+            shards.append(shard)
+            shard, shard_size = [], 0
+
+    if shard:
+        shards.append(shard)
+
+    return shards
+
 
-        sequences.append(_read_samfile(handle, filename))
+def _check_bam_shard(args):
+    filenames, index_files, contigs = args
 
-    return chain_sorted(*sequences, key=_key_by_tid_pos)
+    duplicates = []
 
+    def _collect_duplicates(chrom, pos, records, name, seq, qual):
+        # Records are returned as SAM lines, since AlignedSegments can't be pickled
+        lines = {}
+        for filename, file_records in records.items():
+            lines[filename] = [record.to_string() for record in file_records]
 
-def _read_samfile(handle, filename):
-    for record in handle:
-        if record.is_unmapped and (not record.pos or record.mate_is_unmapped):
+        duplicates.append((chrom, pos, lines, name, seq, qual))
+
+    handles = []
+    try:
+        for filename in filenames:
+            handles.append(
+                pysam.AlignmentFile(filename, index_filename=index_files.get(filename))
+            )
+
+        for contig in contigs:
+            sequences = []
+            for filename, handle in zip(filenames, handles):
+                sequences.append(_read_samfile(handle.fetch(contig), filename))
+
+            reads_iter = chain_sorted(*sequences, key=_key_by_tid_pos)
+            _check_bam_reads(reads_iter, handles[0].references, _collect_duplicates)
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return duplicates
+
+
+def _read_samfile(records, filename):
+    for record in records:
+        if record.tid == -1:
+            # Stop once the trailing, unmapped reads are reached
+            break
+        elif record.is_unmapped and (not record.pos or record.mate_is_unmapped):
             # Ignore unmapped reads except when these are sorted
             # according to the mate position (if mapped)
             continue
@@ -220,40 +319,108 @@ def _process_bam_reads(observed_reads, references, position, err_func):
             err_func(chrom, pos, records, name, seq, qual)
 
 
-def _summarize_reads(records):
-    counts = {"mate 1": 0, "mate 2": 0, "unpaired": 0}
-
-    for record in records:
-        if record.is_paired:
-            if record.is_read1:
-                counts["mate 1"] += 1
-            elif record.is_read2:
-                counts["mate 2"] += 1
-            else:
-                counts["unpaired"] += 1
-        else:
-            counts["unpaired"] += 1
+def _key_by_tid_pos(record):
+    return (record[0].tid, record[0].pos)
 
-    result = []
-    for key, value in sorted(counts.items()):
-        if value > 1:
-            result.append("%i %s reads" % (value, key))
-        elif value:
-            result.append("%i %s read" % (value, key))
 
-    return ", ".join(result) or "No reads"
+class FASTAValidationCache(JSONCache):
+    """Persistent set of the SHA256 digests of FASTA files that have passed
+    validation, allowing the validation of unchanged files to be skipped.
+    """
 
+    # Must be incremented if FASTA validation becomes stricter, in order to
+    # re-validate files that passed validation using a previous version
+    VERSION = 1
+    DESCRIPTION = "FASTA validation cache"
 
-def _key_by_tid_pos(record):
-    return (record[0].tid, record[0].pos)
+    def add(self, digest):
+        if digest not in self:
+            self.set(digest, True)
 
 
 def check_fasta_file(filename):
-    with open(filename) as handle:
+    """Raises a NodeError if the FASTA file is not valid. Files are first checked
+    using bulk operations on a memory-mapped copy of the file, and invalid files
+    (or files that cannot be checked this way) are then checked line by line, in
+    order to identify the exact problem.
+    """
+    if not _check_fasta_mmap(filename):
+        _check_fasta_lines(filename)
+
+
+def _check_fasta_mmap(filename):
+    """Returns true if the FASTA file is valid; false does not necessarily mean
+    that the file is invalid, as only the common, canonical FASTA layout is
+    accepted (e.g. no empty lines prior to the first header).
+    """
+    with open(filename, "rb") as handle:
+        if not os.fstat(handle.fileno()).st_size:
+            return False
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:1] != b">":
+                return False
+
+            names = set()
+            start, size = 0, len(data)
+            while start < size:
+                header_end = data.find(b"\n", start)
+                if header_end == -1:
+                    return False
+
+                name = data[start + 1 : header_end].split(b" ", 1)[0]
+                if not (name and _RE_REF_NAME_BYTES.match(name)) or name in names:
+                    return False
+                names.add(name)
+
+                # The sequence ends at the next line starting with '>'
+                end = data.find(b"\n>", header_end)
+                end = size if end == -1 else end + 1
+
+                if not _check_fasta_mmap_sequence(data, header_end + 1, end):
+                    return False
+
+                start = end
+
+    return True
+
+
+def _check_fasta_mmap_sequence(data, start, end):
+    # Trailing empty lines are allowed between sequences
+    while end > start and data[end - 1] == _NEWLINE:
+        end -= 1
+
+    if start == end or data[start] == _NEWLINE:
+        return False
+
+    linelength = data.find(b"\n", start, end)
+    linelength = (end if linelength == -1 else linelength) - start
+
+    # Every line but the last must have the same length, and the last line may be
+    # shorter; this means that newlines are found at fixed intervals and only at
+    # those positions. Chunks start at line boundaries, to preserve these offsets.
+    stride = linelength + 1
+    chunksize = stride * max(1, _FASTA_CHUNK_SIZE // stride)
+    for offset in range(start, end, chunksize):
+        chunk = data[offset : min(offset + chunksize, end)]
+        if chunk.translate(None, _VALID_BYTES):
+            return False
+
+        newlines = chunk[linelength::stride]
+        if newlines != b"\n" * len(newlines):
+            return False
+        elif chunk.count(b"\n") != len(newlines):
+            return False
+
+    return True
+
+
+def _check_fasta_lines(filename):
+    # Only \n is allowed as not all tools  handle \r
+    with open(filename, newline="\n") as handle:
         namecache = {}
         state, linelength, linelengthchanged = _NA, None, False
         for linenum, line in enumerate(handle, start=1):
-            # Only \n is allowed as not all tools  handle \r
             line = line.rstrip("\n")
 
             if not line:
@@ -324,10 +491,17 @@ def check_fasta_file(filename):
             )
 
 
+# Target number of shards per thread when checking BAMs in parallel
+_SHARDS_PER_THREAD = 4
 # Standard nucleotides + UIPAC codes
 _VALID_CHARS_STR = "ACGTN" "RYSWKMBDHV"
 _VALID_CHARS = frozenset(_VALID_CHARS_STR.upper() + _VALID_CHARS_STR.lower())
 _NA, _IN_HEADER, _IN_SEQUENCE, _IN_WHITESPACE = range(4)
+# Valid characters in sequences, including newlines, for use with bytes.translate
+_VALID_BYTES = "".join(sorted(_VALID_CHARS)).encode("ascii") + b"\n"
+_NEWLINE = ord("\n")
+# Number of bytes of sequence checked at a time by _check_fasta_mmap
+_FASTA_CHUNK_SIZE = 16 * 1024 * 1024
 
 
 def _validate_fasta_header(filename, linenum, line, cache):
@@ -353,6 +527,7 @@ def _validate_fasta_header(filename, linenum, line, cache):
 
 
 _RE_REF_NAME = re.compile("[!-()+-<>-~][!-~]*")
+_RE_REF_NAME_BYTES = re.compile(_RE_REF_NAME.pattern.encode("ascii"))
 
 
 def _validate_fasta_line(filename, linenum, line):
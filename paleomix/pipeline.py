@@ -20,11 +20,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import collections
 import errno
+import functools
 import logging
 import multiprocessing
 import os
 import signal
+import time
 import traceback
 
 from queue import Empty
@@ -32,10 +35,21 @@ from queue import Empty
 import paleomix.common.logging
 
 from paleomix.node import Node, NodeError, NodeUnhandledException
-from paleomix.nodegraph import FileStatusCache, NodeGraph, NodeGraphError
+from paleomix.nodegraph import (
+    ChecksumStatusCache,
+    FileStatusCache,
+    NodeGraph,
+    NodeGraphError,
+)
+from paleomix.runlog import ResourceMonitor, RunLog, RunLogError
+from paleomix.statedb import StateDatabase, StateDatabaseError
 from paleomix.common.text import padded_table
 from paleomix.common.utilities import safe_coerce_to_tuple
-from paleomix.common.versions import VersionRequirementError
+from paleomix.common.versions import (
+    VERSION_CACHE,
+    VersionRequirementError,
+    prefetch,
+)
 
 
 class Pypeline:
@@ -47,6 +61,12 @@ class Pypeline:
         self._interrupted = False
         self._queue = multiprocessing.Queue()
         self._pool = None
+        # Optional database used to store checksums, runtimes, etc.
+        self._database = None
+        # Optional log of resources used by nodes
+        self._run_log = None
+        # Start times for running nodes, used to record runtimes
+        self._start_times = {}
 
     def add_nodes(self, *nodes):
         for subnodes in safe_coerce_to_tuple(nodes):
@@ -55,12 +75,53 @@ class Pypeline:
                     raise TypeError("Node object expected, recieved %s" % repr(node))
                 self._nodes.append(node)
 
-    def run(self, max_threads=1, dry_run=False):
+    def run(
+        self,
+        max_threads=1,
+        dry_run=False,
+        state_db=None,
+        max_memory=None,
+        run_log=None,
+        version_cache=VERSION_CACHE,
+    ):
+        """Runs the pipeline using at most 'max_threads' threads. If 'max_memory' is
+        set, nodes are only started if the total (approximate) memory usage of the
+        running nodes, in bytes, is less than this value. If 'state_db' is set,
+        checksums of files and nodes are recorded in the database (see
+        paleomix.statedb) and used to determine if nodes are outdated, instead
+        of timestamps. If 'run_log' is set, the resources used by each node are
+        appended to this file (see paleomix.runlog). The output of version checks
+        is cached in 'version_cache', unless this is None (see VersionCache).
+        """
         if max_threads < 1:
             raise ValueError("Max threads must be >= 1")
+        elif max_memory is not None and max_memory < 1:
+            raise ValueError("Max memory must be >= 1")
+
+        cache_factory = FileStatusCache
+        if state_db is not None:
+            try:
+                self._database = StateDatabase(state_db)
+            except StateDatabaseError as error:
+                self._logger.error(error)
+                return False
+
+            cache_factory = functools.partial(ChecksumStatusCache, self._database)
 
         try:
-            nodegraph = NodeGraph(self._nodes)
+            return self._build_and_run(
+                cache_factory, max_threads, dry_run, max_memory, run_log, version_cache
+            )
+        finally:
+            if self._database is not None:
+                self._database.close()
+                self._database = None
+
+    def _build_and_run(
+        self, cache_factory, max_threads, dry_run, max_memory, run_log, version_cache
+    ):
+        try:
+            nodegraph = NodeGraph(self._nodes, cache_factory, version_cache)
         except NodeGraphError as error:
             self._logger.error(error)
             return False
@@ -75,30 +136,72 @@ class Pypeline:
                 self._logger.warn(message)
                 break
 
+        if max_memory is not None:
+            for node in nodegraph.iterflat():
+                if node.memory is not None and node.memory > max_memory:
+                    self._logger.warning(
+                        "Node(s) use more memory than the max allowed; "
+                        "the pipeline may therefore use more than the "
+                        "expected amount of memory."
+                    )
+                    break
+
         if dry_run:
             self._summarize_pipeline(nodegraph)
             self._logger.info("Dry run done")
 
             result = True
         else:
+            if run_log is not None:
+                try:
+                    self._run_log = RunLog(run_log)
+                except RunLogError as error:
+                    self._logger.error(error)
+                    return False
+
             self._pool = multiprocessing.Pool(max_threads, _init_worker, (self._queue,))
             old_handler = signal.signal(signal.SIGINT, self._sigint_handler)
+            self._record_unrecorded_nodes(nodegraph)
 
             try:
-                result = self._run(nodegraph, max_threads)
+                result = self._run(nodegraph, max_threads, max_memory)
             finally:
                 signal.signal(signal.SIGINT, old_handler)
 
+                if self._run_log is not None:
+                    self._run_log.close()
+                    self._run_log = None
+
         for filename in paleomix.common.logging.get_logfiles():
             self._logger.info("Log-file written to %r", filename)
 
         return result
 
-    def _run(self, nodegraph, max_threads):
+    def _record_unrecorded_nodes(self, nodegraph):
+        """Records up-to-date nodes not yet recorded in the state database, using
+        the worker pool, as this requires calculating checksums for all of their
+        input and output files; see ChecksumStatusCache."""
+        nodes = nodegraph.pop_unrecorded_nodes()
+        if nodes:
+            self._logger.info("Recording checksums for %i node(s)", len(nodes))
+
+            for node in nodes:
+                self._pool.apply_async(
+                    _call_record_node,
+                    args=(node, self._database.filename),
+                    error_callback=self._record_node_failed,
+                )
+
+    def _record_node_failed(self, error):
+        self._logger.warning("Failed to record checksums for node: %s", error)
+
+    def _run(self, nodegraph, max_threads, max_memory):
         # Dictionary of nodes -> async-results
         running = {}
-        # Set of remaining nodes to be run
-        remaining = set(nodegraph.iterflat())
+        # List of remaining nodes to be run, with critical nodes first
+        remaining = _prioritize_nodes(
+            nodegraph.iterflat(), self._estimate_runtimes(nodegraph)
+        )
 
         is_ok = True
         while running or (remaining and not self._interrupted):
@@ -106,7 +209,7 @@ class Pypeline:
 
             if not self._interrupted:  # Prevent starting of new nodes
                 self._start_new_tasks(
-                    remaining, running, nodegraph, max_threads, self._pool
+                    remaining, running, nodegraph, max_threads, max_memory, self._pool
                 )
 
         self._pool.close()
@@ -115,8 +218,10 @@ class Pypeline:
 
         return is_ok
 
-    def _start_new_tasks(self, remaining, running, nodegraph, max_threads, pool):
-        started_nodes = []
+    def _start_new_tasks(
+        self, remaining, running, nodegraph, max_threads, max_memory, pool
+    ):
+        started_nodes = set()
         idle_processes = max_threads - sum(
             node.threads for (node, _) in running.values()
         )
@@ -124,24 +229,34 @@ class Pypeline:
         if not idle_processes:
             return False
 
+        idle_memory = None
+        if max_memory is not None:
+            idle_memory = max_memory - sum(
+                (node.memory or 0) for (node, _) in running.values()
+            )
+
         for node in remaining:
-            if not running or (idle_processes >= node.threads):
+            has_memory = idle_memory is None or idle_memory >= (node.memory or 0)
+            if not running or (idle_processes >= node.threads and has_memory):
                 state = nodegraph.get_node_state(node)
                 if state == nodegraph.RUNABLE:
                     key = id(node)
-                    proc_args = (key, node, self._config)
+                    state_db = self._database and self._database.filename
+                    proc_args = (key, node, self._config, state_db)
                     running[key] = (node, pool.apply_async(_call_run, args=proc_args))
-                    started_nodes.append(node)
+                    started_nodes.add(node)
+                    self._start_times[node] = time.monotonic()
 
                     nodegraph.set_node_state(node, nodegraph.RUNNING)
                     idle_processes -= node.threads
+                    if idle_memory is not None:
+                        idle_memory -= node.memory or 0
                 elif state in (nodegraph.DONE, nodegraph.ERROR):
-                    started_nodes.append(node)
+                    started_nodes.add(node)
             elif idle_processes <= 0:
                 break
 
-        for node in started_nodes:
-            remaining.remove(node)
+        remaining[:] = [node for node in remaining if node not in started_nodes]
 
     def _poll_running_nodes(self, running, nodegraph, queue):
         error_happened = False
@@ -156,9 +271,10 @@ class Pypeline:
                 blocking = True
                 continue
 
+            usage = {}
             try:
                 # Re-raise exceptions from the node-process
-                proc.get()
+                usage = proc.get()
             except (KeyboardInterrupt, SystemExit):
                 raise
             except Exception as errors:
@@ -176,11 +292,30 @@ class Pypeline:
                 self._logger.error("\n".join(message))
                 error_happened = True
 
+            runtime = time.monotonic() - self._start_times.pop(node)
             if not error_happened:
                 nodegraph.set_node_state(node, nodegraph.DONE)
 
+                if self._database is not None:
+                    self._database.set_runtime(node, runtime)
+
+            if self._run_log is not None:
+                # Resource usage is only known for nodes that completed
+                usage = usage or {"wall_time": runtime}
+                state = "failed" if error_happened else "done"
+                self._run_log.record(node, state, usage)
+
         return not error_happened
 
+    def _estimate_runtimes(self, nodegraph):
+        """Returns a dictionary of {node: runtime} for nodes where the runtime can
+        be estimated, based on runtimes recorded in the state database (if any).
+        """
+        if self._database is None:
+            return {}
+
+        return self._database.get_runtimes(nodegraph.iterflat())
+
     @property
     def nodes(self):
         return set(self._nodes)
@@ -289,11 +424,17 @@ class Pypeline:
         for filename in sorted(input_files):
             print_func("%s" % (filename,))
 
-    def print_required_executables(self, print_func=print):
+    def print_required_executables(self, print_func=print, version_cache=VERSION_CACHE):
         template = "{: <40s} {: <11s} {}"
         pipeline_executables = self.list_required_executables()
         print_func(template.format("Executable", "Version", "Required version"))
 
+        # Run (uncached) version checks in parallel
+        requirements = set()
+        for values in pipeline_executables.values():
+            requirements.update(values)
+        prefetch(requirements, version_cache)
+
         for (name, requirements) in sorted(pipeline_executables.items()):
             if not requirements:
                 print_func(template.format(name, "-", "any version"))
@@ -364,6 +505,38 @@ class Pypeline:
             self._logger.warning("Errors were detected while running pipeline")
 
 
+def _prioritize_nodes(nodes, runtimes):
+    """Returns a list of nodes sorted by the total (estimated) runtime of the longest
+    chain of nodes starting with each node and ending with a node that no other
+    nodes depend on. Nodes on this critical path are thereby started first, rather
+    than long chains of dependent nodes being started last. Nodes for which no
+    runtime is available are assumed to take one second to run.
+    """
+    nodes = frozenset(nodes)
+    rev_dependencies = collections.defaultdict(list)
+    for node in nodes:
+        for dependency in node.dependencies:
+            rev_dependencies[dependency].append(node)
+
+    # Nodes are processed in reverse topological order, starting with nodes that
+    # have no (reverse) dependencies
+    unprocessed = dict((node, len(rev_dependencies[node])) for node in nodes)
+    queue = [node for (node, count) in unprocessed.items() if not count]
+    priorities = {}
+    while queue:
+        node = queue.pop()
+        priorities[node] = runtimes.get(node, 1.0) + max(
+            (priorities[rev_dep] for rev_dep in rev_dependencies[node]), default=0.0
+        )
+
+        for dependency in node.dependencies:
+            unprocessed[dependency] -= 1
+            if not unprocessed[dependency]:
+                queue.append(dependency)
+
+    return sorted(nodes, key=priorities.__getitem__, reverse=True)
+
+
 def _init_worker(queue):
     """Init function for subprocesses created by multiprocessing.Pool: Ensures
     that KeyboardInterrupts only occur in the main process, allowing us to do
@@ -377,12 +550,24 @@ def _init_worker(queue):
     _call_run.queue = queue
 
 
-def _call_run(key, node, config):
+def _call_run(key, node, config, state_db=None):
     """Wrapper function, required in order to call Node.run()
     in subprocesses, since it is not possible to pickle
-    bound functions (e.g. self.run)"""
+    bound functions (e.g. self.run). Returns a dictionary
+    describing the resources used by the node."""
     try:
-        return node.run(config)
+        monitor = ResourceMonitor()
+        node.run(config)
+        usage = monitor.finish(max_rss=node.max_rss)
+
+        if state_db is not None:
+            # Checksums are calculated here to avoid blocking the main process;
+            # these are cached and retrieved when the node is marked as done
+            with StateDatabase(state_db) as database:
+                for filename in node.input_files | node.output_files:
+                    database.get_checksum(filename)
+
+        return usage
     except NodeError:
         raise
     except Exception:
@@ -392,3 +577,10 @@ def _call_run(key, node, config):
     finally:
         # See comment in _init_worker
         _call_run.queue.put(key)
+
+
+def _call_record_node(node, state_db):
+    """Records the checksums of an up-to-date node in the state database; this
+    is done in worker processes to avoid blocking the main process."""
+    with StateDatabase(state_db) as database:
+        ChecksumStatusCache(database).record_node(node)
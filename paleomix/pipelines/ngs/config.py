@@ -28,6 +28,9 @@ import paleomix.common.logging
 
 from paleomix.resources import add_copy_example_command
 from paleomix.common.argparse import ArgumentParser
+from paleomix.common.system import parse_memory_size
+from paleomix.common.versions import VERSION_CACHE
+from paleomix.nodes.validation import FASTA_VALIDATION_CACHE
 
 
 _DEFAULT_CONFIG_FILES = [
@@ -100,12 +103,54 @@ def add_run_command(subparsers):
         default=False,
         help="If passed, only a dry-run in performed, and no tasks are executed.",
     )
+    group.add_argument(
+        "--state-db",
+        default=None,
+        metavar="FILE",
+        help="If set, checksums of input/output files and of the commands run are "
+        "recorded in this (SQLite) database, and used instead of timestamps to "
+        "determine if output files are outdated.",
+    )
+    group.add_argument(
+        "--run-log",
+        default=None,
+        metavar="FILE",
+        help="If set, the wall-clock time, CPU time, peak memory usage, and I/O of "
+        "each task is appended to this file; see 'paleomix run_log'.",
+    )
+    group.add_argument(
+        "--no-version-cache",
+        dest="version_cache",
+        default=VERSION_CACHE,
+        action="store_const",
+        const=None,
+        help="Always run programs to determine their versions, instead of using "
+        "the output cached in %(default)r for unchanged programs.",
+    )
+    group.add_argument(
+        "--no-fasta-validation-cache",
+        dest="fasta_validation_cache",
+        default=FASTA_VALIDATION_CACHE,
+        action="store_const",
+        const=None,
+        help="Always validate reference FASTA files, instead of skipping files "
+        "recorded as valid in %(default)r.",
+    )
     group.add_argument(
         "--max-threads",
         type=int,
         default=max(2, multiprocessing.cpu_count()),
         help="Max number of threads to use in total [%(default)s]",
     )
+    group.add_argument(
+        "--max-memory",
+        type=parse_memory_size,
+        default=None,
+        help="Max amount of memory to use for running tasks, e.g. '32g'. This is "
+        "based on the approximate memory usage of tasks where known, such as the "
+        "max heap size of Java tasks. Tasks are always run if no other tasks are "
+        "running. By default, memory usage is not limited",
+    )
     group.add_argument(
         "--adapterremoval-max-threads",
         type=int,
@@ -124,6 +169,30 @@ def add_run_command(subparsers):
         default=1,
         help="Max number of threads to use per BWA instance [%(default)s]",
     )
+    group.add_argument(
+        "--statistics-max-threads",
+        type=int,
+        default=1,
+        help="Max number of threads to use per 'coverage' or 'depths' instance, "
+        "when calculating statistics for indexed BAM files [%(default)s]",
+    )
+    group.add_argument(
+        "--rmdup-collapsed-max-threads",
+        type=int,
+        default=1,
+        help="Max number of threads to use per 'rmdup_collapsed' instance; if more "
+        "than one thread is used, input BAMs are first merged into a temporary, "
+        "indexed BAM file [%(default)s]",
+    )
+    group.add_argument(
+        "--dupcheck-max-threads",
+        type=int,
+        default=1,
+        help="Max number of threads to use when checking for input data that has "
+        "been included multiple times; if more than one thread is used, input "
+        "BAMs are indexed if needed and contigs are checked in parallel "
+        "[%(default)s]",
+    )
 
     group = parser.add_argument_group("Required paths")
     group.add_argument(
@@ -82,7 +82,7 @@ class Library:
             config, target, prefix, files_and_nodes
         )
 
-        nodes = [self._build_dataduplication_node(lane_bams)]
+        nodes = [self._build_dataduplication_node(config, lane_bams)]
         nodes.extend(mapdamage_nodes)
 
         self.nodes = tuple(nodes)
@@ -113,6 +113,10 @@ class Library:
 
         results = {}
         for (key, files_and_nodes) in bams.items():
+            kwargs = {}
+            if key == "collapsed":
+                kwargs["threads"] = config.rmdup_collapsed_max_threads
+
             output_filename = self.folder + ".rmdup.%s.bam" % key
             node = rmdup_cls[key](
                 config=config,
@@ -120,6 +124,7 @@ class Library:
                 output_bam=output_filename,
                 keep_dupes=keep_duplicates,
                 dependencies=list(files_and_nodes.values()),
+                **kwargs
             )
 
             # Indexing is required if we wish to calulate per-region statistics
@@ -222,12 +227,13 @@ class Library:
 
         return {output_filename: validate}, (model,)
 
-    def _build_dataduplication_node(self, bams):
+    def _build_dataduplication_node(self, config, bams):
         files_and_nodes = self._collect_files_and_nodes(bams)
         output_file = self.folder + ".duplications_checked"
 
         return DetectInputDuplicationNode(
             input_files=list(files_and_nodes),
             output_file=output_file,
+            threads=config.dupcheck_max_threads,
             dependencies=list(files_and_nodes.values()),
         )
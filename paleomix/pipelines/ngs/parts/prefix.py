@@ -41,7 +41,9 @@ class Prefix:
         for sample in self.samples:
             files_and_nodes.update(sample.bams.items())
 
-        self.datadup_check = self._build_dataduplication_node(prefix, files_and_nodes)
+        self.datadup_check = self._build_dataduplication_node(
+            config, prefix, files_and_nodes
+        )
         self.bams = self._build_bam(config, prefix, files_and_nodes)
 
         nodes = [self.datadup_check]
@@ -69,7 +71,7 @@ class Prefix:
 
         return {output_filename: validated_node}
 
-    def _build_dataduplication_node(self, prefix, files_and_nodes):
+    def _build_dataduplication_node(self, config, prefix, files_and_nodes):
         filename = prefix["Name"] + ".duplications_checked"
         destination = os.path.join(self.folder, self.target, filename)
         dependencies = list(files_and_nodes.values())
@@ -77,5 +79,6 @@ class Prefix:
         return DetectInputDuplicationNode(
             input_files=list(files_and_nodes),
             output_file=destination,
+            threads=config.dupcheck_max_threads,
             dependencies=dependencies,
         )
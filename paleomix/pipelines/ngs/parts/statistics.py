@@ -49,7 +49,7 @@ def add_statistics_nodes(config, makefile, target):
 
 
 def _build_summary_node(config, makefile, target, coverage):
-    coverage_by_label = _build_coverage_nodes(target)
+    coverage_by_label = _build_coverage_nodes(config, target)
 
     return SummaryTableNode(
         config=config,
@@ -77,6 +77,7 @@ def _build_depth(config, target, prefixes):
                     prefix=prefixes[prefix.name],
                     regions_file=roi_filename,
                     output_file=output_fpath,
+                    threads=config.statistics_max_threads,
                     dependencies=dependencies,
                 )
             )
@@ -95,7 +96,7 @@ def _aggregate_for_prefix(cov, prefix, roi_name=None, into=None):
 
 def _build_coverage(config, target, make_summary):
     merged_nodes = []
-    coverage = _build_coverage_nodes(target)
+    coverage = _build_coverage_nodes(config, target)
     for prefix in target.prefixes:
         for (roi_name, _) in _get_roi(prefix):
             label = _get_prefix_label(prefix.name, roi_name)
@@ -131,7 +132,7 @@ def _build_coverage(config, target, make_summary):
     return coverage
 
 
-def _build_coverage_nodes(target):
+def _build_coverage_nodes(config, target):
     coverage = {
         "Lanes": collections.defaultdict(dict),
         "Libraries": collections.defaultdict(dict),
@@ -141,6 +142,8 @@ def _build_coverage_nodes(target):
     for prefix in target.prefixes:
         for (roi_name, roi_filename) in _get_roi(prefix):
             prefix_label = _get_prefix_label(prefix.name, roi_name)
+            # Lane/library BAMs are only indexed if regions of interest are used
+            threads = config.statistics_max_threads if roi_filename else 1
 
             for sample in prefix.samples:
                 for library in sample.libraries:
@@ -149,20 +152,30 @@ def _build_coverage_nodes(target):
                     for lane in library.lanes:
                         for bams in lane.bams.values():
                             bams = _build_coverage_nodes_cached(
-                                bams, target.name, roi_name, roi_filename, cache
+                                bams,
+                                target.name,
+                                roi_name,
+                                roi_filename,
+                                threads,
+                                cache,
                             )
 
                             coverage["Lanes"][key].update(bams)
 
                     bams = _build_coverage_nodes_cached(
-                        library.bams, target.name, roi_name, roi_filename, cache
+                        library.bams,
+                        target.name,
+                        roi_name,
+                        roi_filename,
+                        threads,
+                        cache,
                     )
                     coverage["Libraries"][key].update(bams)
     return coverage
 
 
 def _build_coverage_nodes_cached(
-    files_and_nodes, target_name, roi_name, roi_filename, cache
+    files_and_nodes, target_name, roi_name, roi_filename, threads, cache
 ):
     output_ext = ".coverage"
     if roi_name:
@@ -179,6 +192,7 @@ def _build_coverage_nodes_cached(
                 output_file=output_filename,
                 target_name=target_name,
                 regions_file=roi_filename,
+                threads=threads,
                 dependencies=node,
             )
 
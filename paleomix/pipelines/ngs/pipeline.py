@@ -142,7 +142,9 @@ def index_references(config, makefiles):
                 # steps, as it is only expected to fail very rarely, but will
                 # block subsequent analyses depending on the FASTA.
                 valid_node = ValidateFASTAFilesNode(
-                    input_files=reference, output_file=reference + ".validated"
+                    input_files=reference,
+                    output_file=reference + ".validated",
+                    cache_file=config.fasta_validation_cache,
                 )
                 # Indexing of FASTA file using 'samtools faidx'
                 faidx_node = FastaIndexNode(reference)
@@ -224,11 +226,18 @@ def run(config, pipeline_variant):
         return 0
     elif config.list_executables:
         logger.info("Printing required executables")
-        pipeline.print_required_executables()
+        pipeline.print_required_executables(version_cache=config.version_cache)
         return 0
 
     logger.info("Running BAM pipeline")
-    if not pipeline.run(dry_run=config.dry_run, max_threads=config.max_threads):
+    if not pipeline.run(
+        dry_run=config.dry_run,
+        max_threads=config.max_threads,
+        max_memory=config.max_memory,
+        state_db=config.state_db,
+        run_log=config.run_log,
+        version_cache=config.version_cache,
+    ):
         return 1
 
     return 0
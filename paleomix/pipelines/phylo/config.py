@@ -27,6 +27,8 @@ import paleomix
 import paleomix.common.logging
 
 from paleomix.common.argparse import ArgumentParser
+from paleomix.common.system import parse_memory_size
+from paleomix.common.versions import VERSION_CACHE
 
 
 _DESCRIPTION = (
@@ -73,12 +75,28 @@ def build_parser():
         type=int,
         help="Maximum number of threads to use for each instance of ExaML [%(default)s]",
     )
+    group.add_argument(
+        "--vcf-to-fasta-max-threads",
+        default=1,
+        type=int,
+        help="Maximum number of processes to use for each instance of "
+        "'vcf_to_fasta', when building consensus sequences [%(default)s]",
+    )
     group.add_argument(
         "--max-threads",
         type=int,
         default=max(2, multiprocessing.cpu_count()),
         help="Max number of threads to use in total [%(default)s]",
     )
+    group.add_argument(
+        "--max-memory",
+        type=parse_memory_size,
+        default=None,
+        help="Max amount of memory to use for running tasks, e.g. '32g'. This is "
+        "based on the approximate memory usage of tasks where known, such as the "
+        "max heap size of Java tasks. Tasks are always run if no other tasks are "
+        "running. By default, memory usage is not limited",
+    )
     group.add_argument(
         "--dry-run",
         default=False,
@@ -86,6 +104,30 @@ def build_parser():
         help="If passed, only a dry-run in performed, the dependency tree is printed, "
         "and no tasks are executed.",
     )
+    group.add_argument(
+        "--state-db",
+        default=None,
+        metavar="FILE",
+        help="If set, checksums of input/output files and of the commands run are "
+        "recorded in this (SQLite) database, and used instead of timestamps to "
+        "determine if output files are outdated.",
+    )
+    group.add_argument(
+        "--run-log",
+        default=None,
+        metavar="FILE",
+        help="If set, the wall-clock time, CPU time, peak memory usage, and I/O of "
+        "each task is appended to this file; see 'paleomix run_log'.",
+    )
+    group.add_argument(
+        "--no-version-cache",
+        dest="version_cache",
+        default=VERSION_CACHE,
+        action="store_const",
+        const=None,
+        help="Always run programs to determine their versions, instead of using "
+        "the output cached in %(default)r for unchanged programs.",
+    )
 
     group = parser.add_argument_group("Required paths")
     group.add_argument(
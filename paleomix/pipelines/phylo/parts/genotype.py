@@ -221,6 +221,7 @@ def build_genotyping_nodes(options, genotyping, sample, regions, dependencies):
         outfile=output_fasta,
         padding=genotyping["Padding"],
         options=builder_options,
+        threads=options.vcf_to_fasta_max_threads,
         dependencies=node,
     )
 
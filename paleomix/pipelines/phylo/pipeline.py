@@ -119,9 +119,16 @@ def main(argv):
         return 0
     elif config.list_executables:
         log.info("Printing required executables")
-        pipeline.print_required_executables()
+        pipeline.print_required_executables(version_cache=config.version_cache)
         return 0
 
-    if not pipeline.run(max_threads=config.max_threads, dry_run=config.dry_run):
+    if not pipeline.run(
+        max_threads=config.max_threads,
+        max_memory=config.max_memory,
+        dry_run=config.dry_run,
+        state_db=config.state_db,
+        run_log=config.run_log,
+        version_cache=config.version_cache,
+    ):
         return 1
     return 0
@@ -20,19 +20,18 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import argparse
-import collections
+import bisect
+import hashlib
 import itertools
 import os
 import random
 import sys
-import tarfile
 
 from io import TextIOWrapper
 
 import pysam
 
 from paleomix.common.sequences import NT_CODES
-from paleomix.common.sampling import reservoir_sampling
 
 import paleomix.common.bamfiles as bamtools
 import paleomix.common.fileutils as fileutils
@@ -41,37 +40,53 @@ import paleomix.pipelines.zonkey.database as database
 
 _TRANSITIONS = frozenset((("C", "T"), ("T", "C"), ("G", "A"), ("A", "G")))
 
+# CIGAR operations consuming both query and reference (M, =, X), only the query
+# (I, S), or only the reference (D, N)
+_CIGAR_ALIGNED = frozenset((0, 7, 8))
+_CIGAR_QUERY_ONLY = frozenset((1, 4))
+_CIGAR_REFERENCE_ONLY = frozenset((2, 3))
 
-def _filter_records(handle, flags=bamtools.EXCLUDED_FLAGS):
-    for record in handle:
-        if not record.flag & flags:
-            yield record
+# Upper bound (exclusive) of the 64 bit hashes used when downsampling reads
+_HASH_MAX = 2 ** 64
 
 
 class DownsampledBAM:
-    def __init__(self, handle, downsample, included_references):
-        self._records = collections.defaultdict(list)
-
-        references = handle.references
-        if len(references) != len(included_references):
-            raise ValueError(
-                "Length of 'included_references' must match the "
-                "number of references in BAM file."
-            )
-
-        records = _filter_records(handle)
-        for record in reservoir_sampling(records, downsample):
-            key = references[record.tid]
-            self._records[key].append(record)
+    """Streaming, deterministic downsampling of an indexed BAM file. Reads are
+    selected if a (seeded) hash of the read name falls below a threshold, chosen
+    such that 'downsample' reads are expected to be selected, given the number of
+    mapped reads on the included contigs as recorded in the BAM index. As with
+    'samtools view -s', mates are therefore either both selected or both
+    discarded. Reads are filtered using bamtools.EXCLUDED_FLAGS."""
+
+    def __init__(self, handle, downsample, contigs, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+
+        contigs = frozenset(contigs)
+        mapped = sum(
+            stats.mapped
+            for stats in handle.get_index_statistics()
+            if stats.contig in contigs
+        )
 
-        self.references = references
+        self._handle = handle
+        self._key = seed.to_bytes(8, "little")
+        self._threshold = _HASH_MAX
+        if mapped > downsample:
+            self._threshold = (_HASH_MAX * downsample) // mapped
 
-        self._records = dict(self._records)
-        for value in self._records.values():
-            value.sort(key=lambda rec: rec.pos)
+        self.references = handle.references
 
     def fetch(self, chrom):
-        return self._records.get(chrom, ())
+        key = self._key
+        threshold = self._threshold
+        for record in self._handle.fetch(chrom):
+            if not record.flag & bamtools.EXCLUDED_FLAGS:
+                name = record.query_name.encode("utf-8")
+                digest = hashlib.blake2b(name, digest_size=8, key=key).digest()
+
+                if int.from_bytes(digest, "little") < threshold:
+                    yield record
 
 
 class GenotypeSites:
@@ -88,61 +103,65 @@ class GenotypeSites:
             last_chrom = chrom
 
         sites.sort()
-        self._sites = collections.deque(sites)
+        self._sites = sites
+        self._positions = [pos for (pos, _, _) in sites]
 
     def process(self, records, statistics):
+        """Collects the nucleotides observed at each site, and yields sites once no
+        further reads may overlap them. Reads are expected to be sorted by position
+        and are processed one aligned block (CIGAR M/=/X) at a time, locating the
+        sites covered by each block using binary searches."""
         count_used = 0
         count_total = 0
         sites = self._sites
+        positions = self._positions
+        # Index of the first site not yet yielded
+        start = 0
         for record_id, record in enumerate(records):
             count_total += 1
 
             # TODO: Check sorted
-            while sites and sites[0][0] < record.pos:
-                yield sites.popleft()
-
-            sequence = record.seq
-            sites_iter = iter(sites).__next__
-            alignment_iter = iter(record.get_aligned_pairs()).__next__
-            alignment_end = record.aend
-
-            try:
-                read_used = False
-                site_pos, _, nucleotides = sites_iter()
-                query_pos, ref_pos = alignment_iter()
-
-                while alignment_end > site_pos:
-                    if ref_pos is None or query_pos is None or site_pos > ref_pos:
-                        query_pos, ref_pos = alignment_iter()
-                    elif site_pos < ref_pos:
-                        site_pos, _, nucleotides = sites_iter()
-                    else:
-                        assert ref_pos == site_pos, (ref_pos, site_pos)
-                        nucleotide = sequence[query_pos]
+            ref_pos = record.reference_start
+            end = bisect.bisect_left(positions, ref_pos, start)
+            yield from sites[start:end]
+            start = end
+
+            if start >= len(sites):
+                break
+
+            read_used = False
+            query_pos = 0
+            sequence = record.query_sequence
+            # Unmapped reads (placed next to their mates) have no CIGAR
+            for operation, length in record.cigartuples or ():
+                if operation in _CIGAR_ALIGNED:
+                    first = bisect.bisect_left(positions, ref_pos, start)
+                    last = bisect.bisect_left(positions, ref_pos + length, first)
+                    for site_pos, _, nucleotides in sites[first:last]:
+                        nucleotide = sequence[query_pos + site_pos - ref_pos]
                         if nucleotide != "N":
                             nucleotides.append((record_id, nucleotide))
                             read_used = True
 
-                        query_pos, ref_pos = alignment_iter()
-                        site_pos, _, nucleotides = sites_iter()
-            except StopIteration:
-                if not sites:
-                    break
-            finally:
-                if read_used:
-                    count_used += 1
+                    ref_pos += length
+                    query_pos += length
+                elif operation in _CIGAR_QUERY_ONLY:
+                    query_pos += length
+                elif operation in _CIGAR_REFERENCE_ONLY:
+                    ref_pos += length
+
+            if read_used:
+                count_used += 1
 
-        while sites:
-            yield sites.popleft()
+        yield from sites[start:]
 
         statistics["n_reads"] += count_total
         statistics["n_reads_used"] += count_used
 
 
 class GenotypeReader:
-    def __init__(self, filename):
-        self._tar_handle = tarfile.open(filename)
-        self._handle = TextIOWrapper(self._tar_handle.extractfile("genotypes.txt"))
+    def __init__(self, data):
+        self._handle = TextIOWrapper(data.open_member("genotypes.txt"))
         self._header = self._handle.readline().rstrip("\r\n").split("\t")
         self.samples = self._header[-1].split(";")
 
@@ -162,7 +181,6 @@ class GenotypeReader:
 
     def __exit__(self, type, value, traceback):
         self._handle.close()
-        self._tar_handle.close()
 
 
 def process_record(
@@ -255,8 +273,8 @@ def process_bam(args, data, bam_handle, mapping):
     references = [reverse_mapping.get(name, name) for name in raw_references]
 
     if args.downsample:
-        sys.stderr.write("Downsampling to at most %i BAM records\n" % (args.downsample))
-        bam_handle = DownsampledBAM(bam_handle, args.downsample, references)
+        sys.stderr.write("Downsampling to ~%i BAM records\n" % (args.downsample))
+        bam_handle = DownsampledBAM(bam_handle, args.downsample, mapping.values())
 
     statistics = {
         "n_reads": 0,
@@ -269,7 +287,7 @@ def process_bam(args, data, bam_handle, mapping):
 
     with open(os.path.join(args.root, "incl_ts.tped"), "w") as output_incl:
         with open(os.path.join(args.root, "excl_ts.tped"), "w") as output_excl:
-            with GenotypeReader(args.database) as reader:
+            with GenotypeReader(data) as reader:
                 for ref, sites in reader:
                     records = set()
                     raw_ref = raw_references[references.index(ref)]
@@ -24,6 +24,8 @@ import paleomix
 import paleomix.common.logging
 
 from paleomix.common.argparse import ArgumentParser, SUPPRESS
+from paleomix.common.system import parse_memory_size
+from paleomix.common.versions import VERSION_CACHE
 
 
 _RUN_USAGE = """%(prog)s [..] <database.tar> <samples.txt> [destination]
@@ -160,12 +162,45 @@ def add_run_command(subparsers):
         "dependency tree is printed, and no tasks are "
         "executed.",
     )
+    group.add_argument(
+        "--state-db",
+        default=None,
+        metavar="FILE",
+        help="If set, checksums of input/output files and of the commands run are "
+        "recorded in this (SQLite) database, and used instead of timestamps to "
+        "determine if output files are outdated.",
+    )
+    group.add_argument(
+        "--run-log",
+        default=None,
+        metavar="FILE",
+        help="If set, the wall-clock time, CPU time, peak memory usage, and I/O of "
+        "each task is appended to this file; see 'paleomix run_log'.",
+    )
+    group.add_argument(
+        "--no-version-cache",
+        dest="version_cache",
+        default=VERSION_CACHE,
+        action="store_const",
+        const=None,
+        help="Always run programs to determine their versions, instead of using "
+        "the output cached in %(default)r for unchanged programs.",
+    )
     group.add_argument(
         "--max-threads",
         type=int,
         default=1,
         help="Maximum number of threads to use [%(default)s]",
     )
+    group.add_argument(
+        "--max-memory",
+        type=parse_memory_size,
+        default=None,
+        help="Max amount of memory to use for running tasks, e.g. '32g'. This is "
+        "based on the approximate memory usage of tasks where known, such as the "
+        "max heap size of Java tasks. Tasks are always run if no other tasks are "
+        "running. By default, memory usage is not limited",
+    )
     group.add_argument(
         "--list-input-files",
         action="store_true",
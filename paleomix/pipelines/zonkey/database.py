@@ -20,6 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import collections
+import io
+import json
 import logging
 import os
 import re
@@ -30,6 +32,8 @@ from io import TextIOWrapper
 import pysam
 
 import paleomix.yaml
+import paleomix.common.fileutils as fileutils
+
 from paleomix.common.formats.fasta import FASTA
 from paleomix.pipelines.zonkey.common import contig_name_to_plink_name, get_sample_names
 
@@ -82,6 +86,12 @@ _SAMPLES_TABLE_COLUMNS = frozenset(("ID", "Species", "Sex", "SampleID", "Publica
 # Regular expression for parsing Group(K) columns in samples.txt
 _SAMPLES_TABLE_GROUP = re.compile(r"^Group\((?P<K>.+)\)$")
 
+# Suffix of the sidecar index containing pre-parsed tables and the offsets of files
+# in the database; the index is re-built if the size or mtime of the database change
+_INDEX_SUFFIX = ".index"
+# Version of the index format; increment when the content of the index changes
+_INDEX_VERSION = 1
+
 
 class ZonkeyDBError(RuntimeError):
     pass
@@ -98,28 +108,30 @@ class ZonkeyDB:
             # Require that the file is not gzip / bzip2 compressed
             _check_file_compression(filename)
 
-            with tarfile.open(filename, "r:") as tar_handle:
-                log.info("Reading settings")
-                self.settings = self._read_settings(tar_handle, "settings.yaml")
-                log.info("Reading list of contigs")
-                self.contigs = self._read_contigs_table(tar_handle, "contigs.txt")
-                log.info("Reading list of samples")
-                self.samples, self.groups = self._read_samples_table(
-                    tar_handle, "samples.txt"
-                )
-                log.info("Reading mitochondrial sequences")
-                self.mitochondria = self._read_mitochondria(
-                    tar_handle, "mitochondria.fasta"
-                )
-                log.info("Reading emperical admixture distribution")
-                self.simulations = self._read_simulations(tar_handle, "simulations.txt")
-                log.info("Determining sample order")
-                self.sample_order = self._read_sample_order(tar_handle, "genotypes.txt")
+            stat = os.stat(filename)
+            index = _read_index(filename, stat)
+            if index is None:
+                self._read_database(filename)
+                _write_index(filename, stat, self._to_index())
+            else:
+                log.info("Using cached index %r", filename + _INDEX_SUFFIX)
+                self._from_index(index)
         except (OSError, tarfile.TarError) as error:
             raise ZonkeyDBError(str(error))
 
         self._cross_validate()
 
+    def open_member(self, name):
+        """Returns a binary file-handle for the file 'name' in the database; the
+        file is read directly from the offset recorded in the index, without the
+        need to scan the tar file."""
+        try:
+            offset, size = self.members[name]
+        except KeyError:
+            raise ZonkeyDBError("Database does not contain file %r" % (name,))
+
+        return io.BufferedReader(_MemberReader(self.filename, offset, size))
+
     def validate_bam(self, filename):
         """Validates a sample BAM file, checking that it is either a valid
         mitochondrial BAM (aligned against one of the referenc mt sequences),
@@ -155,6 +167,69 @@ class ZonkeyDB:
 
         return info
 
+    def _read_database(self, filename):
+        log = logging.getLogger(__name__)
+
+        with tarfile.open(filename, "r:") as tar_handle:
+            log.info("Reading settings")
+            self.settings = self._read_settings(tar_handle, "settings.yaml")
+            log.info("Reading list of contigs")
+            self.contigs = self._read_contigs_table(tar_handle, "contigs.txt")
+            log.info("Reading list of samples")
+            self.samples, self.groups = self._read_samples_table(
+                tar_handle, "samples.txt"
+            )
+            log.info("Reading mitochondrial sequences")
+            self.mitochondria = self._read_mitochondria(
+                tar_handle, "mitochondria.fasta"
+            )
+            log.info("Reading emperical admixture distribution")
+            self.simulations = self._read_simulations(tar_handle, "simulations.txt")
+            log.info("Determining sample order")
+            self.sample_order = self._read_sample_order(tar_handle, "genotypes.txt")
+
+            self.members = {}
+            for member in tar_handle.getmembers():
+                if member.isfile():
+                    self.members[member.name] = (member.offset_data, member.size)
+
+    def _to_index(self):
+        """Returns the parsed tables as a JSON serializable dictionary."""
+        mitochondria = None
+        if self.mitochondria is not None:
+            mitochondria = [
+                (record.name, record.meta, record.sequence)
+                for record in self.mitochondria.values()
+            ]
+
+        return {
+            "settings": self.settings,
+            "contigs": self.contigs,
+            "samples": self.samples,
+            "groups": sorted(self.groups.items()),
+            "mitochondria": mitochondria,
+            "simulations": self.simulations,
+            "sample_order": self.sample_order,
+            "members": self.members,
+        }
+
+    def _from_index(self, index):
+        self.settings = index["settings"]
+        self.contigs = index["contigs"]
+        self.samples = index["samples"]
+        self.groups = dict(index["groups"])
+        self.mitochondria = None
+        if index["mitochondria"] is not None:
+            self.mitochondria = {}
+            for name, meta, sequence in index["mitochondria"]:
+                self.mitochondria[name] = FASTA(name, meta, sequence)
+
+        self.simulations = index["simulations"]
+        self.sample_order = tuple(index["sample_order"])
+        self.members = {
+            name: tuple(value) for name, value in index["members"].items()
+        }
+
     def _cross_validate(self):
         """Cross validates tables to ensure consistency."""
         genotypes = set(self.sample_order)
@@ -612,6 +687,76 @@ def _validate_nuclear_bam(data, handle, info):
         return True
 
 
+class _MemberReader(io.RawIOBase):
+    """Read-only file-like object for a (regular) file stored in a tar archive,
+    given the offset and size of the file in the archive."""
+
+    def __init__(self, filename, offset, size):
+        io.RawIOBase.__init__(self)
+        self._handle = open(filename, "rb")
+        self._handle.seek(offset)
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        view = memoryview(buf)[: self._remaining]
+        nbytes = self._handle.readinto(view)
+        if len(view) and not nbytes:
+            raise ZonkeyDBError("Zonkey database file is truncated")
+
+        self._remaining -= nbytes
+
+        return nbytes
+
+    def close(self):
+        if not self.closed:
+            self._handle.close()
+
+        io.RawIOBase.close(self)
+
+
+def _read_index(filename, stat):
+    """Returns the cached index for a database, or None if the index does not exist,
+    is invalid, or if the database has changed since the index was written."""
+    try:
+        with open(filename + _INDEX_SUFFIX) as handle:
+            index = json.load(handle)
+
+        if index["version"] == _INDEX_VERSION and index["database"] == {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }:
+            return index["tables"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    return None
+
+
+def _write_index(filename, stat, tables):
+    """Writes the pre-parsed tables of a database to a sidecar index, along with the
+    size and mtime of the database. Failure to write the index is not fatal."""
+    index = {
+        "version": _INDEX_VERSION,
+        "database": {"size": stat.st_size, "mtime": stat.st_mtime_ns},
+        "tables": tables,
+    }
+
+    index_filename = filename + _INDEX_SUFFIX
+    temp_filename = "%s.%i.tmp" % (index_filename, os.getpid())
+    try:
+        with open(temp_filename, "w") as handle:
+            json.dump(index, handle)
+
+        os.replace(temp_filename, index_filename)
+    except OSError as error:
+        log = logging.getLogger(__name__)
+        log.warning("Could not write Zonkey database index: %s", error)
+        fileutils.try_remove(temp_filename)
+
+
 def _check_file_compression(filename):
     with open(filename, "rb") as handle:
         header = handle.read(2)
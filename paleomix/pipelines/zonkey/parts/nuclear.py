@@ -72,10 +72,6 @@ class BuildTPEDFilesNode(CommandNode):
         cmd.add_value("%(IN_TABLE)s")
         cmd.add_value("%(IN_BAM)s")
 
-        if not downsample:
-            # Needed for random access (chromosomes are read 1 ... 31)
-            cmd.set_kwargs(IN_BAI=bamfile + ".bai")
-
         cmd.set_kwargs(
             OUT_TFAM=os.path.join(output_root, "common.tfam"),
             OUT_SUMMARY=os.path.join(output_root, "common.summary"),
@@ -83,6 +79,9 @@ class BuildTPEDFilesNode(CommandNode):
             OUT_TPED_EXCL_TS=os.path.join(output_root, "excl_ts.tped"),
             IN_TABLE=table,
             IN_BAM=bamfile,
+            # Needed for random access (chromosomes are read 1 ... 31), and for
+            # the number of mapped reads used when downsampling
+            IN_BAI=bamfile + ".bai",
         )
 
         CommandNode.__init__(
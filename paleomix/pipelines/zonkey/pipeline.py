@@ -24,7 +24,6 @@ import logging
 import os
 import shutil
 import string
-import tarfile
 
 import pysam
 
@@ -58,7 +57,7 @@ def run_pipeline(config, nodes, msg):
     logger.info(msg)
 
     if config.list_executables:
-        pipeline.print_required_executables()
+        pipeline.print_required_executables(version_cache=config.version_cache)
         return True
     elif config.list_output_files:
         pipeline.print_output_files()
@@ -67,7 +66,14 @@ def run_pipeline(config, nodes, msg):
         pipeline.print_input_files()
         return True
 
-    return pipeline.run(max_threads=config.max_threads, dry_run=config.dry_run)
+    return pipeline.run(
+        max_threads=config.max_threads,
+        max_memory=config.max_memory,
+        dry_run=config.dry_run,
+        state_db=config.state_db,
+        run_log=config.run_log,
+        version_cache=config.version_cache,
+    )
 
 
 def build_plink_nodes(config, data, root, bamfile, dependencies=()):
@@ -435,35 +441,34 @@ def setup_example(config):
     log = logging.getLogger(__name__)
     log.info("Copying example project to %r", root)
 
-    with tarfile.TarFile(config.database.filename) as tar_handle:
-        example_files = []
-        existing_files = []
-        for member in tar_handle.getmembers():
-            if os.path.dirname(member.name) == "examples" and member.isfile():
-                example_files.append(member)
-
-                destination = fileutils.reroot_path(root, member.name)
-                if os.path.exists(destination):
-                    existing_files.append(destination)
-
-        if existing_files:
-            log.error("Output files already exist at destination:")
-            for filename in sorted(existing_files):
-                log.error(" - %r", filename)
-            return 1
-        elif not example_files:
-            log.error(
-                "Sample database %r does not contain example data; cannot proceed.",
-                config.database.filename,
-            )
-            return 1
+    example_files = []
+    existing_files = []
+    for name in sorted(config.database.members):
+        if os.path.dirname(name) == "examples":
+            example_files.append(name)
+
+            destination = fileutils.reroot_path(root, name)
+            if os.path.exists(destination):
+                existing_files.append(destination)
+
+    if existing_files:
+        log.error("Output files already exist at destination:")
+        for filename in sorted(existing_files):
+            log.error(" - %r", filename)
+        return 1
+    elif not example_files:
+        log.error(
+            "Sample database %r does not contain example data; cannot proceed.",
+            config.database.filename,
+        )
+        return 1
 
-        if not os.path.exists(root):
-            fileutils.make_dirs(root)
+    if not os.path.exists(root):
+        fileutils.make_dirs(root)
 
-        for member in example_files:
-            destination = fileutils.reroot_path(root, member.name)
-            src_handle = tar_handle.extractfile(member)
+    for name in example_files:
+        destination = fileutils.reroot_path(root, name)
+        with config.database.open_member(name) as src_handle:
             with open(destination, "wb") as out_handle:
                 shutil.copyfileobj(src_handle, out_handle)
 
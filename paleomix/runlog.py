@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Structured logging of the resources used by nodes run by a pipeline.
+
+Each completed (or failed) node is recorded as a single JSON object per line,
+containing the wall-clock time, the user and system CPU time used by the worker
+process and by any child processes run by the node, the peak resident set size
+of those child processes, and the number of bytes read and written. The log is
+appended to, allowing multiple runs of a pipeline to be recorded in one file;
+each record includes the time at which the run was started.
+
+See 'paleomix run_log' for summarizing these logs.
+"""
+import datetime
+import json
+import os
+import resource
+import time
+
+
+class RunLogError(RuntimeError):
+    pass
+
+
+class ResourceMonitor:
+    """Measures the resources used by the current process and by the child
+    processes that are reaped while the monitor is active. The monitor is
+    intended to be used in pipeline worker processes, which run a single node
+    at a time, and therefore does not distinguish between concurrent tasks.
+    """
+
+    def __init__(self):
+        self._start = self._snapshot()
+
+    def finish(self, max_rss=None):
+        """Returns a dictionary describing the resources used since the monitor
+        was created. The peak RSS cannot be determined for a specific period of
+        time using getrusage, and must therefore be supplied by the caller (see
+        Node.max_rss); it is None if unknown.
+        """
+        end = self._snapshot()
+        wall_time, start_self, start_children, start_io = self._start
+        end_time, end_self, end_children, end_io = end
+
+        def _delta(key):
+            return (getattr(end_self, key) + getattr(end_children, key)) - (
+                getattr(start_self, key) + getattr(start_children, key)
+            )
+
+        return {
+            "wall_time": end_time - wall_time,
+            "user_time": _delta("ru_utime"),
+            "system_time": _delta("ru_stime"),
+            "max_rss": max_rss,
+            "bytes_read": end_io[0] - start_io[0],
+            "bytes_written": end_io[1] - start_io[1],
+        }
+
+    @classmethod
+    def _snapshot(cls):
+        return (
+            time.monotonic(),
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+            _read_io_counters(),
+        )
+
+
+class RunLog:
+    """Append-only, JSON-lines log of nodes run by a pipeline."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._started = datetime.datetime.now().isoformat(timespec="seconds")
+
+        try:
+            self._handle = open(filename, "a")
+        except OSError as error:
+            raise RunLogError("Could not open run log %r: %s" % (filename, error))
+
+    def record(self, node, state, usage):
+        """Records that a node finished with the given state ("done" or "failed"),
+        using the resources described in 'usage' (see ResourceMonitor.finish).
+        """
+        record = {
+            "run": self._started,
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+            "state": state,
+            "node": str(node),
+            "class": "%s.%s" % (node.__class__.__module__, node.__class__.__name__),
+            "threads": node.threads,
+            "output_dir": _output_dir(node.output_files),
+        }
+        record.update(usage)
+
+        self._handle.write(json.dumps(record, sort_keys=True))
+        self._handle.write("\n")
+        self._handle.flush()
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+
+def read_run_log(filename):
+    """Yields the records in a run log, in the order they were written."""
+    with open(filename) as handle:
+        for linenum, line in enumerate(handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise RunLogError(
+                    "Invalid record at %s:%i: %s" % (filename, linenum, error)
+                )
+
+            if not isinstance(record, dict):
+                raise RunLogError("Invalid record at %s:%i" % (filename, linenum))
+
+            yield record
+
+
+def _read_io_counters():
+    """Returns the number of bytes read and written by the current process and
+    by reaped child processes. The rchar/wchar counters are used where available
+    (Linux), which count all I/O performed via system calls; otherwise the number
+    of block operations is used as a rough estimate.
+    """
+    try:
+        with open("/proc/self/io") as handle:
+            counters = dict(line.split(":", 1) for line in handle if ":" in line)
+
+        return (int(counters["rchar"]), int(counters["wchar"]))
+    except (OSError, KeyError, ValueError):
+        pass
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return (
+        (usage_self.ru_inblock + usage_children.ru_inblock) * 512,
+        (usage_self.ru_oublock + usage_children.ru_oublock) * 512,
+    )
+
+
+def _output_dir(filenames):
+    """Returns the deepest folder containing all output files, relative to the
+    current working directory, or None if there are no output files."""
+    if not filenames:
+        return None
+
+    dirnames = [os.path.dirname(os.path.abspath(fpath)) for fpath in filenames]
+
+    return os.path.relpath(os.path.commonpath(dirnames))
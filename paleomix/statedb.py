@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Persistent storage of the state of files and nodes between runs of a pipeline.
+
+The database records the checksum of files, along with the size and mtime of the
+file at the time the checksum was calculated; checksums are only re-calculated if
+either of these change. In addition, the database records the fingerprint of each
+node (see Node.fingerprint) and the size, mtime, and checksums of its input/output
+files at the time the node was completed. This allows the state of unchanged nodes
+to be determined without comparing checksums, and allows changed files to be
+identified without re-calculating the checksums of unchanged files.
+
+Finally, the database records the runtime of each node, which is used to estimate
+the runtime of nodes when prioritizing which nodes to run first.
+"""
+import json
+import os
+import sqlite3
+
+from paleomix.common.fileutils import calculate_checksum
+
+
+class StateDatabaseError(RuntimeError):
+    pass
+
+
+class StateDatabase:
+    def __init__(self, filename):
+        self.filename = filename
+
+        try:
+            self._conn = sqlite3.connect(filename, timeout=60)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    "  path TEXT PRIMARY KEY,"
+                    "  size INTEGER NOT NULL,"
+                    "  mtime INTEGER NOT NULL,"
+                    "  digest TEXT NOT NULL)"
+                )
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS nodes ("
+                    "  key TEXT PRIMARY KEY,"
+                    "  fingerprint TEXT NOT NULL,"
+                    "  files TEXT NOT NULL)"
+                )
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS runtimes ("
+                    "  key TEXT PRIMARY KEY,"
+                    "  name TEXT NOT NULL,"
+                    "  seconds REAL NOT NULL)"
+                )
+        except sqlite3.Error as error:
+            raise StateDatabaseError(
+                "Could not open state database %r: %s" % (filename, error)
+            )
+
+    def get_checksum(self, filename, stat=None):
+        """Returns a tuple of (size, digest) for the given file; the digest is only
+        (re)calculated if the file has changed since it was last recorded (based on
+        the size and mtime of the file). None is returned if the file does not exist.
+        The current os.stat_result for the file may optionally be passed.
+        """
+        if stat is None:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                return None
+
+        record = self._conn.execute(
+            "SELECT size, mtime, digest FROM files WHERE path = ?", (filename,)
+        ).fetchone()
+
+        if record is not None:
+            size, mtime, digest = record
+            if (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+                return (size, digest)
+
+        digest = calculate_checksum(filename)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (filename, stat.st_size, stat.st_mtime_ns, digest),
+            )
+
+        return (stat.st_size, digest)
+
+    def get_node(self, node):
+        """Returns a tuple containing the fingerprint recorded for the node and a
+        dictionary of {filename: (size, mtime, digest)} for its input and output
+        files, or None if the node has not been recorded. The presence of a record
+        indicates that the node was completed at some point.
+        """
+        record = self._conn.execute(
+            "SELECT fingerprint, files FROM nodes WHERE key = ?", (_node_key(node),)
+        ).fetchone()
+
+        if record is None:
+            return None
+
+        fingerprint, files = record
+        files = dict((key, tuple(value)) for key, value in json.loads(files).items())
+
+        return fingerprint, files
+
+    def set_node(self, node, files):
+        """Records the current fingerprint of a node, along with a dictionary of
+        {filename: (size, mtime, digest)} for its input and output files. Nodes
+        without output files are not recorded, as these cannot be outdated.
+        """
+        if not node.output_files:
+            return
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)",
+                (_node_key(node), node.fingerprint, json.dumps(files, sort_keys=True)),
+            )
+
+    def get_runtimes(self, nodes):
+        """Returns a dictionary of {node: seconds} containing the estimated runtime
+        of each node. The last recorded runtime is used for nodes that have been
+        run previously, while the mean runtime of nodes of the same class is used
+        for other nodes. Nodes for which neither is available are not included.
+        """
+        runtimes = dict(self._conn.execute("SELECT key, seconds FROM runtimes"))
+        mean_runtimes = dict(
+            self._conn.execute("SELECT name, AVG(seconds) FROM runtimes GROUP BY name")
+        )
+
+        result = {}
+        for node in nodes:
+            runtime = None
+            if node.output_files:
+                runtime = runtimes.get(_node_key(node))
+
+            if runtime is None:
+                runtime = mean_runtimes.get(_node_name(node))
+
+            if runtime is not None:
+                result[node] = runtime
+
+        return result
+
+    def set_runtime(self, node, seconds):
+        """Records the runtime of a node in seconds."""
+        if not node.output_files:
+            return
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runtimes VALUES (?, ?, ?)",
+                (_node_key(node), _node_name(node), seconds),
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+
+def _node_key(node):
+    """Nodes are identified by their output files, since each file can only be
+    generated by a single node (see NodeGraph._check_output_files). Nodes without
+    output files can therefore not be identified between runs."""
+    return json.dumps(sorted(node.output_files))
+
+
+def _node_name(node):
+    return "%s.%s" % (node.__class__.__module__, node.__class__.__name__)
@@ -22,13 +22,21 @@
 #
 import argparse
 import collections
+import multiprocessing
 import os
 import logging
 
 import pysam
 
-from paleomix.common.bedtools import read_bed_file, sort_bed_by_bamfile
+from paleomix.common.bedtools import BEDRecord, read_bed_file, sort_bed_by_bamfile
 from paleomix.common.fileutils import swap_ext
+from paleomix.common.procs import init_pool_worker
+from paleomix.common.timer import BAMTimer
+
+
+# Target number of shards per thread when processing BAMs in parallel; using
+# multiple (smaller) shards per thread helps to balance the load
+_SHARDS_PER_THREAD = 4
 
 
 class BAMStatsError(RuntimeError):
@@ -133,6 +141,14 @@ def parse_arguments(argv, ext):
         "if readgroup information is missing or partial "
         "[default: %(default)s]",
     )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Number of processes used to process the BAM file; the BAM is split "
+        "by contig or by region, when a regions file is used. Requires that the "
+        "BAM file is indexed [default: %(default)s]",
+    )
     parser.add_argument(
         "--overwrite-output",
         default=False,
@@ -157,6 +173,9 @@ def parse_arguments(argv, ext):
         else:
             args.target_name = os.path.basename(args.infile)
 
+    if args.threads < 1:
+        parser.error("--threads must be at least 1, not %r" % (args.threads,))
+
     if os.path.exists(args.outfile) and not args.overwrite_output:
         parser.error(
             "Destination filename already exists (%r); use option "
@@ -190,10 +209,90 @@ def main_wrapper(process_func, argv, ext):
             )
             return 1
 
+        if args.threads > 1 and (args.infile == "-" or not handle.has_index()):
+            log.warning("BAM file is not indexed; processing using 1 thread")
+            args.threads = 1
+
         sort_bed_by_bamfile(handle, args.regions)
         return process_func(handle, args)
 
 
+def process_in_parallel(handle, args, process_func, merge_func):
+    """Calls 'process_func(handle, args, regions, timer)' for the regions in
+    'args.regions', or for the entire file if no regions were specified, and
+    returns the result. If more than one thread is used, the BAM is instead
+    split into shards of contigs or regions, each of which is processed in a
+    separate process, and the results are combined in order using
+    'merge_func(result, other)', which must return the merged result.
+    """
+    if args.threads <= 1:
+        timer = BAMTimer(handle, step=1000000)
+        result = process_func(handle, args, args.regions, timer)
+        timer.finalize()
+
+        return result
+
+    shards = _build_shards(handle, args)
+    tasks = [(process_func, args, regions) for regions in shards]
+
+    result = None
+    threads = min(args.threads, len(tasks))
+    with multiprocessing.Pool(threads, init_pool_worker) as pool:
+        for value in pool.imap(_process_shard, tasks):
+            result = value if result is None else merge_func(result, value)
+
+    return result
+
+
+def _build_shards(handle, args):
+    """Splits contigs (or regions) into shards of similar total size; shards
+    are returned with the largest shards first, to improve load balancing."""
+    regions = args.regions
+    if not regions:
+        regions = []
+        for (name, length) in zip(handle.references, handle.lengths):
+            regions.append(BEDRecord("%s\t0\t%i\t%s" % (name, length, name)))
+
+    total = sum(region.end - region.start for region in regions)
+    min_size = total / (args.threads * _SHARDS_PER_THREAD)
+
+    shards = []
+    shard, shard_size = [], 0
+    for region in regions:
+        shard.append(region)
+        shard_size += region.end - region.start
+
+        if shard_size >= min_size:
+            shards.append(shard)
+            shard, shard_size = [], 0
+
+    if shard:
+        shards.append(shard)
+
+    shards.sort(
+        key=lambda shard: sum(region.end - region.start for region in shard),
+        reverse=True,
+    )
+
+    return shards
+
+
+def _process_shard(task):
+    process_func, args, regions = task
+
+    if regions[0].contig == regions[-1].contig:
+        desc = regions[0].contig
+    else:
+        desc = "%s..%s" % (regions[0].contig, regions[-1].contig)
+
+    with pysam.AlignmentFile(args.infile) as handle:
+        timer = BAMTimer(None, desc=desc, step=1000000)
+        result = process_func(handle, args, regions, timer)
+        timer.finalize()
+
+    return result
+
+
 def _get_readgroup(record):
     try:
         return record.get_tag("RG")
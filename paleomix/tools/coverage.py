@@ -24,13 +24,14 @@ import sys
 import copy
 
 from paleomix.common.utilities import get_in, set_in
-from paleomix.common.timer import BAMTimer
 from paleomix.common.bamfiles import BAMRegionsIter
 
 from paleomix.tools.bam_stats.common import (
+    BAMStatsError,
     collect_readgroups,
     collect_references,
     main_wrapper,
+    process_in_parallel,
 )
 from paleomix.tools.bam_stats.coverage import ReadGroup, write_table
 
@@ -139,13 +140,11 @@ def process_record(subtable, record, flags, region):
             position += num
 
 
-def process_file(handle, args):
-    timer = BAMTimer(handle, step=1000000)
-
+def process_regions(handle, args, regions, timer):
     counts = {}
     last_tid = 0
     region_template = build_region_template(args, handle)
-    for region in BAMRegionsIter(handle, args.regions):
+    for region in BAMRegionsIter(handle, regions):
         if region.name is None:
             # Trailing unmapped reads
             break
@@ -168,13 +167,32 @@ def process_file(handle, args):
                 timer.increment(read=record)
 
             if (region.tid, position) < (last_tid, last_pos):
-                sys.stderr.write("ERROR: Input BAM file is unsorted\n")
-                return 1
+                raise BAMStatsError("Input BAM file is unsorted")
 
             last_pos = position
             last_tid = region.tid
 
-    timer.finalize()
+    return counts
+
+
+def merge_counts(counts, other):
+    for (name, other_table) in other.items():
+        region_table = counts.get(name)
+        if region_table is None:
+            counts[name] = other_table
+        else:
+            for (readgroup, statistics) in other_table.items():
+                region_table[readgroup].add(statistics)
+
+    return counts
+
+
+def process_file(handle, args):
+    try:
+        counts = process_in_parallel(handle, args, process_regions, merge_counts)
+    except BAMStatsError as error:
+        sys.stderr.write("ERROR: %s\n" % (error,))
+        return 1
 
     print_table(args, handle, counts)
 
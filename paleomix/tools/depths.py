@@ -21,16 +21,17 @@
 # SOFTWARE.
 #
 import sys
-import itertools
+import operator
 import collections
 
-from paleomix.common.timer import BAMTimer
 from paleomix.common.bamfiles import BAMRegionsIter
 
 from paleomix.tools.bam_stats.common import (
+    BAMStatsError,
     collect_references,
     collect_readgroups,
     main_wrapper,
+    process_in_parallel,
 )
 
 
@@ -43,6 +44,9 @@ _MAX_DEPTH = 200
 # Maximum number of count patterns (numbers of bases per library for a given
 # site) to cache for bulk processing; see MappingsToTotals for implementation
 _MAX_CACHE_SIZE = 10000
+# Minimum number of positions between processing of changes in depth; changes
+# are processed in bulk to limit the overhead per read; see MappingToTotals
+_MIN_WINDOW_SIZE = 2 ** 16
 
 
 # Header prepended to output tables
@@ -67,6 +71,37 @@ _HEADER = """# Columns:
 ##############################################################################
 
 
+class DepthEvents:
+    """Difference array recording changes in depth per sample/library at the
+    start and end of each aligned block; the depth at a given position is the
+    sum of all changes at or before that position. Since reads are processed
+    in sorted order, positions are only ever added after the positions that
+    have already been popped.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._deltas = {}
+
+    def add(self, start, end, key):
+        """Records an increase in depth for [start, end) for the given key."""
+        deltas = self._deltas
+        for (position, delta) in ((start, 1), (end, -1)):
+            counts = deltas.get(position)
+            if counts is None:
+                counts = deltas[position] = [0] * self._size
+
+            counts[key] += delta
+
+    def pop(self, end):
+        """Returns a list of (position, deltas) in sorted order for positions
+        before 'end', removing these from the difference array."""
+        deltas = self._deltas
+        positions = sorted(position for position in deltas if position < end)
+
+        return [(position, deltas.pop(position)) for position in positions]
+
+
 class MappingToTotals:
     def __init__(self, totals, region, smlbid_to_smlb):
         self._region = region
@@ -74,29 +109,33 @@ class MappingToTotals:
             totals, region.name, smlbid_to_smlb
         )
         self._cache = collections.defaultdict(int)
+        self._last_pos = 0
+        self._depths = [0] * len(smlbid_to_smlb)
+
+    def process_counts(self, events, cur_pos):
+        """Processes changes in depth prior to 'cur_pos'. Depths are constant
+        between changes, so each stretch of identical depths is aggregated and
+        only looked up once. Changes are processed in windows of at least
+        _MIN_WINDOW_SIZE positions, unless 'cur_pos' is infinite."""
+        if cur_pos - self._last_pos < _MIN_WINDOW_SIZE:
+            return
 
-    def process_counts(self, counts, last_pos, cur_pos):
         start = self._region.start
         end = self._region.end
+        last_pos = self._last_pos
+        depths = self._depths
+
+        for (position, deltas) in events.pop(cur_pos):
+            if any(depths):
+                length = min(position, end) - max(last_pos, start)
+                if length > 0:
+                    self._cache[tuple(depths)] += length
 
-        # Pileups tends to contain identical stretches, so
-        # try to avoid repeated lookups by aggregating these
-        repeats = 1
-        last_count = None
-        while counts and (last_pos < cur_pos):
-            count = counts.popleft()
-            if start <= last_pos < end:
-                if count == last_count:
-                    repeats += 1
-                else:
-                    if last_count is not None:
-                        self._cache[tuple(last_count)] += repeats
-                    last_count = count
-                    repeats = 1
-            last_pos += 1
-
-        if last_count is not None:
-            self._cache[tuple(last_count)] += repeats
+            depths = list(map(operator.add, depths, deltas))
+            last_pos = position
+
+        self._last_pos = last_pos
+        self._depths = depths
 
         if len(self._cache) > _MAX_CACHE_SIZE:
             self.finalize()
@@ -296,23 +335,22 @@ def build_totals_dict(args, handle):
     return totals
 
 
-def count_bases(args, counts, record, rg_to_smlbid, template):
-    for _ in range(record.alen - len(counts)):
-        counts.append(list(template))
-
+def count_bases(args, events, record, rg_to_smlbid):
     key = rg_to_smlbid.get(args.get_readgroup_func(record))
     if key is None:
         # Unknown readgroups are treated as missing readgroups
         key = rg_to_smlbid[None]
 
-    index = 0
+    start = record.pos
+    # Bases past the alignment length (e.g. due to padding) are not counted
+    end = start + record.alen
     for (cigar, count) in record.cigar:
         if cigar in (0, 7, 8):
-            for counter in itertools.islice(counts, index, index + count):
-                counter[key] += 1
-            index += count
+            if start < end:
+                events.add(start, min(end, start + count), key)
+            start += count
         elif cigar in (2, 3, 6):
-            index += count
+            start += count
 
 
 def build_rg_to_smlbid_keys(args, handle):
@@ -338,15 +376,12 @@ def build_rg_to_smlbid_keys(args, handle):
     return rg_to_lbsmid, lbsmid_to_smlb
 
 
-def process_file(handle, args):
-    timer = BAMTimer(handle, step=1000000)
-
+def process_regions(handle, args, regions, timer):
     last_tid = 0
     totals = build_totals_dict(args, handle)
     rg_to_smlbid, smlbid_to_smlb = build_rg_to_smlbid_keys(args, handle)
-    template = [0] * len(smlbid_to_smlb)
 
-    for region in BAMRegionsIter(handle, args.regions):
+    for region in BAMRegionsIter(handle, regions):
         if region.name is None:
             # Trailing unmapped reads
             break
@@ -354,26 +389,49 @@ def process_file(handle, args):
             region.name = "<Genome>"
 
         last_pos = 0
-        counts = collections.deque()
+        events = DepthEvents(len(smlbid_to_smlb))
         mapping = MappingToTotals(totals, region, smlbid_to_smlb)
         for (position, records) in region:
-            mapping.process_counts(counts, last_pos, position)
+            mapping.process_counts(events, position)
 
             for record in records:
                 timer.increment(read=record)
-                count_bases(args, counts, record, rg_to_smlbid, template)
+                count_bases(args, events, record, rg_to_smlbid)
 
             if (region.tid, position) < (last_tid, last_pos):
-                sys.stderr.write("ERROR: Input BAM file is unsorted\n")
-                return 1
+                raise BAMStatsError("Input BAM file is unsorted")
 
             last_pos = position
             last_tid = region.tid
 
         # Process columns in region after last read
-        mapping.process_counts(counts, last_pos, float("inf"))
+        mapping.process_counts(events, float("inf"))
         mapping.finalize()
-    timer.finalize()
+
+    return totals
+
+
+def merge_totals(totals, other):
+    """Adds the counts in 'other' to 'totals'; both are assumed to be built
+    using build_totals_dict, and therefore share the same (re-used) dicts."""
+    merged = set()
+    for (key, counts) in other.items():
+        if id(counts) not in merged:
+            merged.add(id(counts))
+
+            dst_counts = totals[key]
+            for (depth, count) in counts.items():
+                dst_counts[depth] += count
+
+    return totals
+
+
+def process_file(handle, args):
+    try:
+        totals = process_in_parallel(handle, args, process_regions, merge_totals)
+    except BAMStatsError as error:
+        sys.stderr.write("ERROR: %s\n" % (error,))
+        return 1
 
     if not args.ignore_readgroups:
         # Exclude counts for reads with no read-groups, if none such were seen
@@ -23,44 +23,96 @@
 
 
 import argparse
+import os
 import sys
+import tempfile
+
+import pysam
 
 import paleomix.nodes.validation as validation
 
 
+class DuplicateReadsError(RuntimeError):
+    pass
+
+
 class ErrHandler:
-    def __init__(self, quiet=False):
+    def __init__(self, quiet=False, fail=False):
         self.quiet = quiet
+        self.fail = fail
+        # Details are printed to STDERR if the first duplicate is an error
+        self.out = sys.stderr if fail else sys.stdout
         self.duplicate_reads = 0
 
     def __call__(self, chrom, pos, records, name, seq, qual):
         self.duplicate_reads += 1
-        if self.quiet:
-            return
+        if not self.quiet:
+            self._print(chrom, pos, records, name, seq, qual)
+
+        if self.fail:
+            raise DuplicateReadsError(
+                "The same read was found multiple times at position %i on %r"
+                % (pos, chrom)
+            )
 
-        print("%s:%i -- %s %s %s:" % (chrom, pos, name, seq, qual))
+    def _print(self, chrom, pos, records, name, seq, qual):
+        out = self.out
+
+        print("%s:%i -- %s %s %s:" % (chrom, pos, name, seq, qual), file=out)
         for filename, records in sorted(records.items()):
-            print("    - %s:" % (filename,))
+            print("    - %s:" % (filename,), file=out)
 
             for idx, record in enumerate(records, start=1):
-                print("% 8i. " % (idx,), end="")
+                print("% 8i. " % (idx,), end="", file=out)
 
                 if record.is_paired:
                     if record.is_read1:
-                        print("Mate 1 read", end="")
+                        print("Mate 1 read", end="", file=out)
                     elif record.is_read2:
-                        print("Mate 2 read", end="")
+                        print("Mate 2 read", end="", file=out)
                     else:
-                        print("Unpaired read", end="")
+                        print("Unpaired read", end="", file=out)
                 else:
-                    print("Unpaired read", end="")
+                    print("Unpaired read", end="", file=out)
 
                 try:
-                    print(" with read-group %r" % (record.get_tag("RG"),), end="")
+                    tag = record.get_tag("RG")
+                    print(" with read-group %r" % (tag,), end="", file=out)
                 except KeyError:
                     pass
 
-                print()
+                print(file=out)
+
+
+def index_bam_files(filenames, temp_root, threads=1):
+    """Indexes BAM files without an index, placing the indices in 'temp_root',
+    and returns a dictionary of {filename: index}. This allows contigs to be
+    checked in parallel, as BAMs checked by the pipelines are not necessarily
+    indexed.
+    """
+    index_files = {}
+    for idx, filename in enumerate(sorted(filenames)):
+        with pysam.AlignmentFile(filename) as handle:
+            if handle.has_index():
+                continue
+
+        index_file = os.path.join(temp_root, "%i.bai" % (idx,))
+        pysam.index("-@", str(threads), filename, index_file)
+        index_files[filename] = index_file
+
+    return index_files
+
+
+def check_bam_files(args, handler):
+    if args.threads > 1:
+        with tempfile.TemporaryDirectory(dir=args.temp_root) as temp_root:
+            index_files = index_bam_files(args.files, temp_root, args.threads)
+
+            validation.check_bam_files(
+                args.files, handler, threads=args.threads, index_files=index_files
+            )
+    else:
+        validation.check_bam_files(args.files, handler)
 
 
 def parse_args(argv):
@@ -74,15 +126,46 @@ def parse_args(argv):
         "more potential duplicates duplicates were "
         "identified.",
     )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Number of processes used to check contigs in parallel; BAM files "
+        "that are not indexed are indexed in a temporary folder [%(default)s].",
+    )
+    parser.add_argument(
+        "--temp-root",
+        default=None,
+        help="Folder in which temporary indices are created when using more "
+        "than one thread [default: the system temporary folder].",
+    )
+    parser.add_argument(
+        "--fail-on-duplicates",
+        default=False,
+        action="store_true",
+        help="Print the first potential duplicate to STDERR and terminate with a "
+        "non-zero exit-code; used by the BAM pipeline.",
+    )
 
-    return parser.parse_args(argv)
+    args = parser.parse_args(argv)
+    if args.threads < 1:
+        parser.error("--threads must be at least 1, not %r" % (args.threads,))
+
+    return args
 
 
 def main(argv):
     """Main function; takes a list of arguments but excluding sys.argv[0]."""
     args = parse_args(argv)
-    handler = ErrHandler(quiet=args.quiet)
-    validation.check_bam_files(args.files, handler)
+    handler = ErrHandler(quiet=args.quiet, fail=args.fail_on_duplicates)
+
+    try:
+        check_bam_files(args, handler)
+    except DuplicateReadsError as error:
+        print("\nERROR: %s!\n" % (error,), file=sys.stderr)
+        print(_DUPLICATES_FOUND, file=sys.stderr)
+
+        return 1
 
     if args.quiet:
         print("%i" % (handler.duplicate_reads,))
@@ -92,5 +175,16 @@ def main(argv):
     return 0
 
 
+_DUPLICATES_FOUND = """This indicates that the same data has been included multiple
+times in the project. This can be because multiple copies of the same files
+were used, or because one or more files contain multiple copies of the same
+reads. The command 'paleomix dupcheck' may be used to review the potentially
+duplicated data in these BAM files.
+
+If this error was a false positive, then you may create the (empty) output file
+of this step, for example using 'touch', to mark the check as having succeeded.
+"""
+
+
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
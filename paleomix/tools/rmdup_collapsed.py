@@ -19,8 +19,16 @@ using the BAM record flags, are not filtered, but simply written to the output.
 By default, filtered reads are flagged using the "duplicate" flag (0x400), and
 written to the output. Use the --remove-duplicates command-line option to
 instead remove these records from the output.
+
+Indexed BAM files may be processed using multiple processes (--threads), by
+splitting contigs into windows. Reads with the same alignment are identified
+across windows, and the output is identical to that produced using a single
+thread, except when selecting among reads without quality scores.
 """
+import array
 import collections
+import itertools
+import multiprocessing
 import random
 import sys
 
@@ -28,6 +36,8 @@ from argparse import ArgumentParser
 
 import pysam
 
+from paleomix.common.procs import init_pool_worker
+
 
 _FILTERED_FLAGS = 0x1  # PE reads
 _FILTERED_FLAGS |= 0x4  # Unmapped
@@ -38,6 +48,15 @@ _FILTERED_FLAGS |= 0x800  # Chimeric alignment
 _CIGAR_SOFTCLIP = 4
 _CIGAR_HARDCLIP = 5
 
+# Contigs are split into (approximately) this many windows per thread
+_WINDOWS_PER_THREAD = 8
+# Minimum size of windows, to limit the overhead of processing each window
+_MIN_WINDOW_SIZE = 100000
+
+# Actions taken for reads processed in parallel; positive values are XP tags
+_READ_UNCHANGED = -1
+_READ_DUPLICATE = 0
+
 
 def read_quality(read):
     qualities = read.query_alignment_qualities
@@ -215,6 +234,145 @@ def process(args, infile, outfile):
     return 0
 
 
+def build_windows(infile, threads):
+    """Splits contigs into windows of (contig, start, end) tuples, in the order
+    in which the windows occur in the (sorted) BAM file. The end of the last
+    window for each contig is None, to include any reads beyond the contig."""
+    window_size = sum(infile.lengths) // (threads * _WINDOWS_PER_THREAD)
+    window_size = max(_MIN_WINDOW_SIZE, window_size)
+
+    windows = []
+    for (contig, length) in zip(infile.references, infile.lengths):
+        for start in range(0, max(1, length), window_size):
+            end = start + window_size
+            windows.append((contig, start, end if end < length else None))
+
+    return windows
+
+
+def process_window(args, infile, contig, start, end):
+    """Identifies duplicates among reads starting in a window, and returns an
+    array specifying the action to take for each read, in the same order as
+    the reads in the BAM file. Reads outside the window are also read if they
+    share alignments with reads in the window, and duplicates are therefore
+    identified exactly as in 'process'."""
+    reads = []
+    duplicates_by_alignment = {}
+    for read in infile.fetch(contig, start, end):
+        if read.reference_start >= start:
+            reads.append(read)
+
+            if not read.flag & _FILTERED_FLAGS:
+                alignment = unclipped_alignment_coordinates(read)
+                duplicates_by_alignment.setdefault(alignment, []).append(read)
+
+    if duplicates_by_alignment:
+        # Reads may be clipped, so duplicates may start before/after the window
+        first_start = min(key[2] for key in duplicates_by_alignment)
+        last_end = max(key[3] for key in duplicates_by_alignment)
+
+        preceding = collections.defaultdict(list)
+        if first_start < start:
+            for read in infile.fetch(contig, max(0, first_start), start):
+                _collect_duplicate(duplicates_by_alignment, preceding, read, 0, start)
+
+        for (alignment, duplicates) in preceding.items():
+            duplicates_by_alignment[alignment][:0] = duplicates
+
+        if end is not None and last_end > end:
+            for read in infile.fetch(contig, end, last_end):
+                _collect_duplicate(
+                    duplicates_by_alignment, duplicates_by_alignment, read, end, None
+                )
+
+    for (alignment, duplicates) in duplicates_by_alignment.items():
+        if len(duplicates) > 1:
+            # Alignments are processed once per window they overlap, so the
+            # selection of reads without qualities must be the same every time
+            random.seed("%s:%r" % (args.seed, alignment))
+            mark_duplicate_reads(duplicates)
+        else:
+            duplicates[0].is_duplicate = False
+            duplicates[0].set_tag("XP", 1, "i")
+
+    actions = array.array("l")
+    for read in reads:
+        if read.flag & _FILTERED_FLAGS:
+            actions.append(_READ_UNCHANGED)
+        elif read.is_duplicate:
+            actions.append(_READ_DUPLICATE)
+        else:
+            actions.append(read.get_tag("XP"))
+
+    return actions
+
+
+def process_in_parallel(args, infile, outfile):
+    """Processes windows of an indexed BAM file in parallel, and writes the
+    reads of the BAM file in the original order after applying the actions
+    returned by 'process_window' for each window."""
+    windows = build_windows(infile, args.threads)
+    tasks = [(args, window) for window in windows]
+
+    threads = min(args.threads, len(tasks))
+    with multiprocessing.Pool(threads, init_pool_worker) as pool:
+        actions = itertools.chain.from_iterable(pool.imap(_process_window, tasks))
+
+        is_trailing_read = False
+        for read in infile.fetch(until_eof=True):
+            if read.reference_id != -1:
+                action = next(actions, None)
+                if action is None:
+                    break
+            elif is_trailing_read:
+                outfile.write(read)
+                continue
+            else:
+                # The first trailing unmapped read is written using 'write_read'
+                # in 'process', while the remaining reads are written as is
+                action = _READ_UNCHANGED
+                is_trailing_read = True
+
+            if action == _READ_DUPLICATE:
+                read.is_duplicate = True
+            elif action != _READ_UNCHANGED:
+                read.is_duplicate = False
+                read.set_tag("XP", action, "i")
+
+            if not (args.remove_duplicates and read.is_duplicate):
+                outfile.write(read)
+        else:
+            if next(actions, None) is None:
+                return 0
+
+    sys.stderr.write(
+        "ERROR: Reads in windows do not match reads in BAM file; the file may "
+        "not be sorted by coordinates or the index may be outdated. Aborting!\n"
+    )
+
+    return 1
+
+
+def _process_window(task):
+    args, (contig, start, end) = task
+
+    with pysam.AlignmentFile(args.input, "rb") as infile:
+        return process_window(args, infile, contig, start, end)
+
+
+def _collect_duplicate(duplicates_by_alignment, destination, read, start, end):
+    """Adds a read starting in the range [start; end) to 'destination', if the
+    read shares an alignment with a read in 'duplicates_by_alignment'."""
+    if read.flag & _FILTERED_FLAGS or read.reference_start < start:
+        return
+    elif end is not None and read.reference_start >= end:
+        return
+
+    alignment = unclipped_alignment_coordinates(read)
+    if alignment in duplicates_by_alignment:
+        destination[alignment].append(read)
+
+
 def parse_args(argv):
     parser = ArgumentParser(usage=__doc__)
     parser.add_argument(
@@ -238,8 +396,19 @@ def parse_args(argv):
         "reads when no reads have quality scores assigned"
         "[default: initialized using system time].",
     )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Number of processes used to filter duplicates; requires that the "
+        "input is an indexed BAM file [%(default)s].",
+    )
+
+    args = parser.parse_args(argv)
+    if args.threads < 1:
+        parser.error("--threads must be at least 1, not %r" % (args.threads,))
 
-    return parser.parse_args(argv)
+    return args
 
 
 def main(argv):
@@ -256,7 +425,16 @@ def main(argv):
         return 1
 
     with pysam.AlignmentFile(args.input, "rb") as infile:
-        with pysam.AlignmentFile("-", "wb", template=infile) as outfile:
+        if args.threads > 1 and (args.input == "-" or not infile.has_index()):
+            sys.stderr.write("WARNING: BAM file is not indexed; using 1 thread\n")
+            args.threads = 1
+
+        with pysam.AlignmentFile(
+            "-", "wb", template=infile, threads=args.threads
+        ) as outfile:
+            if args.threads > 1:
+                return process_in_parallel(args, infile, outfile)
+
             return process(args, infile, outfile)
 
     return 0
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Summarizes the resources used by pipeline tasks, as recorded using the --run-log
+option of the pipelines. Tasks are grouped by the class of the node (the type of
+task), by the module implementing the node (corresponding to a pipeline stage,
+e.g. 'bwa' or 'picard'), or by sample, and groups are sorted by the total
+wall-clock time spent on them.
+"""
+import argparse
+import collections
+import logging
+import os
+import sys
+
+from paleomix.common.text import padded_table
+from paleomix.runlog import RunLogError, read_run_log
+
+
+_UNITS = ("", "K", "M", "G", "T")
+
+
+class _Summary:
+    def __init__(self):
+        self.nodes = 0
+        self.failed = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.max_rss = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add(self, record):
+        self.nodes += 1
+        if record.get("state") != "done":
+            self.failed += 1
+
+        self.wall_time += record.get("wall_time") or 0.0
+        self.cpu_time += record.get("user_time") or 0.0
+        self.cpu_time += record.get("system_time") or 0.0
+        self.bytes_read += record.get("bytes_read") or 0
+        self.bytes_written += record.get("bytes_written") or 0
+
+        max_rss = record.get("max_rss")
+        if max_rss is not None:
+            self.max_rss = max(max_rss, self.max_rss or 0)
+
+    def to_row(self, name):
+        cpu_usage = "-"
+        if self.wall_time:
+            cpu_usage = "%.0f%%" % (100.0 * self.cpu_time / self.wall_time,)
+
+        return (
+            name,
+            self.nodes,
+            self.failed,
+            _format_seconds(self.wall_time),
+            _format_seconds(self.cpu_time),
+            cpu_usage,
+            _format_bytes(self.max_rss),
+            _format_bytes(self.bytes_read),
+            _format_bytes(self.bytes_written),
+        )
+
+
+def group_by_class(record, _args):
+    return record.get("class", "-").rsplit(".", 1)[-1]
+
+
+def group_by_stage(record, _args):
+    module = record.get("class", "-").rsplit(".", 1)[0]
+
+    return module.rsplit(".", 1)[-1]
+
+
+def group_by_sample(record, args):
+    output_dir = record.get("output_dir")
+    if output_dir:
+        components = os.path.normpath(output_dir).split(os.sep)
+        if len(components) > args.sample_depth:
+            return components[args.sample_depth]
+
+    return "-"
+
+
+_GROUP_BY = {
+    "class": group_by_class,
+    "stage": group_by_stage,
+    "sample": group_by_sample,
+}
+
+
+def summarize(records, args):
+    """Returns a list of table rows summarizing the records grouped according to
+    'args.group_by', sorted by the total wall-clock time of each group."""
+    grouper = _GROUP_BY[args.group_by]
+    total = _Summary()
+    groups = collections.defaultdict(_Summary)
+    for record in records:
+        groups[grouper(record, args)].add(record)
+        total.add(record)
+
+    rows = [
+        (
+            args.group_by.title(),
+            "Nodes",
+            "Failed",
+            "WallTime",
+            "CPUTime",
+            "CPUUsage",
+            "MaxRSS",
+            "Read",
+            "Written",
+        )
+    ]
+
+    groups = sorted(groups.items(), key=lambda item: item[1].wall_time, reverse=True)
+    if args.top is not None:
+        groups = groups[: args.top]
+
+    for name, summary in groups:
+        rows.append(summary.to_row(name))
+    rows.append(total.to_row("*"))
+
+    return rows
+
+
+def _select_last_run(records):
+    last_run = max((record.get("run", "") for record in records), default=None)
+
+    return [record for record in records if record.get("run", "") == last_run]
+
+
+def _format_seconds(value):
+    value = int(round(value))
+
+    return "%i:%02i:%02i" % (value // 3600, (value // 60) % 60, value % 60)
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+
+    for unit in _UNITS:
+        if value < 1024 or unit == _UNITS[-1]:
+            break
+        value /= 1024.0
+
+    if not unit:
+        return "%i" % (value,)
+
+    return "%.1f%s" % (value, unit)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="paleomix run_log")
+    parser.add_argument(
+        "logs", nargs="+", help="One or more logs written using --run-log."
+    )
+    parser.add_argument(
+        "--group-by",
+        default="class",
+        choices=sorted(_GROUP_BY),
+        help="Summarize tasks by node class, by pipeline stage (the module "
+        "implementing the node), or by sample [%(default)s]",
+    )
+    parser.add_argument(
+        "--sample-depth",
+        type=int,
+        default=2,
+        help="Zero-based index of the component of the output folder that contains "
+        "the sample name, when using '--group-by sample'. The default corresponds "
+        "to the layout of the BAM pipeline, namely "
+        "'<target>/<genome>/<sample>/...' [%(default)s]",
+    )
+    parser.add_argument(
+        "--last-run",
+        default=False,
+        action="store_true",
+        help="Only summarize the most recent run of the pipeline in each log",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=None,
+        help="Only print the N groups with the highest total wall-clock time",
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Main function; takes a list of arguments but excluding sys.argv[0]."""
+    args = parse_args(argv)
+    log = logging.getLogger(__name__)
+    if args.sample_depth < 0:
+        log.error("--sample-depth must be >= 0, not %i", args.sample_depth)
+        return 1
+    elif args.top is not None and args.top < 1:
+        log.error("--top must be >= 1, not %i", args.top)
+        return 1
+
+    records = []
+    for filename in args.logs:
+        try:
+            run_records = list(read_run_log(filename))
+        except (OSError, RunLogError) as error:
+            log.error("Error reading run log: %s", error)
+            return 1
+
+        if args.last_run:
+            run_records = _select_last_run(run_records)
+        records.extend(run_records)
+
+    for line in padded_table(summarize(records, args)):
+        print(line)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
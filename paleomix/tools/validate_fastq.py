@@ -22,11 +22,19 @@
 #
 import sys
 import argparse
+import io
 import json
 
+from paleomix.common.fileutils import open_ro
 from paleomix.common.formats.fastq import FASTQ, FASTQualities
 
 
+# Size of blocks read when validating FASTQ files
+_BLOCK_SIZE = 4 * 1024 * 1024
+# ASCII whitespace stripped from the end of lines by str.rstrip (except newlines)
+_WHITESPACE = (b" ", b"\t", b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e", b"\x1f")
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser("validate_fastq")
     parser.add_argument("files", nargs="+")
@@ -37,6 +45,117 @@ def parse_args(argv):
     return parser.parse_args(argv)
 
 
+def validate_file(filename, qualities):
+    """Validates a (gzip/bzip2 compressed) FASTQ file, updating 'qualities'
+    with the quality scores observed, and returns a tuple containing the number
+    of reads and the number of nucleotides in the file. A FASTQError is raised
+    if the file contains invalid records.
+
+    Blocks of complete records are validated using operations on bytes objects
+    rather than on individual records. Blocks that could be parsed differently
+    by FASTQ.from_lines (e.g. due to non-ASCII characters, universal newlines, or
+    trailing whitespace) and blocks failing validation are instead passed to
+    FASTQ.from_lines along with the remainder of the file, to ensure identical
+    behavior, including error messages.
+    """
+    reads = nucleotides = 0
+    with open_ro(filename, "rb") as handle:
+        data = b""
+        while True:
+            block = handle.read(_BLOCK_SIZE)
+            data += block
+
+            lines = data.split(b"\n")
+            # The last line is incomplete (or empty), so only complete records are
+            # validated here; the remaining lines are carried over to the next block
+            records = (len(lines) - 1) // 4
+            if records:
+                remainder = lines[records * 4 :]
+                del lines[records * 4 :]
+
+                result = _validate_lines(lines, qualities)
+                if result is None:
+                    break
+
+                reads += records
+                nucleotides += result
+                data = b"\n".join(remainder)
+
+            if not block:
+                break
+
+        if data:
+            # Remaining lines are partial records or failed validation
+            stream = io.TextIOWrapper(io.BufferedReader(_PrefixedReader(data, handle)))
+            for record in FASTQ.from_lines(stream):
+                qualities.update(record)
+
+                reads += 1
+                nucleotides += len(record.sequence)
+
+    return reads, nucleotides
+
+
+def _validate_lines(lines, qualities):
+    """Validates a block of complete FASTQ records; returns the number of
+    nucleotides in the block, or None if the block must be validated using
+    FASTQ.from_lines instead."""
+    headers = b"\n" + b"\n".join(lines[0::4]) + b"\n"
+    sequences = b"".join(lines[1::4])
+    separators = b"\n" + b"\n".join(lines[2::4]) + b"\n"
+    scores = b"".join(lines[3::4])
+
+    for value in (headers, sequences, separators, scores):
+        if not value.isascii() or b"\r" in value:
+            return None
+
+    for value in _WHITESPACE:
+        # Whitespace may be found in headers/separators, but not at the end of lines
+        if value in sequences or value in scores:
+            return None
+        elif value in headers:
+            if value + b"\n" in headers or b"\n@" + value in headers:
+                return None
+        elif value in separators and value + b"\n" in separators:
+            return None
+
+    records = len(lines) // 4
+    if headers.count(b"\n@") != records or separators.count(b"\n+") != records:
+        return None
+    elif b"\n@\n" in headers:
+        return None  # Header without a name
+
+    lengths = list(map(len, lines[1::4]))
+    if lengths != list(map(len, lines[3::4])):
+        return None
+
+    qualities.update_bytes(scores)
+
+    return sum(lengths)
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Raw stream returning 'prefix' followed by the contents of 'handle'."""
+
+    def __init__(self, prefix, handle):
+        self._prefix = prefix
+        self._handle = handle
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            data = self._prefix[: len(buffer)]
+            self._prefix = self._prefix[len(data) :]
+        else:
+            data = self._handle.read(len(buffer))
+
+        buffer[: len(data)] = data
+
+        return len(data)
+
+
 def main(argv):
     args = parse_args(argv)
 
@@ -45,11 +164,10 @@ def main(argv):
 
     for filename in args.files:
         qualities = FASTQualities()
-        for record in FASTQ.from_file(filename):
-            qualities.update(record)
+        reads, nucleotides = validate_file(filename, qualities)
 
-            seq_retained_reads += 1
-            seq_retained_nts += len(record.sequence)
+        seq_retained_reads += reads
+        seq_retained_nts += nucleotides
 
         offsets = qualities.offsets()
         if offsets == FASTQualities.BOTH:
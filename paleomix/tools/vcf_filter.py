@@ -24,8 +24,6 @@ import argparse
 import errno
 import sys
 
-import pysam
-
 import paleomix
 import paleomix.common.vcffilter as vcffilter
 
@@ -35,18 +33,13 @@ from paleomix.common.fileutils import open_ro
 def _read_files(args):
     in_header = True
     has_filters = False
-    vcf_parser = pysam.asVCF()
     for filename in args.filenames:
         with open_ro(filename, "rb") as handle:
             for line in handle:
                 if not line.startswith(b"#"):
                     in_header = False
-                    line = line.rstrip(b"\n\r")
-                    vcf = vcf_parser(line, len(line))
-                    if args.reset_filter:
-                        vcf.filter = "."
 
-                    yield vcf
+                    yield line.rstrip(b"\n\r").decode("utf-8")
                 elif in_header:
                     if not (line.startswith(b"##") or has_filters):
                         has_filters = True
@@ -88,8 +81,9 @@ def main(argv):
         parser.error("STDIN is a terminal, terminating!")
 
     try:
-        for vcf in vcffilter.filter_vcfs(args, _read_files(args)):
-            print(vcf)
+        records = _read_files(args)
+        for line in vcffilter.filter_vcf_lines(args, records, args.reset_filter):
+            print(line)
     except IOError as error:
         # Check for broken pipe (head, less, etc).
         if error.errno != errno.EPIPE:
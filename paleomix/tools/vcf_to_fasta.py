@@ -33,12 +33,17 @@ BED features with the same name are merged into single sequences. To ensure
 that indels are called near sequence termini, the script expects the VCF file
 to contain a certain amount of padding around the regions of interest.
 
+Regions may be built using multiple processes (--threads), each of which reads
+the VCF file independently; sequences are written in the same order as when
+using a single process.
 """
 
 
 import argparse
 import copy
+import functools
 import itertools
+import multiprocessing
 import os
 import sys
 import re
@@ -51,6 +56,7 @@ import paleomix.common.sequences as sequences
 import paleomix.common.utilities as utilities
 
 from paleomix.common.bedtools import BEDRecord
+from paleomix.common.procs import init_pool_worker
 
 
 # Max number of positions to keep in memory / genotype at once
@@ -60,6 +66,9 @@ _FASTA_COLUMNS = 60
 
 _VCF_DICT = re.compile("##(.*)=<(.*)>")
 
+# Tabix file opened by each worker process when building regions in parallel
+_WORKER_GENOTYPE = None
+
 
 ###############################################################################
 ###############################################################################
@@ -72,11 +81,13 @@ def flush_fasta(sequence):
     incomplete line (if any) is returned.
 
     """
-    for seq_frag in utilities.fragment(_FASTA_COLUMNS, sequence):
-        if len(seq_frag) < _FASTA_COLUMNS:
-            return seq_frag
-        print(seq_frag)
-    return ""
+    end = len(sequence) - len(sequence) % _FASTA_COLUMNS
+    if end:
+        lines = utilities.fragment(_FASTA_COLUMNS, sequence[:end])
+        sys.stdout.write("\n".join(lines))
+        sys.stdout.write("\n")
+
+    return sequence[end:]
 
 
 def split_beds(beds, size=_SEQUENCE_CHUNK):
@@ -100,6 +111,52 @@ def split_beds(beds, size=_SEQUENCE_CHUNK):
 # Genotyping functions
 
 
+class RegionSequence:
+    """Sequence of a region, stored as a preallocated buffer of single bases;
+    positions that are deleted, or that contain more than one base (e.g. due to
+    insertions), are recorded separately."""
+
+    def __init__(self, length):
+        self._buffer = bytearray(b"N" * length)
+        self._changes = {}
+
+    def __getitem__(self, position):
+        value = self._changes.get(position)
+        if value is None:
+            value = chr(self._buffer[position])
+
+        return value
+
+    def __setitem__(self, position, value):
+        if len(value) == 1:
+            self._buffer[position] = ord(value)
+            self._changes.pop(position, None)
+        else:
+            self._changes[position] = value
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def to_string(self, start, end):
+        """Returns the sequence of positions [start; end), discarding insertions
+        after the last position."""
+        changes = sorted(pos for pos in self._changes if start <= pos < end)
+        if not changes:
+            return self._buffer[start:end].decode("ascii")
+
+        fragments = []
+        for pos in changes:
+            fragments.append(self._buffer[start:pos].decode("ascii"))
+            fragments.append(self._changes[pos])
+            start = pos + 1
+        fragments.append(self._buffer[start:end].decode("ascii"))
+
+        if changes[-1] == end - 1 and not fragments[-1]:
+            fragments[-2] = fragments[-2][:1]
+
+        return "".join(fragments)
+
+
 def add_snp(options, snp, position, sequence):
     if snp.alt != ".":
         genotype = "".join(vcfwrap.get_ml_genotype(snp, options.nth_sample))
@@ -169,11 +226,11 @@ def build_region(options, genotype, bed):
     start = max(0, bed.start - options.padding)
 
     indels = []
-    sequence = ["N"] * (bed.end - start)
+    sequence = RegionSequence(bed.end - start)
     for vcf in filter_vcfs(genotype, bed.contig, start, bed.end):
         if vcfwrap.is_indel(vcf):
             indels.append(vcf)
-        else:
+        elif 0 <= vcf.pos - start < len(sequence):
             add_snp(options, vcf, vcf.pos - start, sequence)
 
     if not options.ignore_indels:
@@ -182,30 +239,63 @@ def build_region(options, genotype, bed):
 
     offset = bed.start - start
     length = bed.end - bed.start
-    truncated = sequence[offset : offset + length]
 
-    # Discard insertions after the last position
-    truncated[-1] = truncated[-1][:1]
+    return sequence.to_string(offset, offset + length)
+
+
+def build_regions(options, genotype, tasks):
+    """Yields the sequence of each (bed, reverse_compl) pair in 'tasks'; if
+    'options.threads' is greater than one, regions are built in worker processes
+    that each open the VCF file, but sequences are still returned in order."""
+    if options.threads > 1 and len(tasks) > 1:
+        threads = min(options.threads, len(tasks))
+        chunksize = max(1, min(64, len(tasks) // (threads * 4)))
+
+        with multiprocessing.Pool(
+            threads, initializer=_init_worker, initargs=(options.genotype,)
+        ) as pool:
+            yield from pool.imap(
+                functools.partial(_build_region_in_worker, options),
+                tasks,
+                chunksize=chunksize,
+            )
+    else:
+        for task in tasks:
+            yield _build_region(options, genotype, task)
 
-    return "".join(truncated)
 
+def _build_region(options, genotype, task):
+    bed, reverse_compl = task
+    sequence = build_region(options, genotype, bed)
+    if reverse_compl:
+        sequence = sequences.reverse_complement(sequence)
+
+    return sequence
+
+
+def _init_worker(filename):
+    global _WORKER_GENOTYPE
+
+    init_pool_worker()
+    _WORKER_GENOTYPE = pysam.TabixFile(filename)
+
+
+def _build_region_in_worker(options, task):
+    return _build_region(options, _WORKER_GENOTYPE, task)
 
-def build_regions(options, genotype, beds, reverse_compl):
-    for bed in beds:
-        sequence = build_region(options, genotype, bed)
-        if reverse_compl:
-            sequence = sequences.reverse_complement(sequence)
-        yield sequence
 
+def build_genes(regions):
+    """Yields (gene, beds, reverse_compl) tuples for each gene, where beds are
+    split into chunks of at most _SEQUENCE_CHUNK bp, in the order in which they
+    are to be concatenated."""
 
-def build_genes(options, genotype, regions):
     def keyfunc(bed):
         return (bed.contig, bed.name, bed.start)
 
     regions.sort(key=keyfunc)
 
     for (gene, beds) in itertools.groupby(regions, lambda x: x.name):
-        beds = split_beds(beds)
+        beds = split_beds(beds, _SEQUENCE_CHUNK)
         reverse_compl = False
         if any((bed.strand == "-") for bed in beds):
             assert all((bed.strand == "-") for bed in beds)
@@ -213,21 +303,28 @@ def build_genes(options, genotype, regions):
             beds.reverse()
             reverse_compl = True
 
-        fragments = build_regions(options, genotype, beds, reverse_compl)
-        yield (gene, fragments)
+        yield (gene, beds, reverse_compl)
 
 
 def genotype_genes(options, intervals, genotype):
+    genes = []
     for (_, beds) in sorted(intervals.items()):
-        for (name, fragments) in build_genes(options, genotype, beds):
-            print(">%s" % (name,))
+        genes.extend(build_genes(beds))
 
-            sequence = ""
-            for fragment in fragments:
-                sequence = flush_fasta(sequence + fragment)
+    tasks = []
+    for (_, beds, reverse_compl) in genes:
+        tasks.extend((bed, reverse_compl) for bed in beds)
 
-            if sequence:
-                print(sequence)
+    fragments = build_regions(options, genotype, tasks)
+    for (name, beds, _) in genes:
+        print(">%s" % (name,))
+
+        sequence = ""
+        for fragment in itertools.islice(fragments, len(beds)):
+            sequence = flush_fasta(sequence + fragment)
+
+        if sequence:
+            print(sequence)
 
     return 0
 
@@ -353,6 +450,12 @@ def main(argv):
         default=False,
         help="Do not include indels generated FASTA " "sequence [%(default)s].",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of processes used to build regions [%(default)s]",
+    )
 
     opts = parser.parse_args(argv)
 
@@ -372,6 +475,9 @@ def main(argv):
         sys.stderr.write("ERROR: --nth-sample uses 1-based offsets, zero and\n")
         sys.stderr.write("       negative values are not allowed!\n")
         return 1
+    elif opts.threads < 1:
+        sys.stderr.write("ERROR: --threads must be at least 1\n")
+        return 1
 
     # Relevant VCF functions uses zero-based offsets
     opts.nth_sample -= 1
@@ -20,15 +20,61 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+"""Loading of YAML files using the YAML 1.1 'safe' loader from ruamel.yaml.
+
+Documents are parsed using the C parser provided by ruamel.yaml.clib, if it is
+installed, which is several times faster than the pure-Python parser. Values
+are constructed using the same (pure-Python) constructor for either parser,
+which also handles the detection of duplicate keys. Since the C parser reports
+errors differently, documents that cannot be loaded using the C parser are
+re-parsed using the pure-Python parser, in order to ensure that errors are
+always reported the same way.
+"""
+
+import io
 import warnings
 
 import ruamel.yaml
+import ruamel.yaml.main
 
 from ruamel.yaml import YAMLError  # noqa: F401
 
 
+# True if the C parser from ruamel.yaml.clib is available
+C_PARSER_AVAILABLE = getattr(ruamel.yaml.main, "CParser", None) is not None
+
+
 def safe_load(stream):
-    yaml = ruamel.yaml.YAML(typ="safe", pure=True)
+    if not C_PARSER_AVAILABLE:
+        return _safe_load(stream, pure=True)
+
+    name = None
+    if hasattr(stream, "read"):
+        # The name of the stream is included in error messages by ruamel.yaml
+        name = getattr(stream, "name", "<file>")
+        stream = stream.read()
+
+    try:
+        return _safe_load(stream, pure=False)
+    except YAMLError:
+        pass
+
+    if name is not None:
+        stream = _to_stream(stream)
+        stream.name = name
+
+    return _safe_load(stream, pure=True)
+
+
+def _to_stream(data):
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+
+    return io.StringIO(data)
+
+
+def _safe_load(stream, pure):
+    yaml = ruamel.yaml.YAML(typ="safe", pure=pure)
     yaml.version = (1, 1)
 
     with warnings.catch_warnings():
@@ -136,6 +136,22 @@ def test_atomiccmd__paths():
     assert "pipe.stdout" in cmd.optional_temp_files
 
 
+def test_atomiccmd__to_call():
+    cmd = AtomicCmd(
+        ("cat", "%(IN_FILE)s", "%(OUT_FILE)s", "%(TEMP_OUT_FILE)s"),
+        IN_FILE="/a/b/c",
+        OUT_FILE="/out/foo",
+        TEMP_OUT_FILE="bar",
+    )
+
+    assert cmd.to_call("${TEMP_DIR}") == [
+        "cat",
+        "/a/b/c",
+        "${TEMP_DIR}/foo",
+        "${TEMP_DIR}/bar",
+    ]
+
+
 def test_atomiccmd__paths_optional():
     cmd = AtomicCmd(["ls"], IN_OPTIONAL=None, OUT_OPTIONAL=None)
     assert cmd.input_files == frozenset()
@@ -511,6 +527,25 @@ def test_atomiccmd__wait(tmp_path, call, after):
     assert cmd.wait() == after
 
 
+def test_atomiccmd__max_rss(tmp_path):
+    cmd = AtomicCmd("true")
+    assert cmd.max_rss is None
+    cmd.run(tmp_path)
+    assert cmd.max_rss is None
+    assert cmd.join() == [0]
+    assert cmd.max_rss > 0
+
+
+def test_atomiccmd__max_rss_after_ready(tmp_path):
+    cmd = AtomicCmd("true")
+    cmd.run(tmp_path)
+    # Popen.poll reaps the process, so resource usage cannot be collected
+    while not cmd.ready():
+        pass
+    assert cmd.join() == [0]
+    assert cmd.max_rss is None
+
+
 ###############################################################################
 ###############################################################################
 # Terminate
@@ -260,6 +260,25 @@ def test_parallel_commands__join_after_run(tmp_path):
     assert cmds.join() == [0, 0, 0]
 
 
+@pytest.mark.parametrize(
+    "cls, max_rss, expected",
+    (
+        (ParallelCmds, (None, None), None),
+        (ParallelCmds, (1024, None, 2048), 3072),
+        (SequentialCmds, (None, None), None),
+        (SequentialCmds, (1024, None, 2048), 2048),
+    ),
+)
+def test_command_set__max_rss(cls, max_rss, expected):
+    commands = []
+    for value in max_rss:
+        command = AtomicCmd("true")
+        command._rusage = None if value is None else Mock(ru_maxrss=value // 1024)
+        commands.append(command)
+
+    assert cls(commands).max_rss == expected
+
+
 def _setup_mocks_for_failure(*do_mocks):
     results = []
     for do_mock in do_mocks:
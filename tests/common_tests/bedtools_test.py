@@ -21,11 +21,13 @@
 # SOFTWARE.
 #
 import copy
+import random
 
 import pytest
 
 from paleomix.common.bedtools import (
     BEDError,
+    BEDIndex,
     BEDRecord,
     merge_bed_records,
     pad_bed_records,
@@ -405,3 +407,162 @@ def _new_bed_record(*args):
     record._fields = list(args)
 
     return record
+
+
+###############################################################################
+###############################################################################
+# BEDIndex
+
+
+def _bed(contig, start, end, name=""):
+    return BEDRecord("%s\t%i\t%i\t%s" % (contig, start, end, name))
+
+
+def _overlapping(records, contig, start, end):
+    return sorted(
+        record
+        for record in records
+        if record.contig == contig and record.start < end and record.end > start
+    )
+
+
+def test_bedindex__empty():
+    index = BEDIndex()
+
+    assert len(index) == 0
+    assert "chr1" not in index
+    assert index.overlapping("chr1", 0, 100) == []
+
+
+def test_bedindex__overlapping():
+    records = [_bed("chr1", 10, 20), _bed("chr1", 15, 30), _bed("chr2", 10, 20)]
+    index = BEDIndex(records)
+
+    assert len(index) == 3
+    assert sorted(index.overlapping("chr1", 0, 10)) == []
+    assert sorted(index.overlapping("chr1", 0, 11)) == records[:1]
+    assert sorted(index.overlapping("chr1", 19, 20)) == records[:2]
+    assert sorted(index.overlapping("chr1", 20, 40)) == records[1:2]
+    assert sorted(index.overlapping("chr1", 30, 40)) == []
+    assert sorted(index.overlapping("chr2", 0, 100)) == records[2:]
+    assert sorted(index.overlapping("chr3", 0, 100)) == []
+
+
+def test_bedindex__covering():
+    records = [_bed("chr1", 10, 20), _bed("chr1", 12, 14), _bed("chr1", 13, 30)]
+    index = BEDIndex(records)
+
+    assert sorted(index.covering("chr1", 9)) == []
+    assert sorted(index.covering("chr1", 10)) == records[:1]
+    assert sorted(index.covering("chr1", 13)) == records
+    assert sorted(index.covering("chr1", 14)) == [records[0], records[2]]
+    assert sorted(index.covering("chr1", 30)) == []
+
+
+def test_bedindex__nested_records():
+    records = [
+        _bed("chr1", 0, 100, "a"),
+        _bed("chr1", 10, 50, "b"),
+        _bed("chr1", 20, 30, "c"),
+        _bed("chr1", 20, 30, "d"),
+        _bed("chr1", 60, 70, "e"),
+    ]
+    index = BEDIndex(records)
+
+    assert len(index) == 5
+    assert sorted(index.covering("chr1", 25)) == records[:4]
+    assert sorted(index.covering("chr1", 65)) == [records[0], records[4]]
+    assert sorted(index.overlapping("chr1", 45, 65)) == [
+        records[0],
+        records[1],
+        records[4],
+    ]
+
+
+def test_bedindex__intersect_sorted():
+    records = [_bed("chr1", 10, 20), _bed("chr1", 15, 30), _bed("chr2", 10, 20)]
+    regions = [_bed("chr1", 0, 12), _bed("chr1", 25, 26), _bed("chr2", 0, 5)]
+    index = BEDIndex(records)
+
+    assert list(index.intersect_sorted(regions)) == [
+        (regions[0], records[:1]),
+        (regions[1], records[1:2]),
+        (regions[2], []),
+    ]
+
+
+def test_bedindex__intersect_sorted__unsorted_regions():
+    index = BEDIndex([_bed("chr1", 10, 20)])
+    regions = [_bed("chr1", 15, 16), _bed("chr1", 10, 11)]
+
+    with pytest.raises(ValueError):
+        list(index.intersect_sorted(regions))
+
+
+def test_bedindex__random_records():
+    rng = random.Random(12345)
+    records = []
+    for _ in range(500):
+        contig = rng.choice(("chr1", "chr2"))
+        start = rng.randint(0, 1000)
+        records.append(_bed(contig, start, start + rng.randint(1, 200)))
+
+    queries = []
+    for _ in range(500):
+        contig = rng.choice(("chr1", "chr2", "chr3"))
+        start = rng.randint(0, 1200)
+        queries.append(_bed(contig, start, start + rng.randint(1, 50)))
+
+    index = BEDIndex(records)
+    for query in queries:
+        result = index.overlapping(query.contig, query.start, query.end)
+        expected = _overlapping(records, query.contig, query.start, query.end)
+
+        assert sorted(result) == expected
+
+    queries.sort(key=lambda query: (query.contig, query.start))
+    for (query, result) in index.intersect_sorted(queries):
+        expected = _overlapping(records, query.contig, query.start, query.end)
+
+        assert sorted(result) == expected
+
+
+def test_bedindex__identical_records_are_siblings():
+    records = [_bed("chr1", 10, 20) for _ in range(3000)]
+    index = BEDIndex(records)
+
+    ends, _, sublists = index._contigs["chr1"]
+    assert len(ends) == 3000
+    assert sublists == [None] * 3000
+
+    assert len(index) == 3000
+    assert len(index.covering("chr1", 15)) == 3000
+    assert index.covering("chr1", 20) == []
+    assert [len(result) for (_, result) in index.intersect_sorted(records)] == [
+        3000
+    ] * 3000
+
+
+def test_bedindex__deeply_nested_records():
+    records = [_bed("chr1", idx, 10000 - idx) for idx in range(3000)]
+    index = BEDIndex(records)
+
+    assert len(index) == 3000
+    assert index.covering("chr1", 5000) == records
+    assert index.covering("chr1", 1500) == records[:1501]
+    assert index.overlapping("chr1", 2999, 7002) == records
+    assert index.overlapping("chr1", 0, 1) == records[:1]
+
+
+def test_bedindex__nested_records_order():
+    records = [
+        _bed("chr1", 0, 100, "a"),
+        _bed("chr1", 10, 50, "b"),
+        _bed("chr1", 20, 30, "c"),
+        _bed("chr1", 40, 45, "d"),
+        _bed("chr1", 60, 70, "e"),
+    ]
+    index = BEDIndex(reversed(records))
+
+    # Parent records are returned before the records they contain
+    assert index.overlapping("chr1", 0, 100) == records
@@ -26,6 +26,8 @@ import gzip
 import os
 import shutil
 import stat
+import struct
+import zlib
 
 from pathlib import Path
 from typing import Any
@@ -33,6 +35,8 @@ from unittest.mock import ANY, call, DEFAULT, Mock, patch
 
 import pytest
 
+import paleomix.common.fileutils as fileutils
+
 from paleomix.common.testing import SetWorkingDirectory
 
 from paleomix.common.fileutils import (
@@ -48,6 +52,7 @@ from paleomix.common.fileutils import (
     open_ro,
     try_remove,
     try_rmtree,
+    calculate_checksum,
     describe_files,
     describe_paired_files,
 )
@@ -609,6 +614,140 @@ def test_open_ro__binary(func, tmp_path) -> None:
         assert handle.read() == _FASTA_BYTES
 
 
+def _bgzf_block(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    header += struct.pack("<H", len(cdata) + 25)
+    trailer = struct.pack("<II", zlib.crc32(data), len(data))
+
+    return header + cdata + trailer
+
+
+def _write_bgzf(filename: Path, data: bytes, block_size: int = 7) -> None:
+    with filename.open("wb") as handle:
+        for start in range(0, len(data), block_size):
+            handle.write(_bgzf_block(data[start : start + block_size]))
+        # EOF block
+        handle.write(_bgzf_block(b""))
+
+
+@pytest.mark.parametrize("blocks_per_task", (1, 3, 16))
+def test_open_ro__bgzf(monkeypatch, tmp_path, blocks_per_task) -> None:
+    monkeypatch.setattr(fileutils, "_BGZF_BLOCKS_PER_TASK", blocks_per_task)
+    filename = tmp_path / "file.fasta.gz"
+    _write_bgzf(filename, _FASTA_BYTES)
+
+    # Check that the file is readable using the regular gzip module
+    with gzip.open(filename, "rb") as handle:
+        assert handle.read() == _FASTA_BYTES
+
+    with open_ro(filename) as handle:
+        assert list(handle) == _FASTA_TEXT.splitlines(True)
+
+    with open_ro(filename, "rb") as handle:
+        assert handle.read() == _FASTA_BYTES
+
+
+def test_open_ro__bgzf__truncated(tmp_path) -> None:
+    filename = tmp_path / "file.fasta.gz"
+    _write_bgzf(filename, _FASTA_BYTES)
+    data = filename.read_bytes()
+    filename.write_bytes(data[: len(data) // 2])
+
+    with open_ro(filename) as handle:
+        with pytest.raises(EOFError):
+            handle.read()
+
+
+def test_open_ro__bgzf__corrupt(tmp_path) -> None:
+    block = bytearray(_bgzf_block(_FASTA_BYTES))
+    # Corrupt the CRC32 of the uncompressed data
+    block[-8] ^= 0xFF
+
+    filename = tmp_path / "file.fasta.gz"
+    filename.write_bytes(bytes(block))
+
+    with open_ro(filename, "rb") as handle:
+        with pytest.raises(OSError, match="CRC32"):
+            handle.read()
+
+
+@pytest.mark.parametrize("blocks_per_task", (1, 3, 16))
+def test_open_ro__bgzf__followed_by_gzip(
+    monkeypatch, tmp_path, blocks_per_task
+) -> None:
+    monkeypatch.setattr(fileutils, "_BGZF_BLOCKS_PER_TASK", blocks_per_task)
+    bgzf_file = tmp_path / "file.bgzf.gz"
+    _write_bgzf(bgzf_file, _FASTA_BYTES)
+    bgzf_data = bgzf_file.read_bytes()
+
+    # Equivalent to 'cat file.bgzf.gz file.gzip.gz file.bgzf.gz'
+    filename = tmp_path / "file.fasta.gz"
+    filename.write_bytes(bgzf_data + gzip.compress(_FASTA_BYTES) + bgzf_data)
+
+    with open_ro(filename, "rb") as handle:
+        assert handle.read() == _FASTA_BYTES * 3
+
+
+def test_open_ro__bgzf__followed_by_gzip__close_before_eof(tmp_path) -> None:
+    bgzf_file = tmp_path / "file.bgzf.gz"
+    _write_bgzf(bgzf_file, _FASTA_BYTES)
+
+    filename = tmp_path / "file.fasta.gz"
+    filename.write_bytes(bgzf_file.read_bytes() + gzip.compress(_FASTA_BYTES * 100))
+
+    handle = open_ro(filename, "rb")
+    assert handle.read(len(_FASTA_BYTES) + 5) == _FASTA_BYTES + _FASTA_BYTES[:5]
+    handle.close()
+
+    assert handle.closed
+
+
+def test_open_ro__bgzf__followed_by_garbage(tmp_path) -> None:
+    filename = tmp_path / "file.fasta.gz"
+    _write_bgzf(filename, _FASTA_BYTES)
+    filename.write_bytes(filename.read_bytes() + b"not a gzip member")
+
+    with open_ro(filename, "rb") as handle:
+        with pytest.raises(OSError):
+            handle.read()
+
+
+def test_open_ro__gzip__multiple_members(tmp_path) -> None:
+    filename = tmp_path / "file.fasta.gz"
+    with filename.open("wb") as handle:
+        handle.write(gzip.compress(_FASTA_BYTES[:10]))
+        handle.write(gzip.compress(_FASTA_BYTES[10:]))
+
+    with open_ro(filename) as handle:
+        assert list(handle) == _FASTA_TEXT.splitlines(True)
+
+
+def test_open_ro__gzip__close_before_eof(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(fileutils, "_GZIP_CHUNK_SIZE", 1)
+    filename = tmp_path / "file.fasta.gz"
+    with gzip.open(filename, "wb") as handle:
+        handle.write(_FASTA_BYTES * 100)
+
+    handle = open_ro(filename, "rb")
+    assert handle.read(5) == _FASTA_BYTES[:5]
+    handle.close()
+
+    assert handle.closed
+
+
+def test_open_ro__gzip__truncated(tmp_path) -> None:
+    filename = tmp_path / "file.fasta.gz"
+    data = gzip.compress(_FASTA_BYTES)
+    filename.write_bytes(data[: len(data) // 2])
+
+    with open_ro(filename) as handle:
+        with pytest.raises(EOFError):
+            handle.read()
+
+
 class OddException(RuntimeError):
     pass
 
@@ -676,6 +815,28 @@ def test_try_treedir__missing(tmp_path: Path) -> None:
     assert not fpath.exists()
 
 
+###############################################################################
+###############################################################################
+# Tests for 'calculate_checksum'
+
+
+def test_calculate_checksum__empty_file(tmp_path: Path) -> None:
+    fpath = tmp_path / "file"
+    fpath.write_bytes(b"")
+    assert calculate_checksum(fpath) == (
+        "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    )
+
+
+def test_calculate_checksum__multiple_blocks(tmp_path: Path) -> None:
+    fpath = tmp_path / "file"
+    fpath.write_bytes(b"abc")
+    with patch("paleomix.common.fileutils._CHECKSUM_BLOCK_SIZE", 2):
+        assert calculate_checksum(fpath) == (
+            "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+        )
+
+
 ###############################################################################
 ###############################################################################
 # Tests for 'describe_files'
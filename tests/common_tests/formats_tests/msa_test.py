@@ -25,13 +25,15 @@ import copy
 import gzip
 import io
 import os
+import random
 
 from unittest.mock import patch
 
 import pytest
 
 from paleomix.common.formats.fasta import FASTA
-from paleomix.common.formats.msa import MSA, FASTAError, MSAError
+from paleomix.common.formats.msa import MSA, FASTAError, MSAError, MSAMatrix
+from paleomix.common.sequences import NT_CODES, encode_genotype, split
 
 
 ###############################################################################
@@ -467,3 +469,169 @@ def test_msa_repr():
 
 def test_msa_repr__same_as_str():
     assert str(_JOIN_MSA_1) == repr(_JOIN_MSA_1)
+
+
+###############################################################################
+###############################################################################
+# Tests for 'MSAMatrix'
+
+
+def test_msa_matrix__round_trip():
+    msa = MSA(
+        (
+            FASTA("nc", None, "ACGTA"),
+            FASTA("nm", "META", "TGAGT"),
+            FASTA("miRNA", None, "UCAGA"),
+        )
+    )
+    matrix = MSAMatrix.from_msa(msa)
+
+    assert matrix.names == ("miRNA", "nc", "nm")
+    assert matrix.metas == (None, None, "META")
+    assert matrix.rows == (b"UCAGA", b"ACGTA", b"TGAGT")
+    assert matrix.seqlen() == 5
+    assert len(matrix) == 3
+    assert matrix.to_msa() == msa
+
+
+def test_msa_matrix__empty():
+    with pytest.raises(MSAError):
+        MSAMatrix((), (), ())
+
+
+def test_msa_matrix__differing_lengths():
+    with pytest.raises(MSAError):
+        MSAMatrix(("a", "b"), (None, None), (b"ACGT", b"ACG"))
+
+
+def test_msa_matrix__join__different_names():
+    matrix_1 = MSAMatrix(("a", "b"), (None, None), (b"ACGT", b"TGCA"))
+    matrix_2 = MSAMatrix(("a", "c"), (None, None), (b"ACGT", b"TGCA"))
+
+    with pytest.raises(MSAError):
+        MSAMatrix.join(matrix_1, matrix_2)
+
+
+def test_msa_matrix__join__different_order():
+    matrix_1 = MSAMatrix(("a", "b"), (None, None), (b"ACGT", b"TGCA"))
+    matrix_2 = MSAMatrix(("b", "a"), (None, None), (b"GG", b"CC"))
+    result = MSAMatrix.join(matrix_1, matrix_2)
+
+    assert result.names == ("a", "b")
+    assert result.rows == (b"ACGTCC", b"TGCAGG")
+
+
+def test_msa_filter_singletons__invalid_nucleotide():
+    msa = MSA((FASTA("a", None, "AXGT"), FASTA("b", None, "ACGT")))
+
+    with pytest.raises(KeyError):
+        msa.filter_singletons("a", ["b"])
+
+
+def test_msa_filter_singletons__invalid_nucleotide_in_skipped_column():
+    msa = MSA((FASTA("a", None, "ANGT"), FASTA("b", None, "AXGT")))
+    expected = MSA((FASTA("a", None, "ANGT"), FASTA("b", None, "AXGT")))
+
+    assert msa.filter_singletons("a", ["b"]) == expected
+
+
+# Column-by-column implementations of MSA functions used to verify MSAMatrix
+
+
+def _reference_reduce(msa):
+    columns = []
+    for column in zip(*(record.sequence for record in msa)):
+        if frozenset(column) - frozenset("Nn-"):
+            columns.append(column)
+
+    if not columns:
+        return None
+
+    records = []
+    for (record, sequence) in zip(msa, zip(*columns)):
+        records.append(FASTA(record.name, record.meta, "".join(sequence)))
+
+    return MSA(records)
+
+
+def _reference_filter_singletons(msa, to_filter, filter_using):
+    included = [record for record in msa if record.name in filter_using]
+    excluded = [
+        record
+        for record in msa
+        if record.name not in filter_using and record.name != to_filter
+    ]
+    (to_filter,) = [record for record in msa if record.name == to_filter]
+
+    sequence = list(to_filter.sequence)
+    sequences = [record.sequence.upper() for record in included]
+    for (index, nts) in enumerate(zip(*sequences)):
+        current_nt = sequence[index].upper()
+        if current_nt in "N-":
+            continue
+
+        allowed_nts = set()
+        for allowed_nt in nts:
+            if allowed_nt not in "N-":
+                allowed_nts.update(NT_CODES[allowed_nt])
+        filtered_nts = frozenset(NT_CODES[current_nt]) & allowed_nts
+
+        if not filtered_nts:
+            filtered_nts = "N"
+
+        genotype = encode_genotype(filtered_nts)
+        if genotype != current_nt:
+            sequence[index] = genotype.lower()
+    new_record = FASTA(to_filter.name, to_filter.meta, "".join(sequence))
+
+    return MSA([new_record] + included + excluded)
+
+
+def _reference_split(msa, split_by):
+    results = dict((key, set()) for key in split_by)
+    for record in msa:
+        for (key, partition) in split(record.sequence, split_by).items():
+            results[key].add(FASTA(record.name, None, partition))
+
+    return dict((key, MSA(value)) for (key, value) in results.items())
+
+
+def _random_msa(rng, nts, nseqs):
+    length = rng.randint(1, 50)
+    records = []
+    for idx in range(nseqs):
+        sequence = "".join(rng.choice(nts) for _ in range(length))
+        records.append(FASTA("seq%i" % (idx,), rng.choice((None, "meta")), sequence))
+
+    return MSA(records)
+
+
+def test_msa_matrix__random_reduce():
+    rng = random.Random(1234)
+    for _ in range(200):
+        msa = _random_msa(rng, "ACGTNNNNnn----", rng.randint(1, 5))
+
+        assert msa.reduce() == _reference_reduce(msa)
+
+
+def test_msa_matrix__random_filter_singletons():
+    rng = random.Random(2345)
+    nts = "".join(NT_CODES) + "".join(NT_CODES).lower() + "NNN---"
+    for _ in range(200):
+        msa = _random_msa(rng, nts, rng.randint(2, 5))
+        names = sorted(msa.names())
+        to_filter = names.pop(rng.randrange(len(names)))
+        filter_using = rng.sample(names, rng.randint(1, len(names)))
+
+        assert msa.filter_singletons(
+            to_filter, filter_using
+        ) == _reference_filter_singletons(msa, to_filter, filter_using)
+
+
+def test_msa_matrix__random_split():
+    rng = random.Random(3456)
+    for _ in range(200):
+        msa = _random_msa(rng, "ACGTN-", rng.randint(1, 5))
+        split_by = "".join(rng.choice("123X") for _ in range(rng.randint(1, 5)))
+
+        assert msa.split(split_by) == _reference_split(msa, split_by)
@@ -0,0 +1,96 @@
+import sys
+
+import pytest
+
+from paleomix.common.importtime import ImportProfiler
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    root = tmp_path / "importtime_pkg"
+    root.mkdir()
+    (root / "__init__.py").write_text("from . import child\n")
+    (root / "child.py").write_text("VALUE = 17\n")
+    (root / "data.txt").write_text("data\n")
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "importtime_pkg"
+
+    for name in ("importtime_pkg", "importtime_pkg.child"):
+        sys.modules.pop(name, None)
+
+
+def _import_with_profiler(name):
+    profiler = ImportProfiler()
+    profiler.install()
+    try:
+        module = __import__(name)
+    finally:
+        profiler.uninstall()
+
+    return profiler, module
+
+
+def test_import_profiler__records_modules(package):
+    profiler, module = _import_with_profiler(package)
+
+    assert module.child.VALUE == 17
+    assert set(profiler.timings) == {"importtime_pkg", "importtime_pkg.child"}
+
+
+def test_import_profiler__cumulative_includes_children(package):
+    profiler, _ = _import_with_profiler(package)
+
+    parent_self, parent_total = profiler.timings["importtime_pkg"]
+    child_self, child_total = profiler.timings["importtime_pkg.child"]
+
+    assert 0 <= child_self <= child_total
+    assert 0 <= parent_self <= parent_total
+    assert parent_total >= child_total
+    assert parent_total == pytest.approx(parent_self + child_total)
+
+
+def test_import_profiler__loader_attributes_forwarded(package):
+    _, module = _import_with_profiler(package)
+
+    assert module.__loader__.get_data(module.__file__) == b"from . import child\n"
+
+
+def test_import_profiler__uninstall():
+    profiler = ImportProfiler()
+    profiler.install()
+    profiler.install()
+    assert sys.meta_path.count(profiler) == 1
+
+    profiler.uninstall()
+    profiler.uninstall()
+    assert profiler not in sys.meta_path
+
+
+def test_import_profiler__already_imported_modules_not_recorded(package):
+    __import__(package)
+    profiler, _ = _import_with_profiler(package)
+
+    assert profiler.timings == {}
+
+
+def test_import_profiler__report():
+    profiler = ImportProfiler()
+    profiler.timings = {
+        "a": (0.001, 0.003),
+        "b": (0.002, 0.002),
+        "c": (0.0005, 0.0005),
+    }
+
+    assert profiler.report() == [
+        ("Self(ms)", "Cumulative(ms)", "Module"),
+        ("1.0", "3.0", "a"),
+        ("2.0", "2.0", "b"),
+        ("0.5", "0.5", "c"),
+        ("3.5", "-", "*"),
+    ]
+    assert profiler.report(top=1) == [
+        ("Self(ms)", "Cumulative(ms)", "Module"),
+        ("1.0", "3.0", "a"),
+        ("3.5", "-", "*"),
+    ]
@@ -0,0 +1,90 @@
+import json
+import logging
+
+from paleomix.common.jsoncache import JSONCache
+
+
+def test_json_cache__missing_file(tmp_path):
+    cache = JSONCache(str(tmp_path / "cache.json"))
+
+    assert "abc" not in cache
+    assert cache.get("abc") is None
+    assert cache.get("abc", 7) == 7
+
+
+def test_json_cache__save_and_load(tmp_path):
+    filename = str(tmp_path / "cache" / "cache.json")
+    cache = JSONCache(filename)
+    cache.set("abc", [1, 2])
+    cache.save()
+
+    assert JSONCache(filename).get("abc") == [1, 2]
+    with open(filename) as handle:
+        assert json.load(handle) == {"version": 1, "entries": {"abc": [1, 2]}}
+
+
+def test_json_cache__save_without_changes(tmp_path):
+    filename = tmp_path / "cache.json"
+    JSONCache(str(filename)).save()
+
+    assert not filename.exists()
+
+
+def test_json_cache__merges_concurrent_updates(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    cache_1 = JSONCache(filename)
+    cache_2 = JSONCache(filename)
+    cache_1.set("abc", 1)
+    cache_1.save()
+    cache_2.set("def", 2)
+    cache_2.save()
+
+    cache = JSONCache(filename)
+    assert cache.get("abc") == 1
+    assert cache.get("def") == 2
+
+
+def test_json_cache__ignores_other_versions(tmp_path):
+    class _NewCache(JSONCache):
+        VERSION = 2
+
+    filename = str(tmp_path / "cache.json")
+    cache = JSONCache(filename)
+    cache.set("abc", 1)
+    cache.save()
+
+    cache = _NewCache(filename)
+    assert "abc" not in cache
+    cache.set("def", 2)
+    cache.save()
+
+    assert _NewCache(filename).get("def") == 2
+    assert "abc" not in _NewCache(filename)
+    assert "def" not in JSONCache(filename)
+
+
+def test_json_cache__corrupt_file(tmp_path):
+    filename = tmp_path / "cache.json"
+    filename.write_text("{not json")
+
+    assert "abc" not in JSONCache(str(filename))
+
+
+def test_json_cache__unexpected_format(tmp_path):
+    filename = tmp_path / "cache.json"
+    filename.write_text('["abc"]')
+
+    assert "abc" not in JSONCache(str(filename))
+
+
+def test_json_cache__write_errors_are_logged(caplog, tmp_path):
+    filename = tmp_path / "cache.json"
+    filename.mkdir()
+
+    cache = JSONCache(str(filename))
+    cache.set("abc", 1)
+    with caplog.at_level(logging.WARNING):
+        cache.save()
+
+    assert "Could not update cache" in caplog.text
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["cache.json"]
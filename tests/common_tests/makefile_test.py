@@ -53,7 +53,6 @@ from paleomix.common.makefile import (
     PreProcessMakefile,
 )
 
-
 # Dummy value for the path parameters
 _DUMMY_PATH = ("a", "random", "path")
 _DUMMY_PATH_STR = " :: ".join(_DUMMY_PATH)
@@ -1448,3 +1447,69 @@ def test__preprocess_makefile__with_default__missing_value():
 def test__preprocess_makefile__with_default__expected_value():
     spec = {"Key": _PreProcessWithDefault(314)}
     assert {"Key": 14} == process_makefile({"Key": 14}, spec)
+
+
+###############################################################################
+###############################################################################
+# Compiled specifications
+
+
+def test_process_makefile__compiled__repeated_values():
+    spec = {IsStr: {"Key": IsInt(default=7)}}
+    data = {"a": {"Key": 1}, "b": {"Key": 1}, "c": {}}
+
+    assert process_makefile(data, spec) == {
+        "a": {"Key": 1},
+        "b": {"Key": 1},
+        "c": {"Key": 7},
+    }
+
+
+def test_process_makefile__compiled__memoized_values_are_typed():
+    spec = {"Key": [IsInt]}
+
+    assert process_makefile({"Key": [1, 1]}, spec) == {"Key": [1, 1]}
+    with pytest.raises(MakefileError):
+        process_makefile({"Key": [True]}, spec)
+
+
+def test_process_makefile__compiled__memoized_keys_are_typed():
+    spec = {IsInt: IsStr}
+
+    assert process_makefile({1: "a"}, spec) == {1: "a"}
+    with pytest.raises(MakefileError):
+        process_makefile({True: "a"}, spec)
+
+
+def test_process_makefile__compiled__with_and_without_defaults():
+    sub_spec = {"Key": IsInt(default=7)}
+    spec = {"A": sub_spec, "B": WithoutDefaults(sub_spec)}
+
+    assert process_makefile({"A": {}, "B": {}}, spec) == {"A": {"Key": 7}, "B": {}}
+    assert process_makefile({}, sub_spec, apply_defaults=False) == {}
+
+
+def test_process_makefile__compiled__defaults_are_not_shared():
+    spec = {"Key": IsListOf(IsInt, default=[1, 2])}
+
+    result_1 = process_makefile({}, spec)
+    result_2 = process_makefile({}, spec)
+    result_1["Key"].append(3)
+
+    assert result_2 == {"Key": [1, 2]}
+
+
+def test_process_makefile__compiled__removed_options_always_logged(caplog):
+    spec = {IsStr: {"Removed": RemovedOption}}
+
+    process_makefile({"a": {"Removed": 1}, "b": {"Removed": 1}}, spec)
+
+    assert caplog.text.count("option has been removed") == 2
+
+
+def test_process_makefile__compiled__invalid_spec_only_raised_when_used():
+    spec = {"Valid": IsInt, StringStartsWith("-"): object()}
+
+    assert process_makefile({"Valid": 1}, spec) == {"Valid": 1}
+    with pytest.raises(TypeError):
+        process_makefile({"-invalid": 1}, spec)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import io
+import multiprocessing
+import signal
+import threading
+
+import pytest
+
+from paleomix.common.procs import (
+    init_pool_worker,
+    iter_completed,
+    join_procs,
+    open_proc,
+)
+
+
+###############################################################################
+###############################################################################
+# Tests for 'iter_completed'
+
+
+def test_iter_completed__empty():
+    assert list(iter_completed([], lambda item: item)) == []
+
+
+def test_iter_completed__in_order_of_completion():
+    events = [threading.Event() for _ in range(3)]
+
+    def _join(index):
+        events[index].wait()
+        if index + 1 < len(events):
+            events[index + 1].set()
+        return index * 10
+
+    events[0].set()
+    result = list(iter_completed([2, 0, 1], _join))
+
+    assert result == [(1, 0), (2, 10), (0, 20)]
+
+
+def test_iter_completed__exception_is_reraised():
+    def _join(item):
+        raise KeyError(item)
+
+    with pytest.raises(KeyError):
+        list(iter_completed(["foo"], _join))
+
+
+###############################################################################
+###############################################################################
+# Tests for 'join_procs'
+
+
+def test_join_procs__success():
+    procs = [open_proc(["true"]) for _ in range(3)]
+
+    assert join_procs(procs, out=io.StringIO()) == [0, 0, 0]
+
+
+def test_join_procs__failure_terminates_other_processes():
+    procs = [
+        open_proc(["sleep", "10"]),
+        open_proc(["false"]),
+        open_proc(["sleep", "10"]),
+    ]
+    out = io.StringIO()
+
+    return_codes = join_procs(procs, out=out)
+
+    assert return_codes == [-15, 1, -15]
+    assert "Terminating command: sleep 10" in out.getvalue()
+
+
+###############################################################################
+###############################################################################
+# Tests for 'init_pool_worker'
+
+
+def _sigterm_handler(signum, _frame):
+    pass
+
+
+def _has_default_sigterm_handler(_):
+    return signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+
+def test_init_pool_worker__resets_sigterm_handler():
+    # Workers would otherwise ignore the SIGTERM sent by Pool.terminate() when
+    # leaving the with-block, causing the test to hang
+    old_handler = signal.signal(signal.SIGTERM, _sigterm_handler)
+    try:
+        with multiprocessing.get_context("fork").Pool(1, init_pool_worker) as pool:
+            assert pool.map(_has_default_sigterm_handler, [None]) == [True]
+    finally:
+        signal.signal(signal.SIGTERM, old_handler)
@@ -0,0 +1,32 @@
+import pytest
+
+from paleomix.common.system import parse_memory_size
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    (
+        ("0", 0),
+        ("1024", 1024),
+        ("1b", 1),
+        ("2k", 2 * 1024),
+        ("2K", 2 * 1024),
+        ("2kb", 2 * 1024),
+        ("512m", 512 * 1024 ** 2),
+        ("512M", 512 * 1024 ** 2),
+        ("4g", 4 * 1024 ** 3),
+        ("4GB", 4 * 1024 ** 3),
+        ("1t", 1024 ** 4),
+        (" 4g\n", 4 * 1024 ** 3),
+    ),
+)
+def test_parse_memory_size(value, expected):
+    assert parse_memory_size(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value", ("", "g", "-1g", "1.5g", "4 g", "4x", "4gg", "4gib", "four")
+)
+def test_parse_memory_size__invalid(value):
+    with pytest.raises(ValueError, match="invalid memory size"):
+        parse_memory_size(value)
@@ -0,0 +1,199 @@
+import argparse
+import random
+
+import pytest
+
+import paleomix.common.vcffilter as vcffilter
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser()
+    vcffilter.add_varfilter_options(parser)
+
+    return parser.parse_args(argv)
+
+
+def _random_info(rng, is_indel, is_variant):
+    info = []
+    if is_indel:
+        info.append("INDEL")
+
+    info.append("DP=%i" % (rng.randint(0, 20),))
+    if rng.random() < 0.8:
+        info.append("MQ=%i" % (rng.randint(0, 30),))
+    if rng.random() < 0.5:
+        pv4 = (rng.choice(("1", "0.5", "1e-5")) for _ in "1234")
+        info.append("PV4=%s" % ",".join(pv4))
+    if is_variant or rng.random() < 0.5:
+        info.append("DP4=%s" % ",".join(str(rng.randint(0, 3)) for _ in "1234"))
+
+    rng.shuffle(info)
+
+    return ";".join(info)
+
+
+def _random_pl(rng, ref, alt):
+    if rng.random() < 0.1:
+        # Haploid genotypes
+        pl = [rng.randint(0, 3) for _ in range(1 + alt.count(",") + 1)]
+    else:
+        ngenotypes = 1 + alt.count(",") + 1
+        pl = [rng.randint(0, 3) for _ in range(ngenotypes * (ngenotypes + 1) // 2)]
+
+    return ",".join(map(str, pl))
+
+
+def _random_records(rng, nrecords):
+    records = []
+    for contig in ("chr1", "chrX", "chr2"):
+        pos = 1
+        for _ in range(nrecords):
+            pos += rng.choice((0, 1, 1, 2, 3, 5, 10, 20))
+
+            ref = rng.choice("ACGT")
+            is_indel = rng.random() < 0.2
+            if is_indel:
+                if rng.random() < 0.5:
+                    ref += "".join(rng.choice("ACGT") for _ in range(rng.randint(1, 5)))
+                    alt = ref[0]
+                else:
+                    alt = ref + "".join(rng.choice("ACGT") for _ in range(3))
+            else:
+                alt = rng.choice((".", ".", "A", "C", "G", "T", "A,C"))
+
+            fields = [
+                contig,
+                str(pos),
+                ".",
+                ref,
+                alt,
+                str(rng.choice((0, 10, 29, 30, 31, 99.5))),
+                rng.choice((".", ".", "PASS", "q:30", "foo;bar")),
+                _random_info(rng, is_indel, alt != "."),
+                "GT:PL",
+                "0/1:%s" % (_random_pl(rng, ref, alt),),
+            ]
+
+            records.append("\t".join(fields))
+
+    return records
+
+
+def _record(contig="chr1", pos=100, ref="A", alt="G", qual=99, filters=".", **kwargs):
+    info = {"DP": 20, "MQ": 30, "DP4": "0,0,5,5", "PL": "10,0,10"}
+    info.update(kwargs)
+    pl = info.pop("PL")
+    if info.pop("INDEL", False):
+        info["INDEL"] = None
+
+    info = ";".join(k if v is None else "%s=%s" % (k, v) for k, v in info.items())
+    fields = [contig, pos, ".", ref, alt, qual, filters, info, "GT:PL", "0/1:" + pl]
+
+    return "\t".join(map(str, fields))
+
+
+def _filter(argv, records, reset_filter=False):
+    result = vcffilter.filter_vcf_lines(_parse_args(argv), records, reset_filter)
+
+    return [line.split("\t")[6] for line in result]
+
+
+_FILTER_BY_PROPERTIES = (
+    ([], {}, "PASS"),
+    ([], {"filters": "foo"}, "foo"),
+    ([], {"qual": 29}, "q:30"),
+    ([], {"DP": 7}, "d:8"),
+    (["-D", "19"], {}, "D:19"),
+    ([], {"MQ": 9}, "Q:10"),
+    ([], {"PV4": "1e-5,1,1,1e-5"}, "1:1.000000e-04;4:1.000000e-04"),
+    ([], {"DP4": "5,5,1,0"}, "a:2"),
+    ([], {"PL": "0,10,0"}, "k"),
+    (["-k"], {"PL": "0,10,0"}, "PASS"),
+    (["--homozygous-chromosome", "chr1"], {}, "HET"),
+    (["--homozygous-chromosome", "chrX"], {}, "PASS"),
+    ([], {"alt": ".", "DP4": "5,5,0,0", "PL": "0"}, "PASS"),
+    ([], {"qual": 0, "DP": 1}, "q:30;d:8"),
+)
+
+
+@pytest.mark.parametrize("argv, kwargs, expected", _FILTER_BY_PROPERTIES)
+def test_filter_vcf_lines__properties(argv, kwargs, expected):
+    assert _filter(argv, [_record(**kwargs)]) == [expected]
+
+
+def test_filter_vcf_lines__reset_filter():
+    records = [_record(filters="foo"), _record(pos=200, filters="bar", qual=0)]
+
+    assert _filter([], records, reset_filter=True) == ["PASS", "q:30"]
+
+
+def test_filter_vcf_lines__snps_near_indels():
+    records = [
+        _record(pos=97, alt="C"),
+        _record(pos=98, alt="C"),
+        _record(pos=100, ref="AC", alt="A", INDEL=True),
+        _record(pos=103, alt="."),
+        _record(pos=105, alt="C"),
+        _record(pos=106, alt="C"),
+        _record(contig="chr2", pos=100, alt="C"),
+    ]
+
+    assert _filter([], records) == [
+        "PASS",
+        "w:3",
+        "PASS",
+        "PASS",
+        "w:3",
+        "PASS",
+        "PASS",
+    ]
+
+
+def test_filter_vcf_lines__indels_near_indels():
+    records = [
+        _record(pos=100, ref="A", alt="AT", qual=50, INDEL=True),
+        _record(pos=105, ref="A", alt="AT", qual=60, INDEL=True),
+        _record(pos=120, ref="A", alt="AT", qual=50, INDEL=True),
+        _record(pos=125, ref="A", alt="AT", qual=50, INDEL=True),
+        _record(contig="chr2", pos=125, ref="A", alt="AT", qual=99, INDEL=True),
+    ]
+
+    assert _filter(["-w", "0"], records) == ["W:10", "PASS", "PASS", "W:10", "PASS"]
+
+
+@pytest.mark.parametrize("seed", (1, 2, 3))
+@pytest.mark.parametrize("chunk_size", (1, 7))
+@pytest.mark.parametrize("reset_filter", (False, True))
+@pytest.mark.parametrize(
+    "argv",
+    (
+        [],
+        ["--homozygous-chromosome", "chrX", "-k"],
+        ["-w", "0", "-W", "0", "-q", "0"],
+        ["-w", "10", "-W", "3", "-d", "2", "-D", "15", "-a", "0", "-1", "0.6"],
+    ),
+)
+def test_filter_vcf_lines__independent_of_chunk_size(
+    monkeypatch, seed, chunk_size, reset_filter, argv
+):
+    records = _random_records(random.Random(seed), 200)
+    expected = _filter(argv, records, reset_filter)
+
+    monkeypatch.setattr(vcffilter, "_CHUNK_SIZE", chunk_size)
+    assert _filter(argv, records, reset_filter) == expected
+
+
+def test_filter_vcf_lines__records_at_same_position_exceed_chunk_size(monkeypatch):
+    records = [_record(pos=100, alt="C", qual=qual) for qual in range(20, 40)]
+    records.append(_record(pos=100, ref="A", alt="AT", INDEL=True))
+    records.append(_record(pos=1000))
+    expected = _filter([], records)
+
+    monkeypatch.setattr(vcffilter, "_CHUNK_SIZE", 7)
+    assert _filter([], records) == expected
+    assert expected[:10] == ["w:3;q:30"] * 10
+    assert expected[10:] == ["w:3"] * 10 + ["PASS", "PASS"]
+
+
+def test_filter_vcf_lines__empty():
+    assert list(vcffilter.filter_vcf_lines(_parse_args([]), [])) == []
@@ -794,3 +794,180 @@ def test_requirement_highest_priority_retained():
     obj2 = versions.Requirement("echo", "", versions.LT(1), priority=0)
     assert obj1 is obj2
     assert obj2.priority == 5
+
+
+###############################################################################
+###############################################################################
+# VersionCache / prefetch
+
+
+def _write_script(tmp_path, version, returncode=0, name="script.sh"):
+    filename = tmp_path / name
+    filename.write_text("#!/bin/sh\necho %s\nexit %i\n" % (version, returncode))
+    filename.chmod(0o755)
+
+    return (str(filename),)
+
+
+def test_version_cache__missing_file(tmp_path):
+    cache = versions.VersionCache(str(tmp_path / "cache.json"))
+    assert cache.get(_write_script(tmp_path, "v1.2")) is None
+
+
+def test_version_cache__persistent(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v1.2")
+
+    cache = versions.VersionCache(filename)
+    cache.set(call, b"v1.2\n")
+    cache.save()
+
+    assert versions.VersionCache(filename).get(call) == "v1.2\n"
+
+
+def test_version_cache__invalidated_if_executable_changes(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v1.2")
+
+    cache = versions.VersionCache(filename)
+    cache.set(call, "v1.2\n")
+    cache.save()
+
+    _write_script(tmp_path, "v1.10")
+
+    assert versions.VersionCache(filename).get(call) is None
+
+
+def test_version_cache__invalidated_if_argument_file_changes(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    jar_file = tmp_path / "tool.jar"
+    jar_file.write_text("1")
+    call = ("true", str(jar_file))
+
+    cache = versions.VersionCache(filename)
+    cache.set(call, "v1.2\n")
+    cache.save()
+
+    jar_file.write_text("12")
+
+    assert versions.VersionCache(filename).get(call) is None
+
+
+def test_version_cache__missing_executables_are_not_cached(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = ("/does/not/exist",)
+
+    cache = versions.VersionCache(filename)
+    cache.set(call, "v1.2\n")
+    cache.save()
+
+    assert versions.VersionCache(filename).get(call) is None
+    assert not (tmp_path / "cache.json").exists()
+
+
+def test_version_cache__corrupt_file(tmp_path):
+    filename = tmp_path / "cache.json"
+    filename.write_text("{not json")
+
+    assert versions.VersionCache(str(filename)).get(("true",)) is None
+
+
+def test_prefetch__uses_cache(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v1.2")
+
+    cache = versions.VersionCache(filename)
+    cache.set(call, "v3.4\n")
+    cache.save()
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj], filename)
+
+    assert obj.version == (3, 4)
+
+
+def test_prefetch__updates_cache(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v5.6")
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj], filename)
+
+    assert obj.version == (5, 6)
+    assert versions.VersionCache(filename).get(call) == "v5.6\n"
+
+
+def test_version_cache__keyed_on_executable(monkeypatch, tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = ("tool.sh",)
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        _write_script(tmp_path / name, "v1.2", name="tool.sh")
+
+    cache = versions.VersionCache(filename)
+    monkeypatch.setenv("PATH", str(tmp_path / "a"))
+    cache.set(call, "v1.2\n")
+    monkeypatch.setenv("PATH", str(tmp_path / "b"))
+    assert cache.get(call) is None
+    cache.set(call, "v3.4\n")
+    cache.save()
+
+    cache = versions.VersionCache(filename)
+    assert cache.get(call) == "v3.4\n"
+    monkeypatch.setenv("PATH", str(tmp_path / "a"))
+    assert cache.get(call) == "v1.2\n"
+
+
+def test_prefetch__caches_usage_with_non_zero_returncode(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v5.6", returncode=1)
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj], filename)
+
+    assert obj.version == (5, 6)
+    assert versions.VersionCache(filename).get(call) == "v5.6\n"
+
+
+def test_prefetch__failed_calls_are_not_cached(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v5.6", returncode=1) + ("--version",)
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj], filename)
+
+    assert obj.version == (5, 6)
+    assert versions.VersionCache(filename).get(call) is None
+
+
+def test_prefetch__unmatched_output_is_not_cached(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "error: something went wrong")
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj], filename)
+
+    with pytest.raises(versions.VersionRequirementError):
+        obj.version
+    assert versions.VersionCache(filename).get(call) is None
+
+
+def test_prefetch__output_must_match_all_requirements(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    call = _write_script(tmp_path, "v5.6")
+
+    obj_1 = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    obj_2 = versions.RequirementObj(call=call, search=r"V(\d+)", checks=None)
+    versions.prefetch([obj_1, obj_2], filename)
+
+    assert obj_1.version == (5, 6)
+    assert versions.VersionCache(filename).get(call) is None
+
+
+def test_prefetch__without_cache(tmp_path):
+    call = _write_script(tmp_path, "v7.8")
+
+    obj = versions.RequirementObj(call=call, search=r"v(\d+)\.(\d+)", checks=None)
+    versions.prefetch([obj])
+
+    assert obj.version == (7, 8)
@@ -0,0 +1,77 @@
+import sys
+
+import pytest
+
+import paleomix.main
+
+
+@pytest.fixture(autouse=True)
+def no_procname(monkeypatch):
+    monkeypatch.setattr(paleomix.common.system, "set_procname", lambda name: None)
+    monkeypatch.delenv("PALEOMIX_PROFILE_IMPORTS", raising=False)
+
+
+def test_commands_are_importable():
+    for name in paleomix.main._COMMANDS:
+        assert callable(paleomix.main._load_command(name)), name
+
+
+def test_load_command__unknown():
+    assert paleomix.main._load_command("foobar") is None
+
+
+def test_load_command__lazy(monkeypatch):
+    monkeypatch.delitem(sys.modules, "paleomix.tools.gtf_to_bed", raising=False)
+    monkeypatch.setitem(paleomix.main._COMMANDS, "foobar", "paleomix.tools.gtf_to_bed")
+
+    assert "paleomix.tools.gtf_to_bed" not in sys.modules
+    assert paleomix.main._load_command("foobar") is not None
+    assert "paleomix.tools.gtf_to_bed" in sys.modules
+
+
+def test_main__unknown_command():
+    assert paleomix.main.main(["foobar"]) == 1
+
+
+def test_main__help(capsys):
+    assert paleomix.main.main(["--help"]) == 0
+    assert "paleomix bam" in capsys.readouterr().out
+
+
+def _import_new_command(monkeypatch):
+    monkeypatch.delitem(sys.modules, "paleomix.tools.run_log", raising=False)
+    monkeypatch.delitem(sys.modules, "paleomix.runlog", raising=False)
+
+
+def test_main__profile_imports(monkeypatch, tmp_path, capsys):
+    _import_new_command(monkeypatch)
+    missing = str(tmp_path / "missing.log")
+
+    assert paleomix.main.main(["--profile-imports", "run_log", missing]) == 1
+
+    stderr = capsys.readouterr().err
+    assert "Import times for 'paleomix run_log %s'" % (missing,) in stderr
+    assert "paleomix.tools.run_log" in stderr
+    assert "paleomix.runlog" in stderr
+
+
+def test_main__profile_imports_from_env(monkeypatch, tmp_path, capsys):
+    _import_new_command(monkeypatch)
+    report = tmp_path / "imports.log"
+    monkeypatch.setenv("PALEOMIX_PROFILE_IMPORTS", str(report))
+
+    missing = str(tmp_path / "missing.log")
+
+    assert paleomix.main.main(["run_log", missing]) == 1
+    assert paleomix.main.main(["--version"]) == 0
+
+    assert "Import times" not in capsys.readouterr().err
+    text = report.read_text()
+    assert "Import times for 'paleomix run_log %s'" % (missing,) in text
+    assert "paleomix.tools.run_log" in text
+    assert "Import times for 'paleomix --version'" in text
+
+
+def test_main__profile_imports_on_error(monkeypatch, capsys):
+    assert paleomix.main.main(["--profile-imports", "foobar"]) == 1
+    assert "Import times for 'paleomix foobar'" in capsys.readouterr().err
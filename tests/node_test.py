@@ -209,6 +209,27 @@ def test_constructor__description__non_string(cls, value):
         cls(description=value)
 
 
+###############################################################################
+###############################################################################
+# *Node: Fingerprint
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+def test_fingerprint__is_deterministic(cls):
+    assert cls().fingerprint == cls().fingerprint
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+def test_fingerprint__depends_on_description(cls):
+    assert cls().fingerprint != cls(description=_DESCRIPTION).fingerprint
+
+
+def test_fingerprint__depends_on_command():
+    node_1 = CommandNode(command=AtomicCmd(("echo", "foo")))
+    node_2 = CommandNode(command=AtomicCmd(("echo", "bar")))
+    assert node_1.fingerprint != node_2.fingerprint
+
+
 ###############################################################################
 ###############################################################################
 # *Node: Constructor tests: #threads
@@ -235,6 +256,37 @@ def test_constructor__threads_invalid_type(cls, nthreads):
         cls(threads=nthreads)
 
 
+###############################################################################
+###############################################################################
+# *Node: Constructor tests: memory
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+def test_constructor__memory__default(cls):
+    assert cls().memory is None
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+@pytest.mark.parametrize("memory", (None, 1, 4 * 1024 ** 3))
+def test_constructor__memory(cls, memory):
+    node = cls(memory=memory)
+    assert node.memory == memory
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+@pytest.mark.parametrize("memory", (-1, 0))
+def test_constructor__memory_invalid_range(cls, memory):
+    with pytest.raises(ValueError):
+        cls(memory=memory)
+
+
+@pytest.mark.parametrize("cls", _NODE_TYPES)
+@pytest.mark.parametrize("memory", ("4g", {}, 2.7))
+def test_constructor__memory_invalid_type(cls, memory):
+    with pytest.raises(TypeError):
+        cls(memory=memory)
+
+
 ###############################################################################
 ###############################################################################
 # Node: Run
@@ -24,7 +24,12 @@ import os
 
 from unittest.mock import Mock
 
-from paleomix.nodegraph import NodeGraph, FileStatusCache
+import pytest
+
+import paleomix.nodegraph
+
+from paleomix.nodegraph import NodeGraph, ChecksumStatusCache, FileStatusCache
+from paleomix.statedb import StateDatabase
 
 
 _TIMESTAMP_1 = 1000190760
@@ -116,3 +121,278 @@ def test_nodegraph_is_outdated__updates(tmp_path):
     assert not NodeGraph.is_outdated(my_node, FileStatusCache())
     my_node = Mock(input_files=(younger_file,), output_files=(older_file,),)
     assert NodeGraph.is_outdated(my_node, FileStatusCache())
+
+
+###############################################################################
+###############################################################################
+# FileStatusCache: prefetch
+
+
+@pytest.mark.parametrize("chunk_size", (1, 2, 1024))
+def test_file_status_cache__prefetch(monkeypatch, tmp_path, chunk_size):
+    monkeypatch.setattr(paleomix.nodegraph, "_PREFETCH_CHUNK_SIZE", chunk_size)
+    existing = [create_test_file(_TIMESTAMP_1, tmp_path, str(idx)) for idx in range(5)]
+    missing = [str(tmp_path / "missing_1"), str(tmp_path / "missing_2")]
+
+    cache = FileStatusCache()
+    cache.prefetch(existing + missing)
+
+    # Cached values are used after prefetching
+    (tmp_path / "missing_1").touch()
+    os.utime(existing[0], (_TIMESTAMP_2, _TIMESTAMP_2))
+    assert cache.files_exist(existing)
+    assert cache.missing_files(existing + missing) == missing
+    assert cache.get_stat(existing[0]).st_mtime == _TIMESTAMP_1
+
+
+###############################################################################
+###############################################################################
+# ChecksumStatusCache
+
+
+def _checksum_node(tmp_path, fingerprint="fingerprint"):
+    return Mock(
+        input_files=frozenset((str(tmp_path / "input"),)),
+        output_files=frozenset((str(tmp_path / "output"),)),
+        fingerprint=fingerprint,
+    )
+
+
+def test_checksum_cache__unrecorded_node__falls_back_to_timestamps(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_2, tmp_path, "input")
+    create_test_file(_TIMESTAMP_1, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    assert NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+    assert database.get_node(node) is None
+
+
+def test_checksum_cache__unrecorded_node__queued_if_up_to_date(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    cache = ChecksumStatusCache(database)
+    assert not NodeGraph.is_outdated(node, cache)
+    # Files are not hashed until the node is recorded by the pipeline
+    assert database.get_node(node) is None
+    assert cache.pop_unrecorded_nodes() == [node]
+    assert cache.pop_unrecorded_nodes() == []
+
+
+def test_checksum_cache__outdated_node__not_queued(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_2, tmp_path, "input")
+    create_test_file(_TIMESTAMP_1, tmp_path, "output")
+
+    cache = ChecksumStatusCache(database)
+    assert NodeGraph.is_outdated(_checksum_node(tmp_path), cache)
+    assert cache.pop_unrecorded_nodes() == []
+
+
+def test_checksum_cache__timestamps_ignored_for_recorded_node(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    ChecksumStatusCache(database).record_node(node)
+
+    # Touching the input file does not change its contents
+    create_test_file(_TIMESTAMP_2 + 1, tmp_path, "input")
+    assert not NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+
+
+def test_checksum_cache__outdated_if_input_changes(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    ChecksumStatusCache(database).record_node(node)
+
+    (tmp_path / "input").write_text("new contents")
+    os.utime(tmp_path / "input", (_TIMESTAMP_1, _TIMESTAMP_1))
+    assert NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+
+
+def test_checksum_cache__outdated_if_output_changes(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    ChecksumStatusCache(database).record_node(node)
+
+    (tmp_path / "output").write_text("new contents")
+    assert NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+
+
+def test_checksum_cache__unchanged_files_are_not_hashed(monkeypatch, tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    node = _checksum_node(tmp_path)
+    ChecksumStatusCache(database).record_node(node)
+
+    monkeypatch.setattr(database, "get_checksum", Mock(side_effect=AssertionError))
+    assert not NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+
+
+def test_checksum_cache__outdated_if_fingerprint_changes(tmp_path):
+    database = StateDatabase(str(tmp_path / "state.db"))
+    create_test_file(_TIMESTAMP_1, tmp_path, "input")
+    create_test_file(_TIMESTAMP_2, tmp_path, "output")
+
+    ChecksumStatusCache(database).record_node(_checksum_node(tmp_path))
+
+    node = _checksum_node(tmp_path, fingerprint="new fingerprint")
+    assert NodeGraph.is_outdated(node, ChecksumStatusCache(database))
+
+
+###############################################################################
+###############################################################################
+# NodeGraph: state propagation
+
+
+def _graph_node(tmp_path, name, *dependencies):
+    node = Mock(
+        input_files=frozenset(
+            str(tmp_path / dependency.name) for dependency in dependencies
+        ),
+        output_files=frozenset((str(tmp_path / name),)),
+        auxiliary_files=frozenset(),
+        executables=frozenset(),
+        requirements=frozenset(),
+        dependencies=frozenset(dependencies),
+    )
+    node.name = name
+
+    return node
+
+
+def _node_chain(tmp_path, length):
+    nodes = [_graph_node(tmp_path, "node_0")]
+    for idx in range(1, length):
+        nodes.append(_graph_node(tmp_path, "node_%i" % (idx,), nodes[-1]))
+
+    return nodes
+
+
+def _states(graph, nodes):
+    return [graph.get_node_state(node) for node in nodes]
+
+
+def test_nodegraph__deep_graph(tmp_path):
+    nodes = _node_chain(tmp_path, 5000)
+    graph = NodeGraph(nodes[-1])
+
+    assert list(graph) == [nodes[-1]]
+    assert set(graph.iterflat()) == set(nodes)
+    assert _states(graph, nodes) == [NodeGraph.RUNABLE] + [NodeGraph.QUEUED] * 4999
+
+
+def test_nodegraph__cycle_detected(tmp_path):
+    node_a = _graph_node(tmp_path, "a")
+    node_b = _graph_node(tmp_path, "b", node_a)
+    node_a.dependencies = frozenset((node_b,))
+
+    with pytest.raises(paleomix.nodegraph.NodeGraphError, match="Cycle"):
+        NodeGraph(node_b)
+
+
+def test_nodegraph__set_node_state__done(tmp_path):
+    nodes = _node_chain(tmp_path, 3)
+    graph = NodeGraph(nodes[-1])
+
+    graph.set_node_state(nodes[0], NodeGraph.RUNNING)
+    assert _states(graph, nodes) == [NodeGraph.RUNNING] + [NodeGraph.QUEUED] * 2
+
+    (tmp_path / "node_0").touch()
+    graph.set_node_state(nodes[0], NodeGraph.DONE)
+    assert _states(graph, nodes) == [
+        NodeGraph.DONE,
+        NodeGraph.RUNABLE,
+        NodeGraph.QUEUED,
+    ]
+
+
+def test_nodegraph__set_node_state__error(tmp_path):
+    node_a = _graph_node(tmp_path, "a")
+    node_b = _graph_node(tmp_path, "b")
+    node_c = _graph_node(tmp_path, "c", node_a, node_b)
+    node_d = _graph_node(tmp_path, "d", node_c)
+    nodes = [node_a, node_b, node_c, node_d]
+
+    graph = NodeGraph(node_d)
+    graph.set_node_state(node_a, NodeGraph.ERROR)
+
+    assert _states(graph, nodes) == [
+        NodeGraph.ERROR,
+        NodeGraph.RUNABLE,
+        NodeGraph.ERROR,
+        NodeGraph.ERROR,
+    ]
+
+
+def test_nodegraph__set_node_state__outdated_dependents(tmp_path):
+    nodes = _node_chain(tmp_path, 3)
+    for idx, node in enumerate(nodes):
+        create_test_file(_TIMESTAMP_1 + idx, tmp_path, node.name)
+
+    graph = NodeGraph(nodes[-1])
+    assert _states(graph, nodes) == [NodeGraph.DONE] * 3
+
+    graph.set_node_state(nodes[0], NodeGraph.RUNNING)
+    assert _states(graph, nodes) == [
+        NodeGraph.RUNNING,
+        NodeGraph.OUTDATED,
+        NodeGraph.OUTDATED,
+    ]
+
+    create_test_file(_TIMESTAMP_2, tmp_path, nodes[0].name)
+    graph.set_node_state(nodes[0], NodeGraph.DONE)
+    assert _states(graph, nodes) == [
+        NodeGraph.DONE,
+        NodeGraph.RUNABLE,
+        NodeGraph.OUTDATED,
+    ]
+
+
+def test_nodegraph__set_node_state__only_output_files_are_rechecked(
+    monkeypatch, tmp_path
+):
+    nodes = _node_chain(tmp_path, 3)
+    create_test_file(_TIMESTAMP_1, tmp_path, nodes[1].name)
+    graph = NodeGraph(nodes[-1])
+    assert _states(graph, nodes)[1] == NodeGraph.OUTDATED
+
+    stat_files = Mock(wraps=paleomix.nodegraph._stat_files)
+    monkeypatch.setattr(paleomix.nodegraph, "_stat_files", stat_files)
+
+    (tmp_path / "node_0").touch()
+    graph.set_node_state(nodes[0], NodeGraph.DONE)
+
+    assert _states(graph, nodes)[1] == NodeGraph.RUNABLE
+    stat_files.assert_called_once_with((str(tmp_path / "node_0"),))
+
+
+def test_nodegraph__indirect_dependency_on_dynamic_file(tmp_path):
+    nodes = _node_chain(tmp_path, 3)
+    # Last node also depends on the output of the first node
+    nodes[-1].input_files = nodes[-1].input_files | nodes[0].output_files
+
+    graph = NodeGraph(nodes[-1])
+    assert graph.get_node_state(nodes[-1]) == NodeGraph.QUEUED
+
+
+def test_nodegraph__missing_dependency_on_dynamic_file(tmp_path):
+    node_a = _graph_node(tmp_path, "a")
+    node_b = _graph_node(tmp_path, "b")
+    node_b.input_files = node_a.output_files
+
+    with pytest.raises(paleomix.nodegraph.NodeGraphError, match="dynamic file"):
+        NodeGraph([node_a, node_b])
@@ -0,0 +1,42 @@
+import pytest
+
+from paleomix.atomiccmd.builder import AtomicJavaCmdBuilder
+from paleomix.atomiccmd.command import AtomicCmd
+from paleomix.nodes.picard import _get_max_heap_size
+
+
+def _command(jre_options=()):
+    builder = AtomicJavaCmdBuilder(
+        "/path/picard.jar", temp_root="/disk/tmp", jre_options=jre_options
+    )
+
+    return builder.finalize()
+
+
+def test_get_max_heap_size__default():
+    assert _get_max_heap_size(_command()) == 4 * 1024 ** 3
+
+
+def test_get_max_heap_size__not_set():
+    command = AtomicCmd(("java", "-jar", "%(AUX_JAR)s"), AUX_JAR="/path/picard.jar")
+
+    assert _get_max_heap_size(command) is None
+
+
+@pytest.mark.parametrize(
+    "option, expected",
+    (("-Xmx512m", 512 * 1024 ** 2), ("-Xmx8G", 8 * 1024 ** 3), ("-Xmx1024", 1024)),
+)
+def test_get_max_heap_size__user_option(option, expected):
+    assert _get_max_heap_size(_command([option])) == expected
+
+
+def test_get_max_heap_size__last_option_is_used():
+    command = _command(["-Xmx2g", "-Xms1g", "-Xmx6g"])
+
+    assert _get_max_heap_size(command) == 6 * 1024 ** 3
+
+
+def test_get_max_heap_size__invalid_option():
+    with pytest.raises(ValueError):
+        _get_max_heap_size(_command(["-Xmxfoo"]))
@@ -0,0 +1,448 @@
+import argparse
+import multiprocessing
+import os
+import random
+
+import pysam
+import pytest
+
+import paleomix.nodes.validation as validation
+from paleomix.common.fileutils import calculate_checksum
+from paleomix.node import NodeError
+from paleomix.nodes.validation import (
+    DetectInputDuplicationNode,
+    FASTAValidationCache,
+    ValidateFASTAFilesNode,
+    check_fasta_file,
+)
+
+
+def _write(tmp_path, data, name="reference.fasta"):
+    filename = tmp_path / name
+    filename.write_bytes(data)
+
+    return str(filename)
+
+
+###############################################################################
+# check_fasta_file
+
+_VALID_FASTA = (
+    b">chr1\nACGT\n",
+    b">chr1\nACGT",
+    b">chr1 description\nACGT\nAC\n",
+    b">chr1\nACGT\n>chr2\nn\n",
+    b">chr1\nACGT\nACGT\nA\n\n\n>chr2\nacgtn\n",
+    b">chr1\nACGTACGT\n>chr2\nRYSWKMBDHVN\nrysw\n",
+    # Leading empty lines are allowed
+    b"\n\n>chr1\nACGT\n",
+    # Trailing empty lines are allowed
+    b">chr1\nACGT\n\n\n",
+    # Any printable name, not starting with '*' or '='
+    b">chr1|x:1-2\nACGT\n",
+)
+
+
+@pytest.mark.parametrize("data", _VALID_FASTA)
+def test_check_fasta_file__valid(tmp_path, data):
+    filename = _write(tmp_path, data)
+
+    assert validation._check_fasta_lines(filename) is None
+    check_fasta_file(filename)
+
+
+_INVALID_FASTA = (
+    (b"", "File does not contain any sequences"),
+    (b"\n\n", "File does not contain any sequences"),
+    (b">chr1\n", "File ends with an empty sequence"),
+    (b">chr1", "File ends with an empty sequence"),
+    (b">chr1\n\nACGT\n", "Expected FASTA sequence, found empty line"),
+    (b">chr1\n>chr2\nACGT\n", "Empty sequences not allowed"),
+    (b"ACGT\n>chr1\nACGT\n", "Expected FASTA header, found 'ACGT'"),
+    (b">chr1\nACG\nACGT\n", "Lines in FASTQ files must be of same length"),
+    (b">chr1\nACGT\nAC\nAC\n", "Lines in FASTQ files must be of same length"),
+    (b">chr1\nACGT\n\nACGT\n", "Empty lines not allowed in sequences"),
+    (b">\nACGT\n", "FASTA sequence must have non-empty name"),
+    (b"> chr1\nACGT\n", "FASTA sequence must have non-empty name"),
+    (b">*chr1\nACGT\n", "Invalid name for FASTA sequence"),
+    (b">chr1\nACGT\n>chr1 2\nACGT\n", "FASTA sequences have identical name"),
+    (b">chr1\nACGX\n", "FASTA sequence contains invalid characters"),
+    (b">chr1\nACG>\n", "FASTA sequence contains invalid characters"),
+    (b">chr1\nAC GT\n", "FASTA sequence contains invalid characters"),
+    (b">chr1\r\nACGT\r\n", "FASTA file contains carriage-returns"),
+    (b">chr1\nACGT\rACGT\n", "FASTA file contains carriage-returns"),
+)
+
+
+@pytest.mark.parametrize("data, message", _INVALID_FASTA)
+def test_check_fasta_file__invalid(tmp_path, data, message):
+    filename = _write(tmp_path, data)
+
+    assert not validation._check_fasta_mmap(filename)
+    with pytest.raises(NodeError, match=message):
+        check_fasta_file(filename)
+
+
+def test_check_fasta_file__line_numbers(tmp_path):
+    filename = _write(tmp_path, b">chr1\nACGT\nACGT\n>chr2\nAC\nACGT\n")
+
+    with pytest.raises(NodeError, match="Line = 6"):
+        check_fasta_file(filename)
+
+
+@pytest.mark.parametrize("chunk_size", (1, 5, 7, 1024))
+def test_check_fasta_file__chunks(monkeypatch, tmp_path, chunk_size):
+    monkeypatch.setattr(validation, "_FASTA_CHUNK_SIZE", chunk_size)
+
+    valid = _write(tmp_path, b">chr1\nACGTA\nCGTAC\nGTA\n", "valid.fasta")
+    assert validation._check_fasta_mmap(valid)
+
+    invalid = _write(tmp_path, b">chr1\nACGTA\nCGTAC\nGTA\nC\n", "invalid.fasta")
+    assert not validation._check_fasta_mmap(invalid)
+
+
+def _random_fasta(rng):
+    lines = []
+    for idx in range(rng.randint(1, 3)):
+        lines.append(rng.choice((">chr%i" % (idx,), ">chr0", ">", "")))
+        for _ in range(rng.randint(0, 4)):
+            lines.append(
+                "".join(rng.choice("ACGTN\n") for _ in range(rng.randint(0, 6)))
+            )
+
+    return "\n".join(lines).encode("ascii") + rng.choice((b"", b"\n"))
+
+
+def test_check_fasta_file__same_as_line_by_line(tmp_path):
+    rng = random.Random(12345)
+    for _ in range(2000):
+        filename = _write(tmp_path, _random_fasta(rng))
+
+        try:
+            validation._check_fasta_lines(filename)
+        except NodeError:
+            assert not validation._check_fasta_mmap(filename)
+
+
+###############################################################################
+# FASTAValidationCache / ValidateFASTAFilesNode
+
+
+def test_fasta_validation_cache__empty(tmp_path):
+    cache = FASTAValidationCache(str(tmp_path / "cache.json"))
+
+    assert "abc" not in cache
+
+
+def test_fasta_validation_cache__save_and_load(tmp_path):
+    filename = str(tmp_path / "cache" / "cache.json")
+    cache = FASTAValidationCache(filename)
+    cache.add("abc")
+    cache.save()
+
+    assert "abc" in FASTAValidationCache(filename)
+
+
+def test_fasta_validation_cache__merges_concurrent_updates(tmp_path):
+    filename = str(tmp_path / "cache.json")
+    cache_1 = FASTAValidationCache(filename)
+    cache_2 = FASTAValidationCache(filename)
+    cache_1.add("abc")
+    cache_1.save()
+    cache_2.add("def")
+    cache_2.save()
+
+    cache = FASTAValidationCache(filename)
+    assert "abc" in cache
+    assert "def" in cache
+
+
+def test_fasta_validation_cache__corrupt_file(tmp_path):
+    filename = tmp_path / "cache.json"
+    filename.write_text("{not json")
+
+    assert "abc" not in FASTAValidationCache(str(filename))
+
+
+def test_fasta_validation_cache__ignores_other_versions(monkeypatch, tmp_path):
+    filename = str(tmp_path / "cache.json")
+    cache = FASTAValidationCache(filename)
+    cache.add("abc")
+    cache.save()
+
+    monkeypatch.setattr(FASTAValidationCache, "VERSION", 2)
+
+    assert "abc" not in FASTAValidationCache(filename)
+
+
+def _count_fasta_checks(monkeypatch):
+    calls = []
+
+    def _check_fasta_file(filename):
+        calls.append(filename)
+
+    monkeypatch.setattr(validation, "check_fasta_file", _check_fasta_file)
+
+    return calls
+
+
+def test_validate_fasta_files_node__skips_cached_files(monkeypatch, tmp_path):
+    calls = _count_fasta_checks(monkeypatch)
+
+    reference = _write(tmp_path, b">chr1\nACGT\n")
+    output_file = str(tmp_path / "out" / "reference.validated")
+    node = ValidateFASTAFilesNode(
+        input_files=[reference],
+        output_file=output_file,
+        cache_file=str(tmp_path / "cache.json"),
+    )
+
+    node._run(None, None)
+    node._run(None, None)
+
+    assert calls == [reference]
+    assert (tmp_path / "out" / "reference.validated").exists()
+
+
+def test_validate_fasta_files_node__without_cache(monkeypatch, tmp_path):
+    calls = _count_fasta_checks(monkeypatch)
+
+    reference = _write(tmp_path, b">chr1\nACGT\n")
+    output_file = str(tmp_path / "reference.validated")
+    node = ValidateFASTAFilesNode(
+        input_files=[reference], output_file=output_file, cache_file=None
+    )
+
+    node._run(None, None)
+    node._run(None, None)
+
+    assert calls == [reference, reference]
+    assert sorted(os.listdir(tmp_path)) == ["reference.fasta", "reference.validated"]
+
+
+def test_validate_fasta_files_node__invalid_files_not_cached(tmp_path):
+    cache = str(tmp_path / "cache.json")
+
+    reference = _write(tmp_path, b">chr1\nACGX\n")
+    output_file = str(tmp_path / "reference.validated")
+    node = ValidateFASTAFilesNode(
+        input_files=[reference], output_file=output_file, cache_file=cache
+    )
+
+    with pytest.raises(NodeError):
+        node._run(None, None)
+
+    assert calculate_checksum(reference) not in FASTAValidationCache(cache)
+
+
+###############################################################################
+# check_bam_files
+
+_CONTIGS = (("chr1", 1000), ("chr2", 500), ("chr3", 200))
+
+
+def _write_bam(tmp_path, name, reads, index=True):
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": contig, "LN": length} for contig, length in _CONTIGS],
+    }
+
+    filename = str(tmp_path / name)
+    with pysam.AlignmentFile(filename, "wb", header=header) as handle:
+        for qname, tid, pos, flag, seq in sorted(reads, key=_read_sort_key):
+            record = pysam.AlignedSegment(handle.header)
+            record.query_name = qname
+            record.flag = flag
+            record.reference_id = tid
+            record.reference_start = pos
+            record.query_sequence = seq
+            record.query_qualities = pysam.qualitystring_to_array("I" * len(seq))
+            if not flag & 0x4:
+                record.cigartuples = [(0, len(seq))]
+                record.mapping_quality = 30
+            handle.write(record)
+
+    if index:
+        pysam.index(filename)
+
+    return filename
+
+
+def _read_sort_key(read):
+    _qname, tid, pos, _flag, _seq = read
+
+    return (tid == -1, tid, pos)
+
+
+def _random_reads(rng, prefix, count):
+    reads = []
+    for idx in range(count):
+        tid = rng.choice((0, 0, 1, 2))
+        pos = rng.randint(0, 20)
+        flag = rng.choice((0, 0x10, 0x41, 0x81, 0x100, 0x800, 0x4 | 0x1))
+        seq = "".join(rng.choice("ACGT") for _ in range(4))
+        reads.append(("%s%i" % (prefix, idx % 20), tid, pos, flag, seq))
+
+    # Unmapped reads without a position
+    reads.append(("%s_unmapped" % (prefix,), -1, -1, 0x4, "ACGT"))
+
+    return reads
+
+
+def _check_bam_files(filenames, **kwargs):
+    results = []
+
+    def _err_func(chrom, pos, records, name, seq, qual):
+        records = {
+            key: [record.to_string() for record in value]
+            for key, value in records.items()
+        }
+
+        results.append((chrom, pos, records, name, seq, qual))
+
+    validation.check_bam_files(filenames, _err_func, **kwargs)
+
+    return results
+
+
+def test_check_bam_files__no_duplicates(tmp_path):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10, 0, "ACGT")])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r2", 0, 10, 0, "ACGT")])
+
+    assert _check_bam_files([filename_1, filename_2]) == []
+
+
+def test_check_bam_files__duplicates(tmp_path):
+    filename_1 = _write_bam(
+        tmp_path, "1.bam", [("r1", 1, 10, 0, "ACGT"), ("r2", 1, 10, 0, "ACGT")]
+    )
+    filename_2 = _write_bam(
+        tmp_path, "2.bam", [("r1", 1, 10, 0, "ACGT"), ("r2", 1, 10, 0, "ACGA")]
+    )
+
+    ((chrom, pos, records, name, seq, qual),) = _check_bam_files(
+        [filename_1, filename_2]
+    )
+
+    assert (chrom, pos, name, seq, qual) == ("chr2", 10, "r1", "ACGT", "IIII")
+    assert sorted(records) == [filename_1, filename_2]
+
+
+def test_check_bam_files__files_ending_at_different_positions(tmp_path):
+    filename_1 = _write_bam(
+        tmp_path,
+        "1.bam",
+        [("r1", 0, 10, 0, "ACGT"), ("r2", -1, -1, 0x4, "ACGT")],
+    )
+    filename_2 = _write_bam(
+        tmp_path,
+        "2.bam",
+        [("r1", 0, 10, 0, "ACGT"), ("r3", 2, 10, 0, "ACGT"), ("r3", 2, 10, 0, "ACGT")],
+    )
+
+    results = _check_bam_files([filename_1, filename_2])
+
+    assert [(chrom, pos, name) for chrom, pos, _, name, _, _ in results] == [
+        ("chr1", 10, "r1"),
+        ("chr3", 10, "r3"),
+    ]
+
+
+def test_check_bam_files__hash_collisions(monkeypatch, tmp_path):
+    reads = [("r1", 0, 10, 0, "ACGT"), ("r2", 0, 10, 0, "ACGT")]
+    filename = _write_bam(tmp_path, "1.bam", reads)
+
+    monkeypatch.setattr(validation, "hash", lambda _value: 0, raising=False)
+
+    assert _check_bam_files([filename]) == []
+
+
+@pytest.mark.parametrize("threads", (2, 3, 8))
+def test_check_bam_files__threads(tmp_path, threads):
+    rng = random.Random(threads)
+    shared_reads = _random_reads(rng, "r", 200)
+    filenames = []
+    for idx in range(3):
+        # Some reads are included in multiple files
+        reads = _random_reads(rng, "r", 200) + rng.sample(shared_reads, 50)
+        filenames.append(_write_bam(tmp_path, "%i.bam" % (idx,), reads))
+
+    expected = _check_bam_files(filenames)
+    assert expected  # sanity check
+    assert _check_bam_files(filenames, threads=threads) == expected
+
+
+def test_check_bam_files__threads_with_index_files(tmp_path):
+    rng = random.Random(1234)
+    reads = _random_reads(rng, "r", 200)
+    filename_1 = _write_bam(tmp_path, "1.bam", reads, index=False)
+    filename_2 = _write_bam(tmp_path, "2.bam", reads, index=False)
+    index_file = str(tmp_path / "2.bai")
+    pysam.index(filename_2, index_file)
+
+    expected = _check_bam_files([filename_1, filename_2])
+    assert expected  # sanity check
+
+    # Unindexed files are processed using a single thread
+    assert _check_bam_files([filename_1, filename_2], threads=2) == expected
+
+    index_files = {filename_2: index_file}
+    pysam.index(filename_1)
+
+    result = _check_bam_files(
+        [filename_1, filename_2], threads=2, index_files=index_files
+    )
+    assert result == expected
+
+
+###############################################################################
+# DetectInputDuplicationNode
+
+
+def _run_node(node, temp_root):
+    node.run(argparse.Namespace(temp_root=temp_root))
+
+
+@pytest.mark.parametrize("threads", (1, 2))
+def test_detect_input_duplication_node__duplicates(tmp_path, threads):
+    reads = [("r1", 0, 10, 0, "ACGT"), ("r2", 1, 10, 0, "ACGT")]
+    filename_1 = _write_bam(tmp_path, "1.bam", reads, index=False)
+    filename_2 = _write_bam(tmp_path, "2.bam", reads[1:], index=False)
+    output_file = tmp_path / "out" / "duplications_checked"
+    temp_root = tmp_path / "temp"
+    temp_root.mkdir()
+
+    node = DetectInputDuplicationNode(
+        input_files=[filename_1, filename_2],
+        output_file=str(output_file),
+        threads=threads,
+    )
+
+    with pytest.raises(NodeError):
+        _run_node(node, str(temp_root))
+
+    assert not output_file.exists()
+    (temp_dir,) = temp_root.iterdir()
+    (stderr_file,) = temp_dir.glob("*.stderr")
+    assert "found multiple times at position 10 on 'chr2'" in stderr_file.read_text()
+    # Temporary indices are removed
+    assert not list(temp_dir.glob("**/*.bai"))
+
+
+@pytest.mark.parametrize("threads", (1, 2))
+def test_detect_input_duplication_node__in_pool_worker(tmp_path, threads):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10, 0, "ACGT")])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r2", 1, 10, 0, "ACGT")])
+    output_file = tmp_path / "duplications_checked"
+
+    node = DetectInputDuplicationNode(
+        input_files=[filename_1, filename_2],
+        output_file=str(output_file),
+        threads=threads,
+    )
+
+    # Nodes are run by the pipeline in (daemonic) multiprocessing.Pool workers
+    with multiprocessing.Pool(1) as pool:
+        pool.apply(_run_node, (node, str(tmp_path)))
+
+    assert output_file.exists()
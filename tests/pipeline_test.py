@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+
+from unittest.mock import Mock
+
+import pytest
+
+import paleomix.pipeline
+
+from paleomix.atomiccmd.command import AtomicCmd
+from paleomix.node import CommandNode
+from paleomix.pipeline import Pypeline, _prioritize_nodes
+from paleomix.runlog import read_run_log
+from paleomix.statedb import StateDatabase
+
+
+def _node(name, *dependencies):
+    node = Mock(dependencies=frozenset(dependencies))
+    node.name = name
+    return node
+
+
+def _names(nodes):
+    return [node.name for node in nodes]
+
+
+def test_prioritize_nodes__empty():
+    assert _prioritize_nodes([], {}) == []
+
+
+def test_prioritize_nodes__longest_chain_first():
+    chain_a = _node("a1")
+    chain_b1 = _node("b1")
+    chain_b2 = _node("b2", chain_b1)
+    chain_b3 = _node("b3", chain_b2)
+    nodes = [chain_a, chain_b1, chain_b2, chain_b3]
+
+    result = _names(_prioritize_nodes(nodes, {}))
+    assert result[:2] == ["b1", "b2"]
+    assert sorted(result[2:]) == ["a1", "b3"]
+
+
+def test_prioritize_nodes__weighted_by_runtime():
+    chain_a = _node("a1")
+    chain_b1 = _node("b1")
+    chain_b2 = _node("b2", chain_b1)
+    nodes = [chain_a, chain_b1, chain_b2]
+
+    result = _prioritize_nodes(nodes, {chain_a: 100.0})
+    assert _names(result) == ["a1", "b1", "b2"]
+
+
+def test_pypeline__run_log(tmp_path):
+    temp_root = tmp_path / "temp"
+    temp_root.mkdir()
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("foo\n")
+    run_log = tmp_path / "run.log"
+
+    command = AtomicCmd(
+        ("cp", "%(IN_FILE)s", "%(OUT_FILE)s"),
+        IN_FILE=str(input_file),
+        OUT_FILE=str(tmp_path / "output" / "output.txt"),
+    )
+
+    pipeline = Pypeline(argparse.Namespace(temp_root=str(temp_root)))
+    pipeline.add_nodes(CommandNode(command, description="copy"))
+
+    assert pipeline.run(max_threads=1, run_log=str(run_log))
+    assert (tmp_path / "output" / "output.txt").read_text() == "foo\n"
+
+    (record,) = read_run_log(str(run_log))
+    assert record["node"] == "copy"
+    assert record["class"] == "paleomix.node.CommandNode"
+    assert record["state"] == "done"
+    assert record["wall_time"] > 0
+    assert record["max_rss"] > 0
+    assert record["bytes_read"] >= 4
+    assert record["bytes_written"] >= 4
+
+
+def test_pypeline__state_db__up_to_date_nodes_are_recorded(tmp_path):
+    temp_root = tmp_path / "temp"
+    temp_root.mkdir()
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("foo\n")
+    output_file = tmp_path / "output.txt"
+    output_file.write_text("foo\n")
+    os.utime(str(input_file), (1000, 1000))
+    state_db = str(tmp_path / "state.db")
+
+    command = AtomicCmd(
+        ("cp", "%(IN_FILE)s", "%(OUT_FILE)s"),
+        IN_FILE=str(input_file),
+        OUT_FILE=str(output_file),
+    )
+    node = CommandNode(command, description="copy")
+
+    pipeline = Pypeline(argparse.Namespace(temp_root=str(temp_root)))
+    pipeline.add_nodes(node)
+
+    assert pipeline.run(max_threads=1, state_db=state_db)
+    with StateDatabase(state_db) as database:
+        assert database.get_node(node) is not None
+
+
+class _StateDatabase(StateDatabase):
+    closed = []
+
+    def close(self):
+        _StateDatabase.closed.append(self.filename)
+        StateDatabase.close(self)
+
+
+def test_pypeline__state_db__closed_after_run(monkeypatch, tmp_path):
+    monkeypatch.setattr(paleomix.pipeline, "StateDatabase", _StateDatabase)
+    monkeypatch.setattr(_StateDatabase, "closed", [])
+    state_db = str(tmp_path / "state.db")
+
+    pipeline = Pypeline(argparse.Namespace(temp_root=str(tmp_path)))
+    assert pipeline.run(max_threads=1, state_db=state_db)
+    assert _StateDatabase.closed == [state_db]
+    assert pipeline._database is None
+
+
+def test_pypeline__state_db__closed_on_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(paleomix.pipeline, "StateDatabase", _StateDatabase)
+    monkeypatch.setattr(_StateDatabase, "closed", [])
+    state_db = str(tmp_path / "state.db")
+
+    def _raise_error(*_args, **_kwargs):
+        raise KeyboardInterrupt
+
+    pipeline = Pypeline(argparse.Namespace(temp_root=str(tmp_path)))
+    monkeypatch.setattr(pipeline, "_build_and_run", _raise_error)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run(max_threads=1, state_db=state_db)
+
+    assert _StateDatabase.closed == [state_db]
+    assert pipeline._database is None
+
+
+###############################################################################
+###############################################################################
+# Pypeline._start_new_tasks
+
+
+class _NodeGraph:
+    RUNABLE, RUNNING, DONE, ERROR = range(4)
+
+    def __init__(self):
+        self.states = {}
+
+    def get_node_state(self, node):
+        return self.states.get(node, self.RUNABLE)
+
+    def set_node_state(self, node, state):
+        self.states[node] = state
+
+
+def _memory_node(name, memory, threads=1):
+    node = Mock(threads=threads, memory=memory)
+    node.name = name
+    return node
+
+
+def _start_new_tasks(remaining, running=None, max_threads=4, max_memory=None):
+    pipeline = Pypeline(argparse.Namespace(temp_root="/tmp"))
+    running = {} if running is None else running
+    remaining = list(remaining)
+
+    pipeline._start_new_tasks(
+        remaining, running, _NodeGraph(), max_threads, max_memory, Mock()
+    )
+
+    return sorted(node.name for (node, _) in running.values()), _names(remaining)
+
+
+def test_start_new_tasks__no_memory_limit():
+    nodes = [_memory_node("a", 8), _memory_node("b", 8), _memory_node("c", None)]
+
+    assert _start_new_tasks(nodes) == (["a", "b", "c"], [])
+
+
+def test_start_new_tasks__memory_limit():
+    nodes = [_memory_node("a", 4), _memory_node("b", 4), _memory_node("c", 4)]
+
+    assert _start_new_tasks(nodes, max_memory=10) == (["a", "b"], ["c"])
+
+
+def test_start_new_tasks__memory_limit__smaller_nodes_fill_remaining_memory():
+    nodes = [_memory_node("a", 6), _memory_node("b", 6), _memory_node("c", 4)]
+
+    assert _start_new_tasks(nodes, max_memory=10) == (["a", "c"], ["b"])
+
+
+def test_start_new_tasks__memory_limit__nodes_without_memory_requirement():
+    nodes = [_memory_node("a", 10), _memory_node("b", None), _memory_node("c", 1)]
+
+    assert _start_new_tasks(nodes, max_memory=10) == (["a", "b"], ["c"])
+
+
+def test_start_new_tasks__memory_limit__includes_running_nodes():
+    running = {"x": (_memory_node("x", 8), None)}
+    nodes = [_memory_node("a", 4), _memory_node("b", 2)]
+
+    assert _start_new_tasks(nodes, running, max_memory=10) == (["b", "x"], ["a"])
+
+
+def test_start_new_tasks__memory_limit__oversized_node_run_alone():
+    nodes = [_memory_node("a", 16), _memory_node("b", 4)]
+
+    assert _start_new_tasks(nodes, max_memory=10) == (["a"], ["b"])
+
+
+def test_start_new_tasks__memory_limit__oversized_node_waits_for_running_nodes():
+    running = {"x": (_memory_node("x", 1), None)}
+    nodes = [_memory_node("a", 16)]
+
+    assert _start_new_tasks(nodes, running, max_memory=10) == (["x"], ["a"])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_start_new_tasks__memory_limit__never_exceeded(seed):
+    rng = random.Random(seed)
+    max_memory = 16
+    remaining = [
+        _memory_node(str(idx), rng.choice((None, 1, 4, 8, 12, 32)), rng.randint(1, 3))
+        for idx in range(50)
+    ]
+
+    pipeline = Pypeline(argparse.Namespace(temp_root="/tmp"))
+    nodegraph = _NodeGraph()
+    running = {}
+    while remaining or running:
+        pipeline._start_new_tasks(remaining, running, nodegraph, 4, max_memory, Mock())
+
+        nodes = [node for (node, _) in running.values()]
+        assert nodes, "no nodes started"
+        if len(nodes) > 1:
+            assert sum(node.memory or 0 for node in nodes) <= max_memory
+            assert sum(node.threads for node in nodes) <= 4
+
+        del running[rng.choice(list(running))]
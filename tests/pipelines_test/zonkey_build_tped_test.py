@@ -0,0 +1,195 @@
+import random
+
+import pysam
+import pytest
+
+from paleomix.pipelines.zonkey.build_tped import DownsampledBAM, GenotypeSites
+
+
+_HEADER = {"HD": {"VN": "1.0"}, "SQ": [{"LN": 1000, "SN": "1"}, {"LN": 500, "SN": "2"}]}
+
+
+def _record(header, name, start, cigar, sequence, contig="1", flag=0):
+    record = pysam.AlignedSegment(header)
+    record.query_name = name
+    record.flag = flag
+    record.reference_name = contig
+    record.reference_start = start
+    record.mapping_quality = 30
+    record.cigarstring = cigar
+    record.query_sequence = sequence
+    return record
+
+
+def _random_record(rng, header, name, start):
+    cigar = []
+    query_length = 0
+    if rng.random() < 0.3:
+        cigar.append("%iS" % (rng.randint(1, 5),))
+    for _ in range(rng.randint(1, 4)):
+        length = rng.randint(1, 20)
+        cigar.append("%i%s" % (length, rng.choice("M=X")))
+        if rng.random() < 0.5:
+            cigar.append("%i%s" % (rng.randint(1, 10), rng.choice("IDN")))
+    cigar.append("%iM" % (rng.randint(1, 20),))
+    if rng.random() < 0.3:
+        cigar.append("%iS" % (rng.randint(1, 5),))
+
+    cigar = "".join(cigar)
+    for length, operation in _parse_cigar(cigar):
+        if operation in "MIS=X":
+            query_length += length
+
+    sequence = "".join(rng.choice("ACGTN") for _ in range(query_length))
+
+    return _record(header, name, start, cigar, sequence)
+
+
+def _parse_cigar(cigar):
+    length = ""
+    for char in cigar:
+        if char.isdigit():
+            length += char
+        else:
+            yield int(length), char
+            length = ""
+
+
+def _expected_sites(positions, records):
+    sites = {}
+    used = set()
+    for record_id, record in enumerate(records):
+        sequence = record.query_sequence
+        for query_pos, ref_pos in record.get_aligned_pairs(matches_only=True):
+            if ref_pos in positions and sequence[query_pos] != "N":
+                sites.setdefault(ref_pos, []).append((record_id, sequence[query_pos]))
+                used.add(record_id)
+
+    result = [(pos, "line%i" % (pos,), sites.get(pos, [])) for pos in sorted(positions)]
+
+    return result, len(used)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_genotype_sites__process(seed):
+    rng = random.Random(seed)
+    header = pysam.AlignmentHeader.from_dict(_HEADER)
+    positions = set(rng.sample(range(300), 60)) | set([999])
+    starts = sorted(rng.randint(0, 250) for _ in range(100))
+    records = [
+        _random_record(rng, header, "read%i" % (idx,), start)
+        for idx, start in enumerate(starts)
+    ]
+
+    statistics = {"n_reads": 0, "n_reads_used": 0}
+    sites = GenotypeSites(("1", pos + 1, "line%i" % (pos,)) for pos in positions)
+    result = list(sites.process(records, statistics))
+
+    expected, n_reads_used = _expected_sites(positions, records)
+    assert result == expected
+    assert statistics == {"n_reads": 100, "n_reads_used": n_reads_used}
+
+
+def test_genotype_sites__process_stops_after_last_site():
+    header = pysam.AlignmentHeader.from_dict(_HEADER)
+    records = [
+        _record(header, "read1", 10, "4M", "ACGT"),
+        _record(header, "read2", 20, "4M", "ACGT"),
+        _record(header, "read3", 30, "4M", "ACGT"),
+    ]
+
+    statistics = {"n_reads": 0, "n_reads_used": 0}
+    sites = GenotypeSites([("1", 12, "line")])
+
+    assert list(sites.process(records, statistics)) == [(11, "line", [(0, "C")])]
+    assert statistics == {"n_reads": 2, "n_reads_used": 1}
+
+
+def test_genotype_sites__process_unmapped_read():
+    header = pysam.AlignmentHeader.from_dict(_HEADER)
+    record = _record(header, "read1", 10, "4M", "ACGT")
+    unmapped = _record(header, "read1", 10, "4M", "ACGT", flag=0x4)
+    unmapped.cigarstring = None
+
+    statistics = {"n_reads": 0, "n_reads_used": 0}
+    sites = GenotypeSites([("1", 12, "line")])
+
+    result = list(sites.process([unmapped, record], statistics))
+    assert result == [(11, "line", [(1, "C")])]
+
+
+@pytest.fixture(scope="module")
+def bam_file(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("bam") / "reads.bam")
+    header = pysam.AlignmentHeader.from_dict(_HEADER)
+    rng = random.Random(1234)
+
+    records = []
+    for idx in range(2000):
+        contig, length = rng.choice((("1", 1000), ("2", 500)))
+        start = rng.randint(0, length - 60)
+        for flag in (0x41, 0x81):
+            records.append(_record(header, "read%i" % (idx,), start, "50M", "A" * 50))
+            records[-1].reference_name = contig
+            records[-1].flag = flag
+
+        # Filtered reads
+        records.append(_record(header, "dupe%i" % (idx,), start, "50M", "A" * 50))
+        records[-1].reference_name = contig
+        records[-1].flag = 0x400
+
+    records.sort(key=lambda record: (record.reference_id, record.reference_start))
+    with pysam.AlignmentFile(filename, "wb", header=header) as handle:
+        for record in records:
+            handle.write(record)
+    pysam.index(filename)
+
+    return filename
+
+
+def _downsample(filename, downsample, seed, contigs=("1", "2")):
+    with pysam.AlignmentFile(filename) as handle:
+        bam = DownsampledBAM(handle, downsample, contigs, seed=seed)
+
+        return {
+            contig: [(record.query_name, record.flag) for record in bam.fetch(contig)]
+            for contig in contigs
+        }
+
+
+def test_downsampled_bam__all_reads_if_fewer_than_downsample(bam_file):
+    result = _downsample(bam_file, 10000, seed=1)
+
+    assert sum(map(len, result.values())) == 4000
+    for records in result.values():
+        assert not any(name.startswith("dupe") for (name, _) in records)
+
+
+def test_downsampled_bam__deterministic(bam_file):
+    assert _downsample(bam_file, 1000, seed=1) == _downsample(bam_file, 1000, seed=1)
+    assert _downsample(bam_file, 1000, seed=1) != _downsample(bam_file, 1000, seed=2)
+
+
+def test_downsampled_bam__expected_number_of_reads(bam_file):
+    # 6000 mapped reads, of which 2000 are PCR duplicates; 2/3 of ~3000 reads
+    result = _downsample(bam_file, 3000, seed=1)
+    nreads = sum(map(len, result.values()))
+
+    assert 1700 <= nreads <= 2300
+
+
+def test_downsampled_bam__mates_are_sampled_together(bam_file):
+    names = []
+    for records in _downsample(bam_file, 1000, seed=3).values():
+        names.extend(name for (name, _) in records)
+
+    assert names
+    assert all(names.count(name) == 2 for name in names)
+
+
+def test_downsampled_bam__only_included_contigs_are_counted(bam_file):
+    result = _downsample(bam_file, 10000, seed=1, contigs=("2",))
+    with pysam.AlignmentFile(bam_file) as handle:
+        (stats,) = [s for s in handle.get_index_statistics() if s.contig == "2"]
+
+    assert len(result["2"]) * 3 == stats.mapped * 2
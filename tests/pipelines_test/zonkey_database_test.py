@@ -0,0 +1,123 @@
+import io
+import os
+import tarfile
+
+from unittest.mock import patch
+
+import pytest
+
+from paleomix.pipelines.zonkey.database import ZonkeyDB, ZonkeyDBError
+
+
+_FILES = {
+    "settings.yaml": "Format: 1\n"
+    "Revision: 20160112\n"
+    "Plink: '--horse'\n"
+    "NChroms: 2\n"
+    "MitoPadding: 2\n"
+    "SNPDistance: 150000\n",
+    "contigs.txt": "ID\tSize\tChecksum\n1\t1000\tabc\n2\t2000\tdef\n",
+    "samples.txt": "ID\tGroup(2)\tGroup(3)\tSpecies\tSex\tSampleID\tPublication\n"
+    "S1\tA\tA\tHorse\tMALE\tx\ty\n"
+    "S2\tB\tB\tHorse\tFEMALE\tx\ty\n"
+    "S3\tA\tC\tDonkey\tNA\tx\ty\n",
+    "genotypes.txt": "Chrom\tPos\tRef\tS1;S2;S3\n1\t10\tA\tAAGGCC\n",
+    "mitochondria.fasta": ">S1\nACGTAC\n>S2\nACGTAC\n>S3\nACGT\n>Ref EXCLUDE\nACGTAC\n",
+    "simulations.txt": "NReads\tK\tSample1\tSample2\tHasTS\tPercentile\tValue\n"
+    "1000\t2\tA\tB\tTRUE\t0.5\t0.1\n",
+    "examples/sample.txt": "example data\n",
+}
+
+
+def _write_database(filename, files=_FILES):
+    with tarfile.open(str(filename), "w:") as tar_handle:
+        for name, text in files.items():
+            data = text.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar_handle.addfile(info, io.BytesIO(data))
+
+    return str(filename)
+
+
+def _tables(database):
+    return {
+        "settings": database.settings,
+        "contigs": database.contigs,
+        "samples": database.samples,
+        "groups": database.groups,
+        "mitochondria": database.mitochondria,
+        "simulations": database.simulations,
+        "sample_order": database.sample_order,
+        "members": database.members,
+    }
+
+
+def test_zonkey_db__index_is_created(tmp_path):
+    filename = _write_database(tmp_path / "database.tar")
+
+    database = ZonkeyDB(filename)
+    assert os.path.exists(filename + ".index")
+    assert database.groups == {
+        2: {"S1": "A", "S2": "B", "S3": "A"},
+        3: {"S1": "A", "S2": "B", "S3": "C"},
+    }
+    assert database.sample_order == ("S1", "S2", "S3")
+    assert sorted(database.members) == sorted(_FILES)
+
+
+def test_zonkey_db__cached_index_matches_database(tmp_path):
+    filename = _write_database(tmp_path / "database.tar")
+
+    expected = _tables(ZonkeyDB(filename))
+    with patch.object(ZonkeyDB, "_read_database", side_effect=AssertionError):
+        assert _tables(ZonkeyDB(filename)) == expected
+
+
+def test_zonkey_db__index_rebuilt_if_database_changed(tmp_path):
+    filename = _write_database(tmp_path / "database.tar")
+    assert sorted(ZonkeyDB(filename).contigs) == ["1", "2"]
+
+    files = dict(_FILES)
+    files["contigs.txt"] = "ID\tSize\tChecksum\n1\t1000\tabc\n"
+    _write_database(filename, files)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert sorted(ZonkeyDB(filename).contigs) == ["1"]
+
+
+def test_zonkey_db__invalid_index_is_ignored(tmp_path):
+    filename = _write_database(tmp_path / "database.tar")
+    with open(filename + ".index", "w") as handle:
+        handle.write("{not json")
+
+    assert sorted(ZonkeyDB(filename).contigs) == ["1", "2"]
+    assert sorted(ZonkeyDB(filename).contigs) == ["1", "2"]
+
+
+def test_zonkey_db__index_cannot_be_written(tmp_path):
+    filename = _write_database(tmp_path / "database.tar")
+    os.mkdir(filename + ".index")
+
+    assert sorted(ZonkeyDB(filename).contigs) == ["1", "2"]
+    assert sorted(os.listdir(str(tmp_path))) == ["database.tar", "database.tar.index"]
+
+
+@pytest.mark.parametrize("cached", (False, True))
+def test_zonkey_db__open_member(tmp_path, cached):
+    filename = _write_database(tmp_path / "database.tar")
+    if cached:
+        ZonkeyDB(filename)
+
+    database = ZonkeyDB(filename)
+    for name, text in _FILES.items():
+        with database.open_member(name) as handle:
+            assert handle.read() == text.encode("utf-8")
+
+
+def test_zonkey_db__open_missing_member(tmp_path):
+    database = ZonkeyDB(_write_database(tmp_path / "database.tar"))
+
+    with pytest.raises(ZonkeyDBError):
+        database.open_member("missing.txt")
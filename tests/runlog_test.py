@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import json
+import subprocess
+
+from unittest.mock import Mock
+
+import pytest
+
+from paleomix.runlog import ResourceMonitor, RunLog, RunLogError, read_run_log
+
+
+def _node(output_files=(), threads=1):
+    node = Mock(output_files=frozenset(output_files), threads=threads)
+    node.__str__ = Mock(return_value="<Test Node>")
+    return node
+
+
+def test_resource_monitor__child_processes(tmp_path):
+    filename = tmp_path / "output.txt"
+
+    monitor = ResourceMonitor()
+    subprocess.check_call(
+        ["dd", "if=/dev/zero", "of=%s" % (filename,), "bs=4096", "count=256"],
+        stderr=subprocess.DEVNULL,
+    )
+    usage = monitor.finish(max_rss=1234)
+
+    assert usage["wall_time"] > 0
+    assert usage["user_time"] >= 0
+    assert usage["system_time"] >= 0
+    assert usage["max_rss"] == 1234
+    assert usage["bytes_written"] >= 4096 * 256
+
+
+def test_resource_monitor__no_max_rss():
+    assert ResourceMonitor().finish()["max_rss"] is None
+
+
+def test_run_log__record(tmp_path):
+    filename = tmp_path / "run.log"
+    node = _node([str(tmp_path / "a" / "b" / "1.txt"), str(tmp_path / "a" / "2.txt")])
+    usage = {"wall_time": 2.5, "user_time": 1.0, "system_time": 0.5}
+
+    with RunLog(str(filename)) as log:
+        log.record(node, "done", usage)
+        log.record(_node(threads=4), "failed", {"wall_time": 1.0})
+
+    record_1, record_2 = read_run_log(str(filename))
+    assert record_1["run"] == record_2["run"]
+    assert record_1["node"] == "<Test Node>"
+    assert record_1["class"] == "unittest.mock.Mock"
+    assert record_1["state"] == "done"
+    assert record_1["threads"] == 1
+    assert record_1["output_dir"].endswith("/a")
+    assert record_1["wall_time"] == 2.5
+    assert record_1["user_time"] == 1.0
+    assert record_1["system_time"] == 0.5
+
+    assert record_2["state"] == "failed"
+    assert record_2["threads"] == 4
+    assert record_2["output_dir"] is None
+    assert "user_time" not in record_2
+
+
+def test_run_log__appends(tmp_path):
+    filename = str(tmp_path / "run.log")
+    for _ in range(2):
+        with RunLog(filename) as log:
+            log.record(_node(), "done", {})
+
+    assert len(list(read_run_log(filename))) == 2
+
+
+def test_run_log__cannot_open(tmp_path):
+    with pytest.raises(RunLogError):
+        RunLog(str(tmp_path / "missing" / "run.log"))
+
+
+def test_read_run_log__skips_empty_lines(tmp_path):
+    filename = tmp_path / "run.log"
+    filename.write_text('{"a": 1}\n\n{"b": 2}\n')
+
+    assert list(read_run_log(str(filename))) == [{"a": 1}, {"b": 2}]
+
+
+@pytest.mark.parametrize("line", ("{", "[1, 2]"))
+def test_read_run_log__invalid_records(tmp_path, line):
+    filename = tmp_path / "run.log"
+    filename.write_text(json.dumps({"a": 1}) + "\n" + line + "\n")
+
+    with pytest.raises(RunLogError, match=":2"):
+        list(read_run_log(str(filename)))
@@ -0,0 +1,155 @@
+import random
+
+import pysam
+import pytest
+
+import paleomix.tools.coverage as coverage
+import paleomix.tools.depths as depths
+
+from paleomix.tools.bam_stats.common import BAMStatsError
+
+
+_CONTIGS = (("chr1", 2000), ("chr2", 500), ("chr3", 800), ("chr4", 1000))
+# Contigs without any reads mapped to them
+_UNMAPPED_CONTIGS = ("chr3",)
+_READGROUPS = (("rg1", "sample1", "lib1"), ("rg2", "sample1", "lib2"))
+
+_HEADER = {
+    "HD": {"VN": "1.6", "SO": "coordinate"},
+    "SQ": [{"SN": name, "LN": length} for (name, length) in _CONTIGS],
+    "RG": [{"ID": key, "SM": sm, "LB": lb} for (key, sm, lb) in _READGROUPS],
+}
+
+
+def _random_record(rng, header, name, tid, length):
+    record = pysam.AlignedSegment(header)
+    record.query_name = name
+
+    cigar = [(0, rng.randint(10, 40))]
+    if rng.random() < 0.3:
+        cigar.append((rng.choice((1, 2, 3)), rng.randint(1, 5)))
+        cigar.append((0, rng.randint(10, 40)))
+
+    record.cigartuples = cigar
+    record.reference_id = tid
+    record.reference_start = rng.randint(0, length - record.reference_length)
+    record.mapping_quality = 30
+    record.flag = rng.choice((0x0, 0x10, 0x1 | 0x40, 0x1 | 0x80, 0x4, 0x400))
+    record.query_sequence = "A" * record.query_length
+    record.query_qualities = [30] * record.query_length
+
+    readgroup = rng.choice(_READGROUPS + ((None,),))[0]
+    if readgroup is not None:
+        record.set_tag("RG", readgroup)
+
+    return record
+
+
+@pytest.fixture(scope="module")
+def bam_file(tmp_path_factory):
+    rng = random.Random(1234)
+    filename = str(tmp_path_factory.mktemp("bam") / "input.bam")
+
+    with pysam.AlignmentFile(filename, "wb", header=_HEADER) as handle:
+        header = handle.header
+        records = []
+        for (tid, (contig, length)) in enumerate(_CONTIGS):
+            if contig not in _UNMAPPED_CONTIGS:
+                for idx in range(300):
+                    name = "%s_%i" % (contig, idx)
+                    records.append(_random_record(rng, header, name, tid, length))
+
+        records.sort(key=lambda record: (record.reference_id, record.reference_start))
+        for record in records:
+            handle.write(record)
+
+        # Trailing unmapped reads
+        for idx in range(10):
+            record = pysam.AlignedSegment(header)
+            record.query_name = "unmapped_%i" % (idx,)
+            record.flag = 0x4
+            record.query_sequence = "ACGT"
+            handle.write(record)
+
+    pysam.index(filename)
+
+    return filename
+
+
+@pytest.fixture(scope="module")
+def regions_file(tmp_path_factory):
+    filename = tmp_path_factory.mktemp("bed") / "regions.bed"
+    filename.write_text(
+        "chr1\t0\t500\tregion1\n"
+        "chr1\t400\t1500\tregion2\n"
+        "chr2\t100\t200\n"
+        "chr3\t0\t800\tregion3\n"
+        "chr4\t0\t1000\tregion1\n"
+    )
+
+    return str(filename)
+
+
+def _run(tmp_path, module, bam_file, threads, extra_args=()):
+    outfile = tmp_path / ("out_%i" % (threads,))
+    argv = [bam_file, str(outfile), "--threads", str(threads), "--target-name", "T"]
+    argv.extend(extra_args)
+
+    assert module.main(argv) == 0
+
+    return outfile.read_text()
+
+
+@pytest.mark.parametrize("module", (coverage, depths))
+@pytest.mark.parametrize("threads", (2, 3, 8))
+def test_threads__same_as_single_thread(tmp_path, bam_file, module, threads):
+    expected = _run(tmp_path, module, bam_file, 1)
+
+    assert _run(tmp_path, module, bam_file, threads) == expected
+
+
+@pytest.mark.parametrize("module", (coverage, depths))
+@pytest.mark.parametrize("threads", (2, 3))
+def test_threads__same_as_single_thread__regions(
+    tmp_path, bam_file, regions_file, module, threads
+):
+    extra_args = ["--regions-file", regions_file]
+    expected = _run(tmp_path, module, bam_file, 1, extra_args)
+
+    assert _run(tmp_path, module, bam_file, threads, extra_args) == expected
+
+
+@pytest.mark.parametrize("module", (coverage, depths))
+def test_threads__same_as_single_thread__ignore_readgroups(tmp_path, bam_file, module):
+    extra_args = ["--ignore-readgroups"]
+    expected = _run(tmp_path, module, bam_file, 1, extra_args)
+
+    assert _run(tmp_path, module, bam_file, 2, extra_args) == expected
+
+
+@pytest.mark.parametrize("module", (coverage, depths))
+def test_threads__same_as_single_thread__max_contigs(tmp_path, bam_file, module):
+    extra_args = ["--max-contigs", "2"]
+    expected = _run(tmp_path, module, bam_file, 1, extra_args)
+
+    assert "<Genome>" in expected
+    assert _run(tmp_path, module, bam_file, 2, extra_args) == expected
+
+
+def _raise_bam_stats_error(handle, args, regions, timer):
+    if any(region.contig == "chr2" for region in regions):
+        raise BAMStatsError("error in worker")
+
+    return {}
+
+
+@pytest.mark.parametrize("module", (coverage, depths))
+def test_threads__errors_in_workers_are_propagated(
+    monkeypatch, tmp_path, capsys, bam_file, module
+):
+    monkeypatch.setattr(module, "process_regions", _raise_bam_stats_error)
+
+    argv = [bam_file, str(tmp_path / "out"), "--threads", "2"]
+    assert module.main(argv) == 1
+    assert "ERROR: error in worker" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
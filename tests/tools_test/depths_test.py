@@ -0,0 +1,357 @@
+import collections
+import itertools
+import random
+
+import pysam
+import pytest
+
+import paleomix.tools.depths as depths
+
+from paleomix.common.bedtools import BEDRecord
+from paleomix.tools.bam_stats.common import _get_readgroup
+
+
+class _Args:
+    def __init__(self, regions=None, ignore_readgroups=False):
+        self.regions = regions
+        self.max_contigs = 100
+        self.ignore_readgroups = ignore_readgroups
+        self.get_readgroup_func = _get_readgroup
+
+
+class _Handle:
+    def __init__(self, header):
+        self.header = header
+        self.references = header.references
+        self.lengths = header.lengths
+        self.nreferences = header.nreferences
+
+
+_HEADER = pysam.AlignmentHeader.from_dict(
+    {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": "chr1", "LN": 300}, {"SN": "chr2", "LN": 50}],
+        "RG": [
+            {"ID": "rg1", "SM": "sample1", "LB": "library1"},
+            {"ID": "rg2", "SM": "sample1", "LB": "library2"},
+            {"ID": "rg3", "SM": "sample2", "LB": "library3"},
+        ],
+    }
+)
+
+
+def _region(contig, start, end, name=None):
+    return BEDRecord("%s\t%i\t%i\t%s" % (contig, start, end, name or contig))
+
+
+def _record(start, cigar, readgroup=None, contig="chr1"):
+    record = pysam.AlignedSegment(_HEADER)
+    record.query_name = "read"
+    record.reference_id = _HEADER.references.index(contig)
+    record.reference_start = start
+    record.cigarstring = cigar
+    if readgroup is not None:
+        record.set_tag("RG", readgroup)
+
+    return record
+
+
+def _random_record(rng, contig_length):
+    cigar = []
+    if rng.random() < 0.2:
+        cigar.append("%iS" % (rng.randint(1, 5),))
+    cigar.append("%iM" % (rng.randint(1, 30),))
+    for _ in range(rng.choice((0, 0, 1, 2))):
+        cigar.append("%i%s" % (rng.randint(1, 10), rng.choice("IDN")))
+        cigar.append("%i%s" % (rng.randint(1, 30), rng.choice("MM=X")))
+
+    record = _record(0, "".join(cigar), rng.choice(("rg1", "rg2", "rg3", "rgX", None)))
+    record.reference_start = rng.randint(0, contig_length - record.reference_length)
+
+    return record
+
+
+def _expected_totals(args, region, records):
+    """Computes totals by counting the depth at every position in the region and
+    passing these one at a time to MappingToTotals._update_totals, as done by the
+    original, per-base implementation of 'paleomix depths'."""
+    totals = depths.build_totals_dict(args, _Handle(_HEADER))
+    rg_to_smlbid, smlbid_to_smlb = depths.build_rg_to_smlbid_keys(
+        args, _Handle(_HEADER)
+    )
+    mapping = depths.MappingToTotals(totals, region, smlbid_to_smlb)
+
+    counts = collections.defaultdict(lambda: [0] * len(smlbid_to_smlb))
+    for record in records:
+        key = rg_to_smlbid.get(args.get_readgroup_func(record), rg_to_smlbid[None])
+
+        position = record.reference_start
+        for (op, length) in record.cigartuples:
+            if op in (0, 7, 8):
+                for offset in range(length):
+                    counts[position + offset][key] += 1
+                position += length
+            elif op in (2, 3):
+                position += length
+
+    for position in range(region.start, region.end):
+        if position in counts:
+            mapping._update_totals(counts[position])
+
+    return _normalize(totals)
+
+
+def _observed_totals(args, region, records):
+    """Computes totals using the same procedure as 'depths.process_regions'."""
+    totals = depths.build_totals_dict(args, _Handle(_HEADER))
+    rg_to_smlbid, smlbid_to_smlb = depths.build_rg_to_smlbid_keys(
+        args, _Handle(_HEADER)
+    )
+    events = depths.DepthEvents(len(smlbid_to_smlb))
+    mapping = depths.MappingToTotals(totals, region, smlbid_to_smlb)
+
+    records = sorted(records, key=lambda record: record.reference_start)
+    for position, group in itertools.groupby(records, lambda it: it.reference_start):
+        mapping.process_counts(events, position)
+        for record in group:
+            depths.count_bases(args, events, record, rg_to_smlbid)
+
+    mapping.process_counts(events, float("inf"))
+    mapping.finalize()
+
+    return _normalize(totals)
+
+
+def _normalize(totals):
+    return {
+        key: {depth: count for (depth, count) in counts.items() if count}
+        for (key, counts) in totals.items()
+    }
+
+
+###############################################################################
+###############################################################################
+# DepthEvents
+
+
+def test_depth_events__empty():
+    events = depths.DepthEvents(2)
+
+    assert events.pop(float("inf")) == []
+
+
+def test_depth_events__add_and_pop():
+    events = depths.DepthEvents(2)
+    events.add(10, 20, 0)
+    events.add(15, 20, 1)
+    events.add(5, 15, 0)
+
+    assert events.pop(15) == [(5, [1, 0]), (10, [1, 0])]
+    assert events.pop(15) == []
+    assert events.pop(float("inf")) == [(15, [-1, 1]), (20, [-1, -1])]
+
+
+def test_depth_events__adjacent_blocks_cancel_out():
+    events = depths.DepthEvents(1)
+    events.add(10, 20, 0)
+    events.add(20, 30, 0)
+
+    assert events.pop(float("inf")) == [(10, [1]), (20, [0]), (30, [-1])]
+
+
+###############################################################################
+###############################################################################
+# count_bases
+
+
+def _count_bases(record, args=None):
+    args = args or _Args()
+    rg_to_smlbid, smlbid_to_smlb = depths.build_rg_to_smlbid_keys(
+        args, _Handle(_HEADER)
+    )
+    events = depths.DepthEvents(len(smlbid_to_smlb))
+    depths.count_bases(args, events, record, rg_to_smlbid)
+
+    return events.pop(float("inf"))
+
+
+def test_count_bases__match():
+    assert _count_bases(_record(10, "10M", "rg1")) == [
+        (10, [0, 1, 0, 0]),
+        (20, [0, -1, 0, 0]),
+    ]
+
+
+def test_count_bases__clipping_and_insertions_are_not_counted():
+    assert _count_bases(_record(10, "5S5M3I5M5H", "rg2")) == [
+        (10, [0, 0, 1, 0]),
+        (15, [0, 0, 0, 0]),
+        (20, [0, 0, -1, 0]),
+    ]
+
+
+@pytest.mark.parametrize("op", "DN")
+def test_count_bases__deletions_and_skips(op):
+    assert _count_bases(_record(10, "5M3%s5=2X" % (op,), "rg3")) == [
+        (10, [0, 0, 0, 1]),
+        (15, [0, 0, 0, -1]),
+        (18, [0, 0, 0, 1]),
+        (23, [0, 0, 0, 0]),
+        (25, [0, 0, 0, -1]),
+    ]
+
+
+@pytest.mark.parametrize("readgroup", (None, "rgX"))
+def test_count_bases__missing_or_unknown_readgroup(readgroup):
+    assert _count_bases(_record(10, "5M", readgroup)) == [
+        (10, [1, 0, 0, 0]),
+        (15, [-1, 0, 0, 0]),
+    ]
+
+
+def test_count_bases__ignore_readgroups():
+    args = _Args(ignore_readgroups=True)
+
+    assert _count_bases(_record(10, "5M", "rg1"), args) == [(10, [1]), (15, [-1])]
+
+
+###############################################################################
+###############################################################################
+# MappingToTotals
+
+
+def test_mapping_to_totals__overlapping_reads():
+    args = _Args()
+    region = _region("chr1", 0, 300)
+    records = [
+        _record(10, "20M", "rg1"),
+        _record(10, "20M", "rg1"),
+        _record(15, "10M", "rg2"),
+        _record(25, "10M", "rg3"),
+    ]
+
+    totals = _observed_totals(args, region, records)
+
+    assert totals == _expected_totals(args, region, records)
+    assert totals[("*", "*", "*")] == {1: 5, 2: 5, 3: 15}
+    assert totals[("sample1", "library1", "chr1")] == {2: 20}
+    assert totals[("sample1", "*", "chr1")] == {2: 10, 3: 10}
+    assert totals[("sample2", "*", "*")] == {1: 10}
+
+
+def test_mapping_to_totals__zero_depth_gaps():
+    args = _Args()
+    region = _region("chr1", 0, 300)
+    records = [_record(10, "5M", "rg1"), _record(100, "5M10N5M", "rg1")]
+
+    totals = _observed_totals(args, region, records)
+
+    assert totals == _expected_totals(args, region, records)
+    assert totals[("*", "*", "*")] == {1: 15}
+
+
+def test_mapping_to_totals__contig_ends():
+    args = _Args()
+    region = _region("chr2", 0, 50)
+    records = [_record(0, "10M", "rg1", "chr2"), _record(40, "10M", "rg2", "chr2")]
+
+    totals = _observed_totals(args, region, records)
+
+    assert totals == _expected_totals(args, region, records)
+    assert totals[("sample1", "*", "chr2")] == {1: 20}
+
+
+def test_mapping_to_totals__region_boundaries():
+    args = _Args()
+    region = _region("chr1", 20, 40, "chr1")
+    records = [
+        # Overlaps start of region
+        _record(10, "15M", "rg1"),
+        # Overlaps end of region
+        _record(35, "15M", "rg2"),
+        # Spans entire region
+        _record(0, "100M", "rg3"),
+        # Entirely outside the region
+        _record(50, "15M", "rg1"),
+    ]
+
+    totals = _observed_totals(args, region, records)
+
+    assert totals == _expected_totals(args, region, records)
+    assert totals[("*", "*", "*")] == {1: 10, 2: 10}
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("window_size", (1, 17, 2 ** 16))
+@pytest.mark.parametrize("cache_size", (1, 10000))
+def test_mapping_to_totals__random_reads(monkeypatch, seed, window_size, cache_size):
+    monkeypatch.setattr(depths, "_MIN_WINDOW_SIZE", window_size)
+    monkeypatch.setattr(depths, "_MAX_CACHE_SIZE", cache_size)
+
+    rng = random.Random(seed)
+    args = _Args(ignore_readgroups=seed % 3 == 0)
+    records = [_random_record(rng, 300) for _ in range(rng.randint(0, 100))]
+    start = rng.randint(0, 150)
+    region = _region("chr1", start, rng.randint(start + 1, 300), "chr1")
+
+    expected = _expected_totals(args, region, records)
+    assert _observed_totals(args, region, records) == expected
+
+
+###############################################################################
+###############################################################################
+# main
+
+
+def _write_bam(filename, records):
+    with pysam.AlignmentFile(filename, "wb", header=_HEADER) as handle:
+        for (idx, record) in enumerate(records):
+            record.query_name = "read%i" % (idx,)
+            record.query_sequence = "A" * record.query_length
+            handle.write(record)
+
+    pysam.index(filename)
+
+
+def _read_table(filename):
+    rows = {}
+    with open(filename) as handle:
+        lines = [line.rstrip("\n").split("\t") for line in handle]
+
+    header = lines[[line[0] for line in lines].index("Name")]
+    for line in lines:
+        if len(line) == len(header) and line[0] != "Name":
+            row = dict(zip(header, line))
+            rows[(row["Sample"], row["Library"], row["Contig"])] = row
+
+    return rows
+
+
+def test_main(tmp_path):
+    filename = str(tmp_path / "input.bam")
+    _write_bam(filename, [_record(0, "10M"), _record(5, "10M")])
+
+    assert depths.main([filename, "--ignore-readgroups"]) == 0
+
+    rows = _read_table(str(tmp_path / "input.depths"))
+    row = rows[("*", "*", "chr1")]
+    assert row["Size"] == "300"
+    assert row["MD_001"] == "%.4f" % (15 / 300,)
+    assert row["MD_002"] == "%.4f" % (5 / 300,)
+    assert row["MD_003"] == "0.0000"
+    assert rows[("*", "*", "chr2")]["MD_001"] == "0.0000"
+
+
+def test_main__regions(tmp_path):
+    filename = str(tmp_path / "input.bam")
+    _write_bam(filename, [_record(0, "10M"), _record(5, "10M")])
+    regions = tmp_path / "regions.bed"
+    regions.write_text("chr1\t5\t10\tregion1\nchr1\t10\t30\tregion2\n")
+
+    argv = [filename, "--ignore-readgroups", "--regions-file", str(regions)]
+    assert depths.main(argv) == 0
+
+    rows = _read_table(str(tmp_path / "input.depths"))
+    assert rows[("*", "*", "region1")]["MD_002"] == "1.0000"
+    assert rows[("*", "*", "region2")]["MD_001"] == "0.2500"
+    assert rows[("*", "*", "region2")]["MD_002"] == "0.0000"
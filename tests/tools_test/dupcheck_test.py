@@ -0,0 +1,101 @@
+import pysam
+import pytest
+
+import paleomix.tools.dupcheck as dupcheck
+
+
+_HEADER = {
+    "HD": {"VN": "1.6", "SO": "coordinate"},
+    "SQ": [{"SN": "chr1", "LN": 1000}, {"SN": "chr2", "LN": 500}],
+}
+
+
+def _write_bam(tmp_path, name, reads, index=True):
+    filename = str(tmp_path / name)
+    with pysam.AlignmentFile(filename, "wb", header=_HEADER) as handle:
+        for qname, tid, pos in sorted(reads, key=lambda read: read[1:]):
+            record = pysam.AlignedSegment(handle.header)
+            record.query_name = qname
+            record.reference_id = tid
+            record.reference_start = pos
+            record.query_sequence = "ACGT"
+            record.query_qualities = pysam.qualitystring_to_array("IIII")
+            record.cigartuples = [(0, 4)]
+            handle.write(record)
+
+    if index:
+        pysam.index(filename)
+
+    return filename
+
+
+@pytest.mark.parametrize("threads", ("1", "2"))
+def test_main__no_duplicates(tmp_path, capsys, threads):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10), ("r2", 1, 20)])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r3", 0, 10), ("r4", 1, 20)])
+
+    assert dupcheck.main([filename_1, filename_2, "--threads", threads]) == 0
+    assert capsys.readouterr().out == "Found 0 record(s) with duplicates.\n"
+
+
+@pytest.mark.parametrize("threads", ("1", "2"))
+def test_main__duplicates(tmp_path, capsys, threads):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10), ("r2", 1, 20)])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r1", 0, 10), ("r2", 1, 20)])
+
+    assert dupcheck.main([filename_1, filename_2, "--threads", threads]) == 0
+
+    out = capsys.readouterr().out
+    assert out.startswith("chr1:10 -- r1 ACGT IIII:\n")
+    assert "chr2:20 -- r2 ACGT IIII:\n" in out
+    assert out.endswith("Found 2 record(s) with duplicates.\n")
+
+
+def test_main__quiet(tmp_path, capsys):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10), ("r2", 1, 20)])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r1", 0, 10), ("r2", 1, 20)])
+
+    assert dupcheck.main([filename_1, filename_2, "--quiet"]) == 0
+    assert capsys.readouterr().out == "2\n"
+
+
+def test_main__fail_on_duplicates(tmp_path, capsys):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10), ("r2", 1, 20)])
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r1", 0, 10), ("r2", 1, 20)])
+
+    assert dupcheck.main([filename_1, filename_2, "--fail-on-duplicates"]) == 1
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    # Only the first duplicate is reported
+    assert captured.err.startswith("chr1:10 -- r1 ACGT IIII:\n")
+    assert "chr2:20" not in captured.err
+    assert "found multiple times at position 10 on 'chr1'" in captured.err
+
+
+def test_main__unindexed_files_indexed_in_temp_root(tmp_path, capsys):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10)], index=False)
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r1", 0, 10)], index=False)
+    temp_root = tmp_path / "temp"
+    temp_root.mkdir()
+
+    argv = [filename_1, filename_2, "--threads", "2", "--temp-root", str(temp_root)]
+    assert dupcheck.main(argv) == 0
+    assert capsys.readouterr().out.endswith("Found 1 record(s) with duplicates.\n")
+    # Temporary indices are removed
+    assert not list(temp_root.iterdir())
+
+
+def test_index_bam_files(tmp_path):
+    filename_1 = _write_bam(tmp_path, "1.bam", [("r1", 0, 10)], index=True)
+    filename_2 = _write_bam(tmp_path, "2.bam", [("r1", 0, 10)], index=False)
+
+    index_files = dupcheck.index_bam_files([filename_1, filename_2], str(tmp_path))
+
+    assert index_files == {filename_2: str(tmp_path / "1.bai")}
+    assert (tmp_path / "1.bai").exists()
+
+
+def test_parse_args__invalid_threads():
+    with pytest.raises(SystemExit):
+        dupcheck.parse_args(["1.bam", "--threads", "0"])
@@ -0,0 +1,147 @@
+import random
+
+import pysam
+import pytest
+
+import paleomix.tools.rmdup_collapsed as rmdup
+
+
+_CONTIGS = (("chr1", 5000), ("chr2", 3000), ("chr3", 10))
+
+
+class _Output:
+    def __init__(self):
+        self.reads = []
+
+    def write(self, read):
+        self.reads.append(read.to_string())
+
+
+def _random_read(rng, header, name, contig, template):
+    start, length, is_reverse = template
+
+    # Clipping results in duplicates starting/ending at different positions
+    cigar = [(0, length)]
+    if rng.random() < 0.3:
+        clipped = rng.randint(1, 5)
+        cigar = [(rng.choice((4, 5)), clipped), (0, length - clipped)]
+        start += clipped
+    if rng.random() < 0.3:
+        clipped = rng.randint(1, 5)
+        cigar[-1] = (0, cigar[-1][1] - clipped)
+        cigar.append((rng.choice((4, 5)), clipped))
+
+    read = pysam.AlignedSegment(header)
+    read.query_name = name
+    read.reference_id = contig
+    read.reference_start = start
+    read.mapping_quality = 30
+    read.is_reverse = is_reverse
+    read.cigartuples = cigar
+
+    query_length = sum(length for (op, length) in cigar if op != 5)
+    read.query_sequence = "".join(rng.choice("ACGT") for _ in range(query_length))
+    read.query_qualities = [rng.randint(0, 40) for _ in range(query_length)]
+
+    if rng.random() < 0.1:
+        read.set_tag("XP", rng.randint(1, 5), "i")
+    if rng.random() < 0.05:
+        read.flag |= rng.choice((0x1, 0x100, 0x200, 0x400, 0x800))
+
+    return read
+
+
+def _sort_key(read):
+    return (read.reference_id < 0, read.reference_id, read.reference_start)
+
+
+def _write_bam(filename, seed):
+    rng = random.Random(seed)
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": name, "LN": length} for (name, length) in _CONTIGS],
+    }
+
+    reads = []
+    with pysam.AlignmentFile(filename, "wb", header=header) as handle:
+        for (contig, (_, length)) in enumerate(_CONTIGS):
+            # Few templates to ensure that many reads are duplicates
+            templates = []
+            for _ in range(length // 10):
+                start = rng.randrange(length)
+                templates.append((start, rng.randint(20, 40), rng.random() < 0.5))
+
+            for idx in range(length // 2):
+                template = rng.choice(templates)
+                name = "read_%i_%i" % (contig, idx)
+                reads.append(_random_read(rng, handle.header, name, contig, template))
+
+        for idx in range(5):
+            read = pysam.AlignedSegment(handle.header)
+            read.query_name = "unmapped_%i" % (idx,)
+            read.flag = 0x4 | (0x400 if idx == 0 else 0)
+            read.reference_id = read.reference_start = -1
+            read.query_sequence = "ACGT"
+            reads.append(read)
+
+        reads.sort(key=_sort_key)
+        for read in reads:
+            handle.write(read)
+
+    pysam.index(filename)
+
+
+def _run(filename, argv, parallel):
+    args = rmdup.parse_args([filename] + argv)
+    output = _Output()
+    with pysam.AlignmentFile(filename) as handle:
+        if parallel:
+            assert rmdup.process_in_parallel(args, handle, output) == 0
+        else:
+            assert rmdup.process(args, handle, output) == 0
+
+    return output.reads
+
+
+@pytest.mark.parametrize("seed", (1, 2, 3))
+@pytest.mark.parametrize("threads", (2, 3))
+@pytest.mark.parametrize("argv", ([], ["--remove-duplicates"]))
+def test_process_in_parallel__same_as_serial(
+    tmp_path, monkeypatch, seed, threads, argv
+):
+    monkeypatch.setattr(rmdup, "_MIN_WINDOW_SIZE", 250)
+
+    filename = str(tmp_path / "input.bam")
+    _write_bam(filename, seed)
+    argv = argv + ["--threads", str(threads)]
+
+    expected = _run(filename, argv, parallel=False)
+    result = _run(filename, argv, parallel=True)
+
+    assert len(expected) > 500
+    assert result == expected
+
+
+def test_build_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(rmdup, "_MIN_WINDOW_SIZE", 1000)
+
+    filename = str(tmp_path / "input.bam")
+    _write_bam(filename, 1)
+
+    with pysam.AlignmentFile(filename) as handle:
+        assert rmdup.build_windows(handle, 8) == [
+            ("chr1", 0, 1000),
+            ("chr1", 1000, 2000),
+            ("chr1", 2000, 3000),
+            ("chr1", 3000, 4000),
+            ("chr1", 4000, None),
+            ("chr2", 0, 1000),
+            ("chr2", 1000, 2000),
+            ("chr2", 2000, None),
+            ("chr3", 0, None),
+        ]
+
+
+def test_parse_args__invalid_threads():
+    with pytest.raises(SystemExit):
+        rmdup.parse_args(["--threads", "0"])
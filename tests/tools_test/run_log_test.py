@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+import paleomix.tools.run_log as run_log
+
+
+_RECORDS = (
+    {
+        "run": "2020-01-01T10:00:00",
+        "class": "paleomix.nodes.bwa.BWAAlgorithmNode",
+        "state": "done",
+        "output_dir": "target/genome/sample_a/library/lane",
+        "wall_time": 3600.0,
+        "user_time": 7000.0,
+        "system_time": 200.0,
+        "max_rss": 4 * 1024 ** 3,
+        "bytes_read": 1024,
+        "bytes_written": 2048,
+    },
+    {
+        "run": "2020-01-01T10:00:00",
+        "class": "paleomix.nodes.bwa.BWAAlgorithmNode",
+        "state": "done",
+        "output_dir": "target/genome/sample_b/library/lane",
+        "wall_time": 1800.0,
+        "user_time": 3000.0,
+        "system_time": 600.0,
+        "max_rss": 2 * 1024 ** 3,
+        "bytes_read": 1024,
+        "bytes_written": 1024,
+    },
+    {
+        "run": "2020-01-02T10:00:00",
+        "class": "paleomix.nodes.picard.MarkDuplicatesNode",
+        "state": "failed",
+        "output_dir": "target/genome/sample_a",
+        "wall_time": 60.0,
+    },
+    {
+        "run": "2020-01-02T10:00:00",
+        "class": "paleomix.nodes.bwa.BWAIndexNode",
+        "state": "done",
+        "output_dir": None,
+        "wall_time": 90.0,
+        "user_time": 45.0,
+        "system_time": 0.0,
+        "max_rss": None,
+        "bytes_read": 1024 ** 2,
+        "bytes_written": 0,
+    },
+)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    filename = tmp_path / "run.log"
+    with filename.open("w") as handle:
+        for record in _RECORDS:
+            print(json.dumps(record), file=handle)
+
+    return str(filename)
+
+
+def _run(capsys, argv):
+    assert run_log.main(argv) == 0
+
+    return [line.split() for line in capsys.readouterr().out.splitlines()]
+
+
+def test_run_log__by_class(capsys, log_file):
+    assert _run(capsys, [log_file]) == [
+        ["Class", "Nodes", "Failed", "WallTime", "CPUTime", "CPUUsage"]
+        + ["MaxRSS", "Read", "Written"],
+        ["BWAAlgorithmNode", "2", "0", "1:30:00", "3:00:00", "200%"]
+        + ["4.0G", "2.0K", "3.0K"],
+        ["BWAIndexNode", "1", "0", "0:01:30", "0:00:45", "50%", "-", "1.0M", "0"],
+        ["MarkDuplicatesNode", "1", "1", "0:01:00", "0:00:00", "0%", "-", "0", "0"],
+        ["*", "4", "1", "1:32:30", "3:00:45", "195%", "4.0G", "1.0M", "3.0K"],
+    ]
+
+
+def test_run_log__by_stage(capsys, log_file):
+    rows = _run(capsys, [log_file, "--group-by", "stage"])
+
+    assert [row[:3] for row in rows] == [
+        ["Stage", "Nodes", "Failed"],
+        ["bwa", "3", "0"],
+        ["picard", "1", "1"],
+        ["*", "4", "1"],
+    ]
+
+
+def test_run_log__by_sample(capsys, log_file):
+    rows = _run(capsys, [log_file, "--group-by", "sample"])
+
+    assert [row[:4] for row in rows] == [
+        ["Sample", "Nodes", "Failed", "WallTime"],
+        ["sample_a", "2", "1", "1:01:00"],
+        ["sample_b", "1", "0", "0:30:00"],
+        ["-", "1", "0", "0:01:30"],
+        ["*", "4", "1", "1:32:30"],
+    ]
+
+
+def test_run_log__last_run_and_top(capsys, log_file):
+    rows = _run(capsys, [log_file, "--last-run", "--top", "1"])
+
+    assert [row[:2] for row in rows] == [
+        ["Class", "Nodes"],
+        ["BWAIndexNode", "1"],
+        ["*", "2"],
+    ]
+
+
+@pytest.mark.parametrize("argv", (["--top", "0"], ["--sample-depth", "-1"]))
+def test_run_log__invalid_options(log_file, argv):
+    assert run_log.main([log_file] + argv) == 1
+
+
+def test_run_log__invalid_log(tmp_path):
+    filename = tmp_path / "run.log"
+    filename.write_text("{\n")
+
+    assert run_log.main([str(filename)]) == 1
+    assert run_log.main([str(tmp_path / "missing.log")]) == 1
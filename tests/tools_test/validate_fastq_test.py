@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import bz2
+import gzip
+
+import pytest
+
+import paleomix.tools.validate_fastq as validate_fastq
+
+from paleomix.common.formats.fastq import FASTQ, FASTQError, FASTQualities
+
+
+_RECORDS = (
+    "@read1 meta\nACGTN\n+\nIIII5\n"
+    "@read2\nAC\n+read2\n!!\n"
+    "@read3\tmeta data\n\n+\n\n"
+    "@read4\nACGTACGTACGT\n+\nhhhhhhhhhhhh\n"
+)
+
+_VALID_FILES = (
+    "",
+    "\n",
+    _RECORDS,
+    _RECORDS.rstrip("\n"),
+    _RECORDS + "\n\n",
+    _RECORDS + "\n" + _RECORDS,
+    _RECORDS.replace("\n", "\r\n"),
+    _RECORDS.replace("ACGTN\n", "ACGTN  \n"),
+    _RECORDS.replace("@read2\n", "@read2\x1c\n"),
+    _RECORDS.replace("read1", "r\xe9ad1"),
+)
+
+_INVALID_FILES = (
+    "read1\nACGT\n+\nIIII\n",
+    "@\nACGT\n+\nIIII\n",
+    "@ read1\nACGT\n+\nIIII\n",
+    "@read1\nACGT\n-\nIIII\n",
+    "@read1\nACGT\n+\nIII\n",
+    "@read1\nACGT\n+\nIIII  \n@read2\nACG\n+\nIIII\n",
+    _RECORDS + "@read5\nACGT\n",
+    _RECORDS + "@read5\nACGT\n+\n",
+    _RECORDS + "@read5\nACGT\n+\nIIII\n" + "@read6\nACGT\n+\nIII\n",
+)
+
+
+def _expected_results(filename):
+    qualities = FASTQualities()
+    reads = nucleotides = 0
+    for record in FASTQ.from_file(filename):
+        qualities.update(record)
+
+        reads += 1
+        nucleotides += len(record.sequence)
+
+    return reads, nucleotides, qualities._qualities
+
+
+def _write_file(tmp_path, data, compression=None):
+    filename = tmp_path / "reads.fastq"
+    if compression == "gz":
+        with gzip.open(filename, "wt") as handle:
+            handle.write(data)
+    elif compression == "bz2":
+        with bz2.open(filename, "wt") as handle:
+            handle.write(data)
+    else:
+        filename.write_bytes(data.encode("utf-8"))
+
+    return str(filename)
+
+
+@pytest.mark.parametrize("data", _VALID_FILES)
+@pytest.mark.parametrize("block_size", (1, 7, 1024))
+def test_validate_file__valid(tmp_path, monkeypatch, data, block_size):
+    monkeypatch.setattr(validate_fastq, "_BLOCK_SIZE", block_size)
+    filename = _write_file(tmp_path, data)
+
+    qualities = FASTQualities()
+    reads, nucleotides = validate_fastq.validate_file(filename, qualities)
+
+    assert (reads, nucleotides, qualities._qualities) == _expected_results(filename)
+
+
+@pytest.mark.parametrize("data", _INVALID_FILES)
+@pytest.mark.parametrize("block_size", (1, 7, 1024))
+def test_validate_file__invalid(tmp_path, monkeypatch, data, block_size):
+    monkeypatch.setattr(validate_fastq, "_BLOCK_SIZE", block_size)
+    filename = _write_file(tmp_path, data)
+
+    with pytest.raises(FASTQError) as expected:
+        _expected_results(filename)
+
+    with pytest.raises(FASTQError) as error:
+        validate_fastq.validate_file(filename, FASTQualities())
+
+    assert str(error.value) == str(expected.value)
+
+
+@pytest.mark.parametrize("compression", ("gz", "bz2"))
+def test_validate_file__compressed(tmp_path, compression):
+    filename = _write_file(tmp_path, _RECORDS, compression)
+
+    qualities = FASTQualities()
+    reads, nucleotides = validate_fastq.validate_file(filename, qualities)
+
+    assert (reads, nucleotides, qualities._qualities) == _expected_results(filename)
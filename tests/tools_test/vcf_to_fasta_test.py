@@ -0,0 +1,122 @@
+import random
+
+import pysam
+import pytest
+
+import paleomix.tools.vcf_to_fasta as vcf_to_fasta
+
+
+_HEADER = (
+    "##fileformat=VCFv4.1",
+    "##contig=<ID=chr1,length=40>",
+    "##contig=<ID=chr2,length=20>",
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1",
+)
+
+_RECORDS = (
+    # Non-variant site
+    ("chr1", 2, "A", ".", "PASS", "DP=10", "0"),
+    # Homozygous SNP
+    ("chr1", 3, "C", "T", "PASS", "DP=10", "20,10,0"),
+    # Heterozygous SNP
+    ("chr1", 4, "G", "A", ".", "DP=10", "10,0,20"),
+    # Filtered SNP
+    ("chr1", 5, "T", "C", "q:30", "DP=10", "20,10,0"),
+    # Homozygous deletion of 'CC'
+    ("chr1", 7, "ACC", "A", "PASS", "INDEL;DP=10", "20,10,0"),
+    # Homozygous insertion of 'GG'
+    ("chr1", 12, "T", "TGG", "PASS", "INDEL;DP=10", "20,10,0"),
+    # Insertion at the last position of an interval is discarded
+    ("chr1", 20, "G", "GAAA", "PASS", "INDEL;DP=10", "20,10,0"),
+    ("chr2", 1, "A", ".", "PASS", "DP=10", "0"),
+    ("chr2", 2, "C", "G", "PASS", "DP=10", "20,10,0"),
+)
+
+
+@pytest.fixture
+def genotype(tmp_path):
+    filename = str(tmp_path / "genotype.vcf")
+    with open(filename, "w") as handle:
+        for line in _HEADER:
+            print(line, file=handle)
+
+        for (contig, pos, ref, alt, filters, info, pl) in _RECORDS:
+            sample = "0/1:" + pl
+            fields = [contig, pos, ".", ref, alt, 30, filters, info, "GT:PL", sample]
+            print("\t".join(map(str, fields)), file=handle)
+
+    return pysam.tabix_index(filename, preset="vcf")
+
+
+def _write_bed(tmp_path, records):
+    filename = str(tmp_path / "intervals.bed")
+    with open(filename, "w") as handle:
+        for record in records:
+            print("\t".join(map(str, record)), file=handle)
+
+    return filename
+
+
+def _run(capsys, argv):
+    assert vcf_to_fasta.main(argv) == 0
+
+    return capsys.readouterr().out
+
+
+def test_vcf_to_fasta__regions(tmp_path, capsys, genotype):
+    bed = _write_bed(
+        tmp_path,
+        [
+            ("chr1", 0, 10, "gene1", 0, "+"),
+            ("chr1", 10, 20, "gene2", 0, "+"),
+            ("chr2", 0, 3, "gene3", 0, "-"),
+        ],
+    )
+
+    output = _run(capsys, ["--genotype", genotype, "--intervals", bed])
+
+    assert output == ">gene1\nNATRNNNN\n>gene2\nNNGGNNNNNNNN\n>gene3\nNCT\n"
+
+
+def test_vcf_to_fasta__ignore_indels(tmp_path, capsys, genotype):
+    bed = _write_bed(tmp_path, [("chr1", 0, 12, "gene1", 0, "+")])
+    argv = ["--genotype", genotype, "--intervals", bed, "--ignore-indels"]
+
+    assert _run(capsys, argv) == ">gene1\nNATRNNNNNNNN\n"
+
+
+def test_vcf_to_fasta__whole_genome(capsys, genotype):
+    output = _run(capsys, ["--genotype", genotype])
+
+    assert output == (
+        ">chr1\n"
+        "NATRNNNNNNGGNNNNNNNNAAANNNNNNNNNNNNNNNNNNNN\n"
+        ">chr2\n"
+        "AGNNNNNNNNNNNNNNNNNN\n"
+    )
+
+
+@pytest.mark.parametrize("threads", (2, 4))
+def test_vcf_to_fasta__threads(monkeypatch, tmp_path, capsys, genotype, threads):
+    # Split intervals into many small regions, to test ordering of the output
+    monkeypatch.setattr(vcf_to_fasta, "_SEQUENCE_CHUNK", 3)
+    monkeypatch.setattr(vcf_to_fasta, "_FASTA_COLUMNS", 7)
+
+    rng = random.Random(threads)
+    records = []
+    for idx in range(20):
+        contig, length = rng.choice((("chr1", 40), ("chr2", 20)))
+        start = rng.randint(0, length - 1)
+        end = rng.randint(start + 1, length)
+        strand = "-" if idx % 2 else "+"
+
+        records.append((contig, start, end, "gene%i" % (idx,), 0, strand))
+
+    argv = ["--genotype", genotype, "--intervals", _write_bed(tmp_path, records)]
+
+    expected = _run(capsys, argv)
+    assert _run(capsys, argv + ["--threads", str(threads)]) == expected
+
+
+def test_vcf_to_fasta__invalid_threads(capsys, genotype):
+    assert vcf_to_fasta.main(["--genotype", genotype, "--threads", "0"]) == 1
@@ -0,0 +1,114 @@
+import glob
+import io
+import os
+
+import pytest
+
+import paleomix
+import paleomix.pipelines.ngs.mkfile as ngs_mkfile
+import paleomix.pipelines.phylo.mkfile as phylo_mkfile
+import paleomix.yaml
+
+from paleomix.yaml import YAMLError
+
+
+_RESOURCES = os.path.join(os.path.dirname(paleomix.__file__), "resources")
+_EXAMPLE_MAKEFILES = sorted(
+    glob.glob(os.path.join(_RESOURCES, "**", "*.yaml"), recursive=True)
+)
+
+requires_c_parser = pytest.mark.skipif(
+    not paleomix.yaml.C_PARSER_AVAILABLE, reason="ruamel.yaml.clib not installed"
+)
+
+
+@pytest.fixture(params=(True, False), ids=("c_parser", "pure"))
+def c_parser(request, monkeypatch):
+    if request.param and not paleomix.yaml.C_PARSER_AVAILABLE:
+        pytest.skip("ruamel.yaml.clib not installed")
+
+    monkeypatch.setattr(paleomix.yaml, "C_PARSER_AVAILABLE", request.param)
+
+    return request.param
+
+
+def _error_message(stream):
+    with pytest.raises(YAMLError) as error:
+        paleomix.yaml.safe_load(stream)
+
+    return str(error.value)
+
+
+def test_example_makefiles_found():
+    assert len(_EXAMPLE_MAKEFILES) >= 3
+
+
+@requires_c_parser
+@pytest.mark.parametrize("filename", _EXAMPLE_MAKEFILES)
+def test_safe_load__example_makefiles(filename):
+    with open(filename) as handle:
+        expected = paleomix.yaml._safe_load(handle, pure=True)
+
+    with open(filename) as handle:
+        assert paleomix.yaml._safe_load(handle, pure=False) == expected
+
+    with open(filename) as handle:
+        assert paleomix.yaml.safe_load(handle) == expected
+
+
+@requires_c_parser
+@pytest.mark.parametrize(
+    "text",
+    (ngs_mkfile.build_makefile(), phylo_mkfile._TEMPLATE),
+    ids=("bam_pipeline", "phylo_pipeline"),
+)
+def test_safe_load__makefile_templates(text):
+    expected = paleomix.yaml._safe_load(text, pure=True)
+
+    assert paleomix.yaml._safe_load(text, pure=False) == expected
+    assert paleomix.yaml.safe_load(text) == expected
+
+
+def test_safe_load__yaml_1_1(c_parser):
+    text = "a: yes\nb: off\nc: 1e-4\nd: 012\ne: 1_000\nf: ~\n"
+
+    assert paleomix.yaml.safe_load(text) == {
+        "a": True,
+        "b": False,
+        "c": 1e-4,
+        "d": 10,
+        "e": 1000,
+        "f": None,
+    }
+
+
+def test_safe_load__bytes_stream(c_parser):
+    assert paleomix.yaml.safe_load(io.BytesIO(b"a: [1, 2]\n")) == {"a": [1, 2]}
+
+
+def test_safe_load__duplicate_keys(c_parser):
+    message = _error_message("a: 1\nb: 2\na: 3\n")
+
+    assert 'found duplicate key "a"' in message
+
+
+def test_safe_load__errors_reported_by_pure_parser(c_parser, monkeypatch, tmp_path):
+    filename = tmp_path / "makefile.yaml"
+    filename.write_text("a: 1\nb: [1, 2\n")
+
+    with filename.open() as handle:
+        message = _error_message(handle)
+
+    monkeypatch.setattr(paleomix.yaml, "C_PARSER_AVAILABLE", False)
+    with filename.open() as handle:
+        assert _error_message(handle) == message
+
+    assert str(filename) in message
+    assert "line 2" in message
+
+
+def test_safe_load__errors_in_unnamed_stream(c_parser, monkeypatch):
+    message = _error_message(io.StringIO("a: 1\na: 2\n"))
+
+    monkeypatch.setattr(paleomix.yaml, "C_PARSER_AVAILABLE", False)
+    assert _error_message(io.StringIO("a: 1\na: 2\n")) == message